@@ -1,30 +1,307 @@
-from flask import Blueprint, jsonify, request
-from city_map import RideService
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from flask import Blueprint, Response, g, jsonify, request
+from city_map import CityMap, RideService, DEFAULT_GRAPH_BACKEND
+from metrics import METRICS
+from solver_executor import SolverBusyError
 
 api_bp = Blueprint('api', __name__)
 
-# Initialize ride service
-ride_service = RideService()
+# The ride service is built on first use, so importing this module (spawning a worker) stays cheap.
+# RIDEX_GRAPH_BACKEND=cpp selects the graph_solver subprocess.
+# RIDEX_MAP=<file.map> serves a road network converted with `python map_io.py nodes.csv edges.csv file.map`.
+# RIDEX_SNAPSHOT=<file> restores a service saved with RideService.save_snapshot in one read; when the
+# file does not exist yet, the first worker builds the service and writes it for the others.
+# RIDEX_SOLVER_WORKERS / RIDEX_SOLVER_QUEUE size the search pool and its queue; requests beyond
+# the queue get 503 with Retry-After.
+_ride_service = None
+_ride_service_lock = threading.Lock()
+
+def _build_ride_service() -> RideService:
+    backend = os.environ.get('RIDEX_GRAPH_BACKEND', DEFAULT_GRAPH_BACKEND)
+    snapshot_path = os.environ.get('RIDEX_SNAPSHOT')
+    solver = {
+        'solver_workers': int(os.environ.get('RIDEX_SOLVER_WORKERS', 4)),
+        'solver_queue': int(os.environ.get('RIDEX_SOLVER_QUEUE', 64)),
+    }
+    if snapshot_path and os.path.exists(snapshot_path):
+        service = RideService.restore(snapshot_path, backend=backend, **solver)
+    else:
+        service = RideService(
+            backend=backend,
+            city_map=CityMap.load(os.environ['RIDEX_MAP']) if os.environ.get('RIDEX_MAP') else None,
+            **solver
+        )
+        if snapshot_path:
+            service.save_snapshot(snapshot_path)
+    # Multi-process deployments: RIDEX_SHARED_GRAPH=/dev/shm/ridex.graph maps one copy of the road graph into every worker
+    if os.environ.get('RIDEX_SHARED_GRAPH'):
+        service.attach_shared_graph(os.environ['RIDEX_SHARED_GRAPH'])
+    return service
+
+def get_ride_service() -> RideService:
+    """The process's RideService, built (or restored) by the first caller"""
+    global _ride_service
+    if _ride_service is None:
+        with _ride_service_lock:
+            if _ride_service is None:
+                with METRICS.timer('service.startup_ms'):
+                    _ride_service = _build_ride_service()
+    return _ride_service
+
+# RIDEX_PROFILE_INTERVAL=0.01 samples every thread's stack (see /api/metrics/profile)
+if os.environ.get('RIDEX_PROFILE_INTERVAL'):
+    METRICS.start_profiler(float(os.environ['RIDEX_PROFILE_INTERVAL']))
+
+@api_bp.before_request
+def start_request_timer():
+    if METRICS.enabled:
+        g.request_start = time.perf_counter()
+
+@api_bp.after_request
+def record_request_metrics(response):
+    """Latency per endpoint and response status counts"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        METRICS.observe(f'http.{request.endpoint}_ms', (time.perf_counter() - start) * 1000)
+        METRICS.count(f'http.status.{response.status_code}')
+    return response
+
+@api_bp.before_request
+def sync_shared_graph():
+    """Swap to a newer published road graph before handling the request"""
+    get_ride_service().sync_shared_graph()
+
+def _solver_busy_response(e):
+    """503 while the search queue is full; clients should back off and retry"""
+    response = jsonify({'success': False, 'error': str(e)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def _compressed_response(etag, gzipped):
+    """JSON body stored gzip-compressed: sent as is to gzip clients, 304 if the client has it"""
+    if 'gzip' in request.accept_encodings:
+        response = Response(gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(gzip.decompress(gzipped), mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True  # Clients revalidate, usually getting a 304
+    return response.make_conditional(request)
+
+# (graph version, etag, gzipped body) of the /city-map response
+_city_map_body = None
 
 @api_bp.route('/city-map', methods=['GET'])
 def get_city_map():
-    """Get city map information"""
+    """Get city map information (large maps: summary only, roads come from /tiles)"""
+    global _city_map_body
     try:
-        city_info = ride_service.get_city_map_info()
-        return jsonify({'success': True, 'data': city_info})
+        ride_service = get_ride_service()
+        version = ride_service.city_map.graph.version
+        cached = _city_map_body
+        if cached is None or cached[0] != version:
+            body = json.dumps({'success': True, 'data': ride_service.get_city_map_info()},
+                              separators=(',', ':')).encode()
+            cached = (version, hashlib.blake2b(body, digest_size=16).hexdigest(), gzip.compress(body, 6))
+            _city_map_body = cached
+        return _compressed_response(cached[1], cached[2])
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(z, x, y):
+    """Roads (and, when zoomed in, intersections) within one web-mercator tile"""
+    try:
+        etag, gzipped = get_ride_service().map_tiles.tile(z, x, y)
+        return _compressed_response(etag, gzipped)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _resolve_node(data, field):
+    """Node ID from `field`, or the node nearest to `<field>_coords` ([lon, lat])"""
+    coords = data.get(f'{field}_coords')
+    if data.get(field) is None and coords is not None:
+        node = get_ride_service().city_map.nearest_node(float(coords[0]), float(coords[1]))
+        if node is None:
+            raise ValueError(f'No road network node near {field} coordinates')
+        return node
+    return int(data.get(field))
+
+@api_bp.route('/nearest-node', methods=['GET'])
+def get_nearest_node():
+    """Snap a GPS coordinate to the nearest intersection"""
+    try:
+        lon = float(request.args['lon'])
+        lat = float(request.args['lat'])
+        city_map = get_ride_service().city_map
+        node = city_map.nearest_node(lon, lat)
+        if node is None:
+            return jsonify({'success': False, 'error': 'City map has no nodes'}), 404
+        return jsonify({
+            'success': True,
+            'data': {'node': node, 'coords': city_map.get_node_coordinates(node)}
+        })
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'lon and lat query parameters are required'}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @api_bp.route('/request-ride', methods=['POST'])
 def request_ride():
-    """Handle ride request"""
+    """Handle ride request (node IDs, or GPS via pickup_coords/dropoff_coords)"""
+    try:
+        data = request.get_json()
+        pickup = _resolve_node(data, 'pickup')
+        dropoff = _resolve_node(data, 'dropoff')
+        
+        result = get_ride_service().request_ride(pickup, dropoff, data.get('car_type'))
+        with METRICS.timer('ride.json_ms'):
+            return jsonify(result)
+    except SolverBusyError as e:
+        return _solver_busy_response(e)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+MAX_BATCH_SIZE = 1000
+
+@api_bp.route('/request-rides', methods=['POST'])
+def request_rides():
+    """Handle a batch of ride requests: {"requests": [{"pickup": .., "dropoff": ..}, ...]}"""
     try:
         data = request.get_json()
-        pickup = int(data.get('pickup'))
-        dropoff = int(data.get('dropoff'))
+        entries = data.get('requests') or []
+        if len(entries) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'error': f'At most {MAX_BATCH_SIZE} requests per batch'}), 400
         
-        result = ride_service.request_ride(pickup, dropoff)
-        return jsonify(result)
+        # Entries that cannot be parsed get an error in place; the rest are solved together
+        results = [None] * len(entries)
+        ride_requests = []
+        positions = []
+        for i, entry in enumerate(entries):
+            try:
+                ride_requests.append((_resolve_node(entry, 'pickup'), _resolve_node(entry, 'dropoff')))
+                positions.append(i)
+            except (TypeError, ValueError) as e:
+                results[i] = {'success': False, 'error': f'Invalid request: {e}'}
+        
+        for i, result in zip(positions, get_ride_service().request_rides(ride_requests)):
+            results[i] = result
+        return jsonify({'success': True, 'data': results})
+    except SolverBusyError as e:
+        return _solver_busy_response(e)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/dispatch', methods=['POST'])
+def dispatch_rides():
+    """Match a batch of ride requests to distinct drivers at minimum total pickup distance"""
+    try:
+        data = request.get_json()
+        entries = data.get('requests') or []
+        if len(entries) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'error': f'At most {MAX_BATCH_SIZE} requests per batch'}), 400
+        ride_requests = [(_resolve_node(entry, 'pickup'), _resolve_node(entry, 'dropoff')) for entry in entries]
+        return jsonify({'success': True, 'data': get_ride_service().dispatch_rides(ride_requests)})
+    except SolverBusyError as e:
+        return _solver_busy_response(e)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/dispatch-ride', methods=['POST'])
+def dispatch_ride():
+    """Queue one ride request for the next dispatch window and wait for its assignment"""
+    try:
+        data = request.get_json()
+        pickup = _resolve_node(data, 'pickup')
+        dropoff = _resolve_node(data, 'dropoff')
+        future = get_ride_service().dispatch_window.submit(pickup, dropoff)
+        return jsonify(future.result(timeout=30))
+    except SolverBusyError as e:
+        return _solver_busy_response(e)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/book-ride', methods=['POST'])
+def book_ride():
+    """Reserve a driver offered by /request-ride; 409 if another rider booked them first"""
+    try:
+        data = request.get_json()
+        pickup = _resolve_node(data, 'pickup')
+        dropoff = _resolve_node(data, 'dropoff')
+        result = get_ride_service().book_ride(int(data.get('driver_id')), pickup, dropoff)
+        return jsonify(result), (200 if result['success'] else 409)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/complete-ride', methods=['POST'])
+def complete_ride():
+    """Release a dispatched driver at the dropoff node"""
+    try:
+        data = request.get_json()
+        if not get_ride_service().complete_ride(int(data.get('driver_id')), int(data.get('dropoff'))):
+            return jsonify({'success': False, 'error': 'Unknown driver'}), 404
+        return jsonify({'success': True})
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# algorithm -> (graph version, MST result, ETag, serialized body)
+_mst_bodies = {}
+
+def _mst_response(algorithm, compute):
+    """Serve a cached MST body for the current graph version, or 304 if the client has it"""
+    version = get_ride_service().city_map.graph.version
+    cached = _mst_bodies.get(algorithm)
+    if cached is None or cached[0] != version:
+        mst = compute()
+        if cached is not None and cached[1] is mst:
+            # Graph changed but the tree survived (e.g. traffic on non-tree roads)
+            cached = (version,) + cached[1:]
+        else:
+            body = json.dumps({'success': True, 'data': mst}, separators=(',', ':')).encode()
+            # Content-based so every worker serving the same tree hands out the same tag
+            etag = f"{algorithm}-{hashlib.blake2b(body, digest_size=16).hexdigest()}"
+            cached = (version, mst, etag, body)
+        _mst_bodies[algorithm] = cached
+    _, _, etag, body = cached
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True  # Clients revalidate, usually getting a 304
+    return response.make_conditional(request)
+
+MAX_TRAFFIC_UPDATES = 100000
+
+@api_bp.route('/traffic', methods=['POST'])
+def update_traffic():
+    """Traffic tick: {"updates": [{"u": .., "v": .., "factor": 1.5} or {"u": .., "v": .., "closed": true}, ...]}"""
+    try:
+        updates = request.get_json()['updates']
+        if len(updates) > MAX_TRAFFIC_UPDATES:
+            return jsonify({'success': False, 'error': f'At most {MAX_TRAFFIC_UPDATES} updates per call'}), 400
+        parsed = [
+            (int(update['u']), int(update['v']), None if update.get('closed') else float(update['factor']))
+            for update in updates
+        ]
+        ride_service = get_ride_service()
+        changed = ride_service.update_traffic(parsed)
+        return jsonify({'success': True, 'data': {'changed': changed, 'version': ride_service.city_map.graph.version}})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -32,8 +309,7 @@ def request_ride():
 def get_mst_prim():
     """Get MST using Prim's algorithm"""
     try:
-        mst = ride_service.get_mst_prim()
-        return jsonify({'success': True, 'data': mst})
+        return _mst_response('prim', get_ride_service().get_mst_prim)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -41,41 +317,127 @@ def get_mst_prim():
 def get_mst_kruskal():
     """Get MST using Kruskal's algorithm"""
     try:
-        mst = ride_service.get_mst_kruskal()
-        return jsonify({'success': True, 'data': mst})
+        return _mst_response('kruskal', get_ride_service().get_mst_kruskal)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _driver_info(driver):
+    return {
+        'id': driver.driver_id,
+        'name': driver.name,
+        'car_type': driver.car_type,
+        'location': driver.current_location,
+        'location_coords': get_ride_service().city_map.get_node_coordinates(driver.current_location),
+        'available': driver.available
+    }
+
 @api_bp.route('/drivers', methods=['GET'])
 def get_drivers():
-    """Get all drivers information"""
-    try:
-        drivers = [
-            {
-                'id': driver.driver_id,
-                'name': driver.name,
-                'location': driver.current_location,
-                'location_coords': ride_service.city_map.get_node_coordinates(driver.current_location),
-                'available': driver.available
-            }
-            for driver in ride_service.driver_manager.drivers
-        ]
-        return jsonify({'success': True, 'data': drivers})
+    """Get drivers information (optional filters: ?available=true&car_type=..&node=..)"""
+    try:
+        manager = get_ride_service().driver_manager
+        available = request.args.get('available')
+        car_type = request.args.get('car_type')
+        node = request.args.get('node', type=int)
+        if node is not None:
+            drivers = manager.drivers_at(node, available_only=available == 'true')
+        elif available == 'true':
+            drivers = manager.available_drivers(car_type)
+        else:
+            drivers = manager.drivers
+        if available == 'false':
+            drivers = [driver for driver in drivers if not driver.available]
+        if car_type is not None:
+            drivers = [driver for driver in drivers if driver.car_type == car_type]
+        return jsonify({'success': True, 'data': [_driver_info(driver) for driver in drivers]})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/drivers/stream', methods=['GET'])
+def stream_drivers():
+    """
+    Server-sent events: a snapshot of driver positions, then only the changes, once per tick
+    (optional ?bbox=min_lon,min_lat,max_lon,max_lat limits both to a viewport)
+    Each open stream holds one server thread until the client disconnects.
+    """
+    try:
+        bbox = request.args.get('bbox')
+        if bbox is not None:
+            bbox = tuple(float(value) for value in bbox.split(','))
+            if len(bbox) != 4:
+                raise ValueError('bbox needs min_lon,min_lat,max_lon,max_lat')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
+    return Response(get_ride_service().driver_feed.stream(bbox), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+MAX_DRIVER_UPDATES = 10000
+
+@api_bp.route('/drivers/updates', methods=['POST'])
+def update_drivers():
+    """Bulk driver updates: {"updates": [{"id": .., "location" | "location_coords": .., "available": ..}, ...]}"""
+    try:
+        updates = request.get_json()['updates']
+        if len(updates) > MAX_DRIVER_UPDATES:
+            return jsonify({'success': False, 'error': f'At most {MAX_DRIVER_UPDATES} updates per call'}), 400
+        ride_service = get_ride_service()
+        parsed = []
+        for update in updates:
+            location = None
+            if 'location' in update or 'location_coords' in update:
+                location = _resolve_node(update, 'location')
+                if location not in ride_service.city_map.graph.nodes:
+                    raise ValueError(f'Unknown node {location}')
+            available = update.get('available')
+            if available is not None and not isinstance(available, bool):
+                raise ValueError(f"'available' must be true or false, got {available!r}")
+            parsed.append((int(update['id']), location, available))
+        unknown = ride_service.driver_manager.update_drivers(parsed)
+        return jsonify({'success': True, 'data': {'applied': len(parsed) - len(unknown), 'unknown_ids': unknown}})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @api_bp.route('/workflow', methods=['GET'])
 def get_workflow():
-    """Get ride workflow schedule"""
+    """Get ride workflow schedule (?name=<registered workflow>, the default workflow without it)"""
     try:
-        from city_map import RIDE_WORKFLOW_DEPENDENCIES
-        workflow = ride_service.graph_algorithms.topological_sort(RIDE_WORKFLOW_DEPENDENCIES)
+        name = request.args.get('name')
+        workflows = get_ride_service().workflows
+        if name is not None and name not in workflows:
+            return jsonify({'success': False, 'error': f'Unknown workflow: {name}'}), 404
         return jsonify({
             'success': True,
             'data': {
-                'workflow': workflow,
-                'dependencies': RIDE_WORKFLOW_DEPENDENCIES
+                'workflow': list(workflows.plan(name)),
+                'dependencies': workflows.dependencies(name),
+                'available_workflows': workflows.names()
             }
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Counters, latency histograms (ms) and route cache statistics"""
+    try:
+        ride_service = get_ride_service()
+        cache = ride_service.route_cache.stats()
+        lookups = cache['hits'] + cache['misses']
+        cache['hit_rate'] = round(cache['hits'] / lookups, 4) if lookups else 0.0
+        data = METRICS.snapshot()
+        data['backend'] = ride_service.backend
+        data['route_cache'] = cache
+        if ride_service.solver_executor is not None:
+            data['solver_executor'] = ride_service.solver_executor.stats()
+        return jsonify({'success': True, 'data': data})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/metrics/profile', methods=['GET'])
+def get_profile():
+    """Sampled stacks in collapsed format (feed to flamegraph.pl or speedscope)"""
+    if METRICS.profiler is None:
+        return jsonify({'success': False, 'error': 'Profiler not running (set RIDEX_PROFILE_INTERVAL)'}), 404
+    return Response(METRICS.profiler.collapsed(), mimetype='text/plain')
@@ -0,0 +1,194 @@
+"""
+Benchmark suite for RideX
+
+Times every graph backend operation, find_nearby_drivers and end-to-end
+request_ride on synthetic cities, and writes p50/p95/p99 latency and
+throughput per backend to a JSON file. Passing --baseline compares against an
+earlier run and exits non-zero on regressions.
+
+    python benchmark.py --sizes 1000 10000 --output bench.json
+    python benchmark.py --baseline bench.json --output bench-new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import List, Dict, Callable, Optional
+
+from city_map import GraphAlgorithms, RideService, GRAPH_BACKENDS, RIDE_WORKFLOW_DEPENDENCIES
+from synthetic_city import grid_city, random_geometric_city, add_drivers
+
+TOPOLOGIES = {
+    'grid': grid_city,
+    'geometric': random_geometric_city,
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+def measure(operation: Callable[[int], object], count: int) -> Dict[str, float]:
+    """Run operation(i) count times; latency percentiles in ms and throughput in ops/s"""
+    operation(0)  # Warm-up: solver start, snapshot upload and lazy indexes stay out of the numbers
+    latencies = []
+    start = time.perf_counter()
+    for i in range(count):
+        t0 = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'count': count,
+        'mean_ms': round(total / count * 1000, 4),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 4),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 4),
+        'throughput_per_s': round(count / total, 2) if total > 0 else 0.0,
+    }
+
+
+def bench_backend(service: RideService, queries: int, tree_queries: int, seed: int) -> Dict[str, Dict]:
+    """All timed operations for one RideService (and its graph backend)"""
+    rng = random.Random(seed)
+    algorithms = service.graph_algorithms
+    city = service.city_map
+    graph = city.graph
+    nodes = sorted(graph.nodes)
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(queries)]
+    target_sets = [[rng.choice(nodes) for _ in range(20)] for _ in range(queries)]
+    graph.snapshot()  # Build outside the timings
+
+    return {
+        'dijkstra': measure(lambda i: algorithms.dijkstra(graph, *pairs[i]), queries),
+        'astar': measure(lambda i: algorithms.astar(graph, *pairs[i], city._distance), queries),
+        'bidirectional_astar': measure(
+            lambda i: algorithms.bidirectional_astar(graph, *pairs[i], city._distance), queries),
+        'dijkstra_one_to_many': measure(
+            lambda i: algorithms.dijkstra_one_to_many(graph, pairs[i][0], target_sets[i], 5), queries),
+        'prim_mst': measure(lambda i: algorithms.prim_mst(graph), tree_queries),
+        'kruskal_mst': measure(lambda i: algorithms.kruskal_mst(graph), tree_queries),
+        'topological_sort': measure(lambda i: algorithms.topological_sort(RIDE_WORKFLOW_DEPENDENCIES), queries),
+        'find_nearby_drivers': measure(
+            lambda i: service.driver_manager.find_nearby_drivers(pairs[i][0], limit=3), queries),
+        'request_ride': measure(lambda i: service.request_ride(*pairs[i]), queries),
+    }
+
+
+def run(topologies: List[str], sizes: List[int], backends: List[str], drivers: int,
+        queries: int, tree_queries: int, seed: int, route_cache: bool) -> List[Dict]:
+    results = []
+    for topology in topologies:
+        for size in sizes:
+            t0 = time.perf_counter()
+            city = TOPOLOGIES[topology](size, seed=seed)
+            build_s = time.perf_counter() - t0
+            edges = len(city.graph.snapshot().edges)
+            print(f"{topology} {len(city.graph.nodes)} nodes / {edges} edges (built in {build_s:.1f}s)")
+            for backend in backends:
+                # route_cache_size=0 times the routing itself rather than cache hits; only the
+                # synthetic drivers are placed (the demo fleet only fits the sample map)
+                service = RideService(backend=backend, city_map=city, initialize_drivers=False,
+                                      route_cache_size=10000 if route_cache else 0)
+                try:
+                    add_drivers(service, drivers, seed=seed)
+                    timings = bench_backend(service, queries, tree_queries, seed)
+                finally:
+                    service.close()
+                for operation, stats in timings.items():
+                    print(f"  {backend:<10} {operation:<22} p50 {stats['p50_ms']:>9.3f} ms"
+                          f"  p99 {stats['p99_ms']:>9.3f} ms  {stats['throughput_per_s']:>9.1f}/s")
+                    results.append(dict({
+                        'topology': topology,
+                        'nodes': len(city.graph.nodes),
+                        'edges': edges,
+                        'drivers': len(service.driver_manager.drivers),
+                        'backend': backend,
+                        'operation': operation,
+                    }, **stats))
+    return results
+
+
+def environment() -> Dict[str, str]:
+    """Where the numbers came from, so runs can be compared meaningfully"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Operations whose p50 got slower than baseline by more than tolerance (fraction)"""
+    def key(result):
+        return (result['topology'], result['nodes'], result['backend'], result['operation'])
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None or old['p50_ms'] <= 0:
+            continue
+        change = result['p50_ms'] / old['p50_ms'] - 1
+        if change > tolerance:
+            regressions.append(f"{'/'.join(map(str, key(result)))}: p50 {old['p50_ms']} -> "
+                               f"{result['p50_ms']} ms (+{change:.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="RideX benchmark suite")
+    parser.add_argument('--topologies', nargs='+', choices=sorted(TOPOLOGIES), default=['grid', 'geometric'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000])
+    parser.add_argument('--backends', nargs='+', choices=sorted(GRAPH_BACKENDS), default=None,
+                        help="default: every backend whose requirements are present")
+    parser.add_argument('--drivers', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--tree-queries', type=int, default=5, help="repetitions of the MST operations")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--route-cache', action='store_true', help="keep the route cache enabled")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="earlier results file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed p50 slowdown (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    backends = args.backends
+    if backends is None:
+        backends = ['inprocess']
+        if os.path.exists(GraphAlgorithms._solver_path()):
+            backends += ['cpp', 'cpp-server']
+        else:
+            print("graph_solver not built; benchmarking the in-process backend only")
+
+    results = run(args.topologies, args.sizes, backends, args.drivers,
+                  args.queries, args.tree_queries, args.seed, args.route_cache)
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,35 @@
 """
 City Map and Driver Management for RideX
 """
+import gc
+import logging
+import pickle
 import subprocess
-import math
 import os
 import sys
 import random
-from typing import List, Dict, Tuple, Set, Optional
+import threading
+from collections import Counter, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Set, AbstractSet, Mapping, Optional
+
+from graph_engine import INF, CSRGraph, InProcessGraphAlgorithms, IndexedGraphAlgorithms
+from solver_pool import SolverPool, get_pool, solver_modes
+from route_cache import RouteCache
+from contraction import ContractionHierarchy
+from spatial_index import GridIndex, haversine_km
+from dispatch import DispatchWindow, solve_assignment
+from distance_matrix import SharedDistanceMatrix
+from region_shards import RegionShards
+from solver_executor import SolverExecutor
+from workflow import WorkflowRegistry, DEFAULT_WORKFLOW
+from shared_graph import SharedGraph
+from driver_feed import DriverFeed
+from map_tiles import MapTiles, MAX_ZOOM
+from map_io import read_csv, save_map, load_map
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
 
 # Ride workflow dependencies
 RIDE_WORKFLOW_DEPENDENCIES = {
@@ -19,24 +42,176 @@ RIDE_WORKFLOW_DEPENDENCIES = {
 }
 
 
+# (u, v, old weight, new weight) for one road; INF stands for "no road"
+EdgeChange = Tuple[int, int, float, float]
+
+
 class Graph:
     """Weighted graph representation using adjacency list"""
     
+    CHANGE_LOG_SIZE = 256  # Versions for which changes_since() can still describe the edits
+    
     def __init__(self):
-        self.adjacency_list: Dict[int, List[Tuple[int, float]]] = {}
-        self.nodes: Set[int] = set()
+        self._adjacency_list: Optional[Dict[int, List[Tuple[int, float]]]] = {}
+        self.nodes: AbstractSet[int] = set()  # Read-only view of an attached snapshot until edited
+        # Bumped on every change; derived data (snapshots, caches) is keyed by it.
+        # Code that edits adjacency_list directly must call touch().
+        self.version = 0
+        self._snapshot: Optional[CSRGraph] = None
+        # Writers and snapshot builds are serialized; readers work on immutable snapshots
+        self._lock = threading.RLock()
+        # (version, changes or None when unknown) per bump, for incremental invalidation
+        self._change_log: deque = deque(maxlen=self.CHANGE_LOG_SIZE)
+    
+    @property
+    def adjacency_list(self) -> Dict[int, List[Tuple[int, float]]]:
+        """Adjacency dict; built from the snapshot on first use after attach()"""
+        if self._adjacency_list is None:
+            with self._lock:
+                if self._adjacency_list is None:
+                    csr = self._snapshot
+                    nodes = csr.nodes
+                    self._adjacency_list = {
+                        nodes[u]: [(nodes[csr.targets[i]], csr.weights[i]) for i in range(csr.offsets[u], csr.offsets[u + 1])]
+                        for u in range(len(csr))
+                    }
+        return self._adjacency_list
+    
+    def attach(self, csr: CSRGraph):
+        """
+        Replace the graph's content with an existing snapshot (e.g. one mapped from shared
+        memory) without copying it; the adjacency dict is only rebuilt if something edits
+        or walks it.
+        """
+        with self._lock:
+            self.nodes = csr.node_to_idx.keys()
+            self._adjacency_list = None
+            self.touch()
+            csr.version = self.version
+            self._snapshot = csr
+    
+    def __getstate__(self) -> Dict:
+        # Saved as its current snapshot; the adjacency dict is rebuilt only if needed
+        with self._lock:
+            nodes = self.nodes if isinstance(self.nodes, set) else None  # Views are rebuilt from the snapshot
+            return {'nodes': nodes, 'version': self.version, 'snapshot': self.snapshot()}
+    
+    def __setstate__(self, state: Dict):
+        self.__init__()
+        self.version = state['version']
+        self._snapshot = state['snapshot']
+        self.nodes = state['snapshot'].node_to_idx.keys() if state['nodes'] is None else state['nodes']
+        self._adjacency_list = None
     
     def add_edge(self, u: int, v: int, weight: float):
         """Add weighted edge between nodes u and v"""
-        if u not in self.adjacency_list:
-            self.adjacency_list[u] = []
-        if v not in self.adjacency_list:
-            self.adjacency_list[v] = []
-        
-        self.adjacency_list[u].append((v, weight))
-        self.adjacency_list[v].append((u, weight))
-        self.nodes.add(u)
-        self.nodes.add(v)
+        with self._lock:
+            if u not in self.adjacency_list:
+                self.adjacency_list[u] = []
+            if v not in self.adjacency_list:
+                self.adjacency_list[v] = []
+            
+            old = self.edge_weight(u, v)
+            self.adjacency_list[u].append((v, weight))
+            self.adjacency_list[v].append((u, weight))
+            self._add_nodes(u, v)
+            self.touch([(u, v, old, min(old, weight))])
+    
+    def _add_nodes(self, *nodes: int):
+        if not isinstance(self.nodes, set):
+            if all(node in self.nodes for node in nodes):
+                return
+            self.nodes = set(self.nodes)  # First new node since attach(): take a private copy
+        self.nodes.update(nodes)
+    
+    def edge_weight(self, u: int, v: int) -> float:
+        """Weight of the shortest u-v road, INF if there is none"""
+        if self._adjacency_list is None:
+            return self._snapshot.edge_weight(u, v)
+        return min((weight for x, weight in self._adjacency_list.get(u, ()) if x == v), default=INF)
+    
+    def update_edges(self, updates: List[Tuple[int, int, Optional[float]]]) -> List[EdgeChange]:
+        """
+        Set the weight of many roads at once (e.g. a traffic tick) under one version bump
+        Each update is (u, v, weight): the u-v road gets that weight (added if missing),
+        or is closed when weight is None. Reweights patch the current snapshot instead of
+        rebuilding it; an attached graph keeps its adjacency dict unbuilt until a road
+        is added or closed. Returns the changes actually made.
+        """
+        with self._lock:
+            snapshot_only = self._adjacency_list is None and all(
+                weight is not None and self.edge_weight(u, v) != INF for u, v, weight in updates
+            )
+            adjacency = None if snapshot_only else self.adjacency_list
+            changes = []
+            topology_changed = False
+            for u, v, weight in updates:
+                if u == v:
+                    continue
+                old = self.edge_weight(u, v)
+                new = INF if weight is None else weight
+                if old == new:
+                    continue
+                if snapshot_only:
+                    pass  # Applied to the snapshot below
+                elif weight is None:
+                    adjacency[u] = [(x, w) for x, w in adjacency[u] if x != v]
+                    adjacency[v] = [(x, w) for x, w in adjacency[v] if x != u]
+                    topology_changed = True
+                elif old == INF:
+                    adjacency.setdefault(u, []).append((v, weight))
+                    adjacency.setdefault(v, []).append((u, weight))
+                    self._add_nodes(u, v)
+                    topology_changed = True
+                else:
+                    adjacency[u] = [(x, weight if x == v else w) for x, w in adjacency[u]]
+                    adjacency[v] = [(x, weight if x == u else w) for x, w in adjacency[v]]
+                changes.append((u, v, old, new))
+            if not changes:
+                return changes
+            
+            snapshot = self._snapshot
+            reusable = not topology_changed and snapshot is not None and snapshot.version == self.version
+            self.touch(changes)
+            if reusable:
+                self._snapshot = snapshot.reweighted([(u, v, new) for u, v, _, new in changes], self.version)
+            return changes
+    
+    def touch(self, changes: Optional[List[EdgeChange]] = None):
+        """
+        Mark the graph as changed so cached snapshots are rebuilt
+        changes describes the edit for incremental invalidation; None means "unknown".
+        """
+        with self._lock:
+            self.version += 1
+            self._change_log.append((self.version, changes))
+    
+    def changes_since(self, version: int) -> Optional[List[EdgeChange]]:
+        """Road changes made after version, or None if they are unknown or no longer logged"""
+        with self._lock:
+            if version == self.version:
+                return []
+            changes = []
+            expected = version + 1
+            for logged_version, logged in self._change_log:
+                if logged_version <= version:
+                    continue
+                if logged_version != expected or logged is None:
+                    return None
+                changes.extend(logged)
+                expected += 1
+            return changes if expected == self.version + 1 else None
+    
+    def snapshot(self) -> CSRGraph:
+        """Compact CSR view plus index maps and solver input, reused until the graph changes"""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != self.version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != self.version:
+                    snapshot = CSRGraph.from_graph(self)
+                    self._snapshot = snapshot
+        return snapshot
     
     def get_neighbors(self, node: int) -> List[Tuple[int, float]]:
         """Get all neighbors of a node with weights"""
@@ -47,38 +222,50 @@ class GraphAlgorithms:
     """Collection of graph algorithms for RideX using C++ backend"""
     
     @staticmethod
-    def _run_cpp_solver(input_str: str, algo: str, args: List[str] = []) -> List[str]:
-        """Execute the C++ graph solver"""
-        import math
+    def _solver_path() -> str:
+        """Path of the compiled graph_solver next to this module"""
         current_dir = os.path.dirname(os.path.abspath(__file__))
         exe_path = os.path.join(current_dir, 'graph_solver')
         if os.name == 'nt':
             exe_path += '.exe'
-        
-        cmd = [exe_path, algo] + args
+        return exe_path
+    
+    @classmethod
+    def _run_cpp_solver(cls, input_str: str, algo: str, args: List[str] = [], extra_input: str = "") -> List[str]:
+        """Execute the C++ graph solver"""
+        cmd = [cls._solver_path(), algo] + args
         
         try:
-            process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            stdout, stderr = process.communicate(input=input_str)
+            with METRICS.timer(f'solver.cpp.{algo}_ms'):
+                with METRICS.timer('solver.spawn_ms'):
+                    process = subprocess.Popen(
+                        cmd,
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        text=True
+                    )
+                stdout, stderr = process.communicate(input=input_str + extra_input)
             
             if process.returncode != 0:
-                print(f"Error running C++ solver ({algo}): {stderr}")
+                METRICS.count('solver.errors')
+                logger.error("Error running C++ solver (%s): %s", algo, stderr)
                 return []
                 
             return stdout.strip().split('\n')
         except Exception as e:
-            print(f"Exception running C++ solver: {e}")
+            METRICS.count('solver.errors')
+            logger.exception("Exception running C++ solver: %s", e)
             return []
 
     @staticmethod
-    def _serialize_graph(graph: Graph, directed: bool = False) -> str:
+    def _serialize_graph(graph: Graph, directed: bool = False) -> Tuple[str, List[int]]:
         """Serialize graph for C++ input: N M \n u v w ..."""
+        if not directed:
+            # Cached on the graph until it changes
+            snapshot = graph.snapshot()
+            return snapshot.solver_input, snapshot.nodes
+        
         nodes = sorted(list(graph.nodes))
         node_to_idx = {node: i for i, node in enumerate(nodes)}
         
@@ -93,28 +280,23 @@ class GraphAlgorithms:
                 else:
                     edges.append((node_to_idx[u], node_to_idx[v], weight))
                     
-        N = len(nodes)
-        M = len(edges)
-        
-        input_str = f"{N} {M}\n"
-        for u, v, w in edges:
-            input_str += f"{u} {v} {w}\n"
-            
-        return input_str, nodes
+        lines = [f"{len(nodes)} {len(edges)}\n"]
+        lines.extend(f"{u} {v} {w}\n" for u, v, w in edges)
+        return "".join(lines), nodes
 
-    @staticmethod
-    def dijkstra(graph: Graph, start: int, end: int) -> Tuple[List[int], float]:
+    @classmethod
+    def dijkstra(cls, graph: Graph, start: int, end: int) -> Tuple[List[int], float]:
         """Dijkstra's algorithm using C++"""
         if start not in graph.nodes or end not in graph.nodes:
             return [], float('inf')
             
-        input_str, nodes = GraphAlgorithms._serialize_graph(graph)
-        node_to_idx = {node: i for i, node in enumerate(nodes)}
+        snapshot = graph.snapshot()
+        nodes = snapshot.nodes
         
-        start_idx = str(node_to_idx[start])
-        end_idx = str(node_to_idx[end])
+        start_idx = str(snapshot.node_to_idx[start])
+        end_idx = str(snapshot.node_to_idx[end])
         
-        output_lines = GraphAlgorithms._run_cpp_solver(input_str, "dijkstra", [start_idx, end_idx])
+        output_lines = cls._run_cpp_solver(snapshot.solver_input, "dijkstra", [start_idx, end_idx])
         
         if not output_lines or len(output_lines) < 2:
             return [], float('inf')
@@ -127,11 +309,61 @@ class GraphAlgorithms:
         except ValueError:
             return [], float('inf')
 
-    @staticmethod
-    def prim_mst(graph: Graph) -> List[Tuple[int, int, float]]:
+    @classmethod
+    def astar(cls, graph: Graph, start: int, end: int, heuristic) -> Tuple[List[int], float]:
+        """The solver has no node coordinates, so A* requests run plain Dijkstra"""
+        return cls.dijkstra(graph, start, end)
+    
+    @classmethod
+    def bidirectional_astar(cls, graph: Graph, start: int, end: int, heuristic) -> Tuple[List[int], float]:
+        """The solver has no node coordinates, so A* requests run plain Dijkstra"""
+        return cls.dijkstra(graph, start, end)
+
+    @classmethod
+    def dijkstra_one_to_many(cls, graph: Graph, start: int, targets: List[int],
+                             limit: Optional[int] = None) -> Dict[int, Tuple[List[int], float]]:
+        """One-to-many Dijkstra using C++ (see InProcessGraphAlgorithms.dijkstra_one_to_many)"""
+        if start not in graph.nodes:
+            return {}
+        targets = [t for t in targets if t in graph.nodes]
+        if not targets:
+            return {}
+
+        snapshot = graph.snapshot()
+        input_str, nodes, node_to_idx = snapshot.solver_input, snapshot.nodes, snapshot.node_to_idx
+        target_line = f"{len(targets)} " + " ".join(str(node_to_idx[t]) for t in targets) + "\n"
+
+        output_lines = []
+        if 'sssp' in solver_modes(cls._solver_path()):
+            output_lines = cls._run_cpp_solver(
+                input_str, "sssp", [str(node_to_idx[start]), str(limit or 0)], extra_input=target_line
+            )
+        if not output_lines:
+            # Solver builds without the sssp mode: fall back to one search per target
+            results = {}
+            for target in sorted(set(targets)):
+                path, distance = cls.dijkstra(graph, target, start)
+                if path:
+                    results[target] = (path[::-1], distance)
+            return dict(sorted(results.items(), key=lambda item: item[1][1]))
+
+        results = {}
+        for line in output_lines:
+            parts = line.split()
+            if len(parts) < 3:
+                continue
+            try:
+                target = nodes[int(parts[0])]
+                results[target] = ([nodes[int(i)] for i in parts[2:]], float(parts[1]))
+            except (ValueError, IndexError):
+                continue
+        return results
+
+    @classmethod
+    def prim_mst(cls, graph: Graph) -> List[Tuple[int, int, float]]:
         """Prim's algorithm using C++"""
-        input_str, nodes = GraphAlgorithms._serialize_graph(graph)
-        output_lines = GraphAlgorithms._run_cpp_solver(input_str, "prim")
+        input_str, nodes = cls._serialize_graph(graph)
+        output_lines = cls._run_cpp_solver(input_str, "prim")
         
         mst_edges = []
         for line in output_lines:
@@ -142,11 +374,11 @@ class GraphAlgorithms:
                 mst_edges.append((nodes[u_idx], nodes[v_idx], w))
         return mst_edges
 
-    @staticmethod
-    def kruskal_mst(graph: Graph) -> List[Tuple[int, int, float]]:
+    @classmethod
+    def kruskal_mst(cls, graph: Graph) -> List[Tuple[int, int, float]]:
         """Kruskal's algorithm using C++"""
-        input_str, nodes = GraphAlgorithms._serialize_graph(graph)
-        output_lines = GraphAlgorithms._run_cpp_solver(input_str, "kruskal")
+        input_str, nodes = cls._serialize_graph(graph)
+        output_lines = cls._run_cpp_solver(input_str, "kruskal")
         
         mst_edges = []
         for line in output_lines:
@@ -157,8 +389,8 @@ class GraphAlgorithms:
                 mst_edges.append((nodes[u_idx], nodes[v_idx], w))
         return mst_edges
 
-    @staticmethod
-    def topological_sort(dependencies: Dict[str, List[str]]) -> List[str]:
+    @classmethod
+    def topological_sort(cls, dependencies: Dict[str, List[str]]) -> List[str]:
         """Topological sort using C++"""
         # Map tasks to integers
         tasks = sorted(list(dependencies.keys()))
@@ -172,12 +404,9 @@ class GraphAlgorithms:
                     # prereq -> task
                     edges.append((task_to_idx[prereq], task_to_idx[task], 1.0))
         
-        M = len(edges)
-        input_str = f"{N} {M}\n"
-        for u, v, w in edges:
-            input_str += f"{u} {v} {w}\n"
-            
-        output_lines = GraphAlgorithms._run_cpp_solver(input_str, "topo")
+        lines = [f"{N} {len(edges)}\n"]
+        lines.extend(f"{u} {v} {w}\n" for u, v, w in edges)
+        output_lines = cls._run_cpp_solver("".join(lines), "topo")
         
         if not output_lines or output_lines[0] == "CYCLE":
             return []
@@ -187,16 +416,149 @@ class GraphAlgorithms:
             return [tasks[i] for i in result_indices]
         except ValueError:
             return []
+
+
+class PersistentGraphAlgorithms(GraphAlgorithms):
+    """C++ backend served by a pool of long-lived `graph_solver serve` workers"""
+    
+    POOL_SIZE = 2
+    
+    @classmethod
+    def _pool(cls) -> SolverPool:
+        return get_pool(cls._solver_path(), cls.POOL_SIZE)
+    
+    @classmethod
+    def _run_queries(cls, input_str: str, queries: List[str], directed: bool = False) -> List[List[str]]:
+        """Run queries on a worker; workers only reload when the graph input changes"""
+        METRICS.count('solver.queries', len(queries))
+        try:
+            with METRICS.timer('solver.batch_ms'):
+                outputs = cls._pool().run_batch(input_str, queries, directed)
+        except Exception as e:
+            logger.exception("Exception running C++ solver worker: %s", e)
+            outputs = None
+        if outputs is None:
+            METRICS.count('solver.errors')
+            logger.error("Error running C++ solver worker: worker failed twice")
+            return [[] for _ in queries]
+        results = []
+        for lines in outputs:
+            # Like a one-shot run: [] signals failure, [''] an empty answer
+            if lines and lines[0].startswith('ERR'):
+                results.append([])
+            else:
+                results.append(lines or [''])
+        return results
+    
+    @classmethod
+    def _run_cpp_solver(cls, input_str: str, algo: str, args: List[str] = [], extra_input: str = "") -> List[str]:
+        """Answer one query through the worker pool"""
+        query = " ".join([algo] + args + extra_input.split())
+        return cls._run_queries(input_str, [query], directed=(algo == "topo"))[0]
+    
+    @classmethod
+    def dijkstra_many(cls, graph: Graph, pairs: List[Tuple[int, int]]) -> List[Tuple[List[int], float]]:
+        """Many Dijkstra queries against one graph in a single worker round-trip"""
+        snapshot = graph.snapshot()
+        node_to_idx, nodes = snapshot.node_to_idx, snapshot.nodes
+        queries = []
+        for start, end in pairs:
+            if start in node_to_idx and end in node_to_idx:
+                queries.append(f"dijkstra {node_to_idx[start]} {node_to_idx[end]}")
+            else:
+                queries.append("dijkstra -1 -1")  # Answered with ERR
+        
+        results = []
+        for output_lines in cls._run_queries(snapshot.solver_input, queries):
+            try:
+                path = [nodes[i] for i in map(int, output_lines[1].split())]
+                results.append((path, float(output_lines[0])))
+            except (ValueError, IndexError):
+                results.append(([], float('inf')))
+        return results
+
+
 from typing import List, Dict, Tuple, Optional
 
 
+# Selectable graph backends: in-process CSR engine, or graph_solver (one-shot or pooled workers)
+GRAPH_BACKENDS = {
+    'inprocess': InProcessGraphAlgorithms,
+    'cpp': GraphAlgorithms,
+    'cpp-server': PersistentGraphAlgorithms,
+}
+DEFAULT_GRAPH_BACKEND = 'inprocess'
+
+
+def get_graph_algorithms(backend: str = DEFAULT_GRAPH_BACKEND):
+    """Look up the graph algorithms implementation for a backend name"""
+    if backend not in GRAPH_BACKENDS:
+        raise ValueError(f"Unknown graph backend '{backend}', expected one of {sorted(GRAPH_BACKENDS)}")
+    return GRAPH_BACKENDS[backend]
+
+
 class CityMap:
     """Represents the city as a weighted graph"""
     
-    def __init__(self):
+    def __init__(self, initialize: bool = True):
         self.graph = Graph()
-        self.node_positions: Dict[int, Tuple[float, float]] = {}
-        self._initialize_city()
+        self.node_positions: Mapping[int, Tuple[float, float]] = {}
+        self._node_index: Optional[GridIndex] = None
+        self._free_flow: Dict[Tuple[int, int], float] = {}  # Road lengths before traffic
+        if initialize:
+            self._initialize_city()
+    
+    @classmethod
+    def from_snapshot(cls, csr: CSRGraph, node_positions: Mapping[int, Tuple[float, float]]) -> 'CityMap':
+        """City map over an existing road graph snapshot and node positions"""
+        city_map = cls(initialize=False)
+        city_map._attach(csr, node_positions)
+        return city_map
+    
+    @classmethod
+    def from_csv(cls, nodes_path: str, edges_path: str) -> 'CityMap':
+        """Load a road network from node (node_id,lon,lat) and edge (u,v[,weight_km]) CSV files"""
+        return cls.from_snapshot(*read_csv(nodes_path, edges_path))
+    
+    @classmethod
+    def load(cls, path: str) -> 'CityMap':
+        """Load a road network saved with save()"""
+        return cls.from_snapshot(*load_map(path))
+    
+    def save(self, path: str):
+        """Write the road network in the compact binary map format"""
+        save_map(path, self.graph.snapshot(), self.node_positions)
+    
+    def _attach(self, csr: CSRGraph, node_positions: Mapping[int, Tuple[float, float]]):
+        self.node_positions = node_positions
+        self.attach_graph(csr)
+    
+    def attach_graph(self, csr: CSRGraph):
+        """Route over csr (e.g. a shared graph generation) instead of the current road graph"""
+        self.graph.attach(csr)
+        self._node_index = None
+        self._free_flow = {}
+    
+    def set_traffic(self, updates: List[Tuple[int, int, Optional[float]]]) -> List[EdgeChange]:
+        """
+        Apply live traffic to many roads at once: (u, v, factor) scales the road's free-flow
+        length by factor (>= 1, so straight-line distance stays a lower bound for A* and
+        driver pruning); factor None closes the road. A closed road reopens with any factor.
+        Returns the road changes made.
+        """
+        weights = []
+        for u, v, factor in updates:
+            key = (u, v) if u < v else (v, u)
+            free_flow = self._free_flow.get(key)
+            if free_flow is None:
+                free_flow = self.graph.edge_weight(u, v)
+                if free_flow == INF:
+                    raise ValueError(f"No road between {u} and {v}")
+                self._free_flow[key] = free_flow
+            if factor is not None and factor < 1:
+                raise ValueError(f"Traffic factor must be at least 1, got {factor}")
+            weights.append((u, v, None if factor is None else free_flow * factor))
+        return self.graph.update_edges(weights)
     
     def _initialize_city(self):
         """Initialize a sample city map with intersections and roads"""
@@ -250,16 +612,26 @@ class CityMap:
         add(1, 5); add(8, 11); add(14, 5); add(15, 11)
 
     def _distance(self, u: int, v: int) -> float:
-        """Haversine distance between two node IDs (km)."""
+        """Haversine distance between two node IDs (km). Roads are never shorter, so it is also the A* heuristic."""
         lon1, lat1 = self.node_positions[u]
         lon2, lat2 = self.node_positions[v]
-        R = 6371.0
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = (math.sin(dlat / 2) ** 2 +
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-             math.sin(dlon / 2) ** 2)
-        return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        return haversine_km(lon1, lat1, lon2, lat2)
+    
+    @property
+    def node_index(self) -> GridIndex:
+        """Spatial grid over node_positions, built on first use"""
+        if self._node_index is None or len(self._node_index) != len(self.node_positions):
+            index = GridIndex()
+            for node, (lon, lat) in self.node_positions.items():
+                index.insert(node, lon, lat)
+            self._node_index = index
+        return self._node_index
+    
+    def nearest_node(self, lon: float, lat: float) -> Optional[int]:
+        """Snap a GPS coordinate to the closest road-network node"""
+        nearest = self.node_index.nearest(lon, lat, k=1, predicate=lambda node: node in self.graph.nodes)
+        return nearest[0][1] if nearest else None
+    
     def get_node_coordinates(self, node: int) -> Tuple[float, float]:
         """Get longitude, latitude for a node"""
         return self.node_positions.get(node, (0.0, 0.0))
@@ -272,6 +644,9 @@ class CityMap:
 class Driver:
     """Represents a driver in the system"""
     
+    # No per-instance __dict__: large fleets stay compact
+    __slots__ = ('driver_id', 'current_location', 'name', 'available', 'car_type', 'rating', 'plate_number')
+    
     def __init__(self, driver_id: int, current_location: int, name: str = None, car_type: str = "Standard"):
         self.driver_id = driver_id
         self.current_location = current_location
@@ -279,7 +654,6 @@ class Driver:
         self.available = True
         self.car_type = car_type
         # Random rating between 4.5 and 5.0
-        import random
         self.rating = round(random.uniform(4.5, 5.0), 1)
         self.plate_number = f"LHR-{random.randint(100, 999)}"
     
@@ -290,10 +664,39 @@ class Driver:
 class DriverManager:
     """Manages drivers and their assignments"""
     
-    def __init__(self, city_map: CityMap):
+    def __init__(self, city_map: CityMap, graph_algorithms=InProcessGraphAlgorithms, spatial_pruning: bool = True,
+                 initialize: bool = True):
         self.city_map = city_map
+        self.graph_algorithms = graph_algorithms
+        # Pruning by straight-line distance is exact only while no road is shorter than
+        # the straight line between its ends (true for haversine edge weights)
+        self.spatial_pruning = spatial_pruning
         self.drivers: List[Driver] = []
-        self._initialize_drivers()
+        self._drivers_by_id: Dict[int, Driver] = {}
+        # Secondary indexes; only change through add_driver / set_* / update_drivers
+        self._drivers_by_node: Dict[int, Set[int]] = {}
+        self._available_by_type: Dict[str, Set[int]] = {}
+        self.available_index = GridIndex()  # Available drivers at their node positions
+        # Bumped on every driver change; _changed maps driver ID -> version of its last
+        # change, least recent first, so changes_since() only walks what is new
+        self.version = 0
+        self._changed: "OrderedDict[int, int]" = OrderedDict()
+        # Guards drivers and all indexes; road searches run outside it
+        self._lock = threading.RLock()
+        if initialize:
+            self._initialize_drivers()
+    
+    def __getstate__(self) -> Dict:
+        # The routing backend belongs to the service that restores the manager
+        with self._lock:
+            state = dict(self.__dict__)
+        del state['_lock'], state['graph_algorithms']
+        return state
+    
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self.graph_algorithms = InProcessGraphAlgorithms
+        self._lock = threading.RLock()
     
     def _initialize_drivers(self):
         """Initialize drivers with different car types at random locations"""
@@ -304,35 +707,212 @@ class DriverManager:
         # Shuffle names to ensure randomness each time
         random.shuffle(names)
         
+        nodes = self.city_map.graph.nodes
+        if not all(location in nodes for location in driver_locations):
+            # Loaded map with different node IDs: start the demo fleet at random intersections
+            driver_locations = random.sample(sorted(nodes), min(len(driver_locations), len(nodes)))
+        
         for i, location in enumerate(driver_locations):
             # Use modulo safely
             c_type = car_types[i % len(car_types)]
             d_name = names[i % len(names)]
             driver = Driver(i + 1, location, f"{d_name}", c_type)
+            self.add_driver(driver)
+    
+    def add_driver(self, driver: Driver):
+        """Register a driver and index it"""
+        with self._lock:
+            if driver.driver_id in self._drivers_by_id:
+                raise ValueError(f"Driver {driver.driver_id} already registered")
             self.drivers.append(driver)
+            self._drivers_by_id[driver.driver_id] = driver
+            self._index(driver)
+            self._mark_changed(driver)
+    
+    def _mark_changed(self, driver: Driver):
+        self.version += 1
+        self._changed[driver.driver_id] = self.version
+        self._changed.move_to_end(driver.driver_id)
+    
+    def changes_since(self, version: int) -> Tuple[int, List[Driver]]:
+        """Current version and the drivers added, moved or (un)reserved after version"""
+        with self._lock:
+            changed = []
+            for driver_id, changed_at in reversed(self._changed.items()):
+                if changed_at <= version:
+                    break
+                changed.append(self._drivers_by_id[driver_id])
+            return self.version, changed
+    
+    def get_driver(self, driver_id: int) -> Optional[Driver]:
+        return self._drivers_by_id.get(driver_id)
+    
+    def _index(self, driver: Driver):
+        self._drivers_by_node.setdefault(driver.current_location, set()).add(driver.driver_id)
+        if driver.available:
+            self._available_by_type.setdefault(driver.car_type, set()).add(driver.driver_id)
+        if driver.available and driver.current_location in self.city_map.node_positions:
+            lon, lat = self.city_map.get_node_coordinates(driver.current_location)
+            self.available_index.insert(driver.driver_id, lon, lat)
+        else:
+            self.available_index.remove(driver.driver_id)
+    
+    def _unindex(self, driver: Driver):
+        at_node = self._drivers_by_node.get(driver.current_location)
+        if at_node is not None:
+            at_node.discard(driver.driver_id)
+            if not at_node:
+                del self._drivers_by_node[driver.current_location]
+        of_type = self._available_by_type.get(driver.car_type)
+        if of_type is not None:
+            of_type.discard(driver.driver_id)
+    
+    def _update(self, driver: Driver, location: Optional[int], available: Optional[bool]):
+        """Apply a location and/or availability change, reindexing once; call with the lock held"""
+        if ((location is None or location == driver.current_location)
+                and (available is None or available == driver.available)):
+            return  # Repeated position reports: nothing to reindex or publish
+        self._unindex(driver)
+        if location is not None:
+            driver.current_location = location
+        if available is not None:
+            driver.available = available
+        self._index(driver)
+        self._mark_changed(driver)
     
-    def find_nearby_drivers(self, pickup_location: int, limit: int = 3) -> List[Tuple[Driver, List[int], float]]:
+    def set_driver_location(self, driver_id: int, location: int) -> bool:
+        """Move a driver to a node; keeps the indexes in sync"""
+        with self._lock:
+            driver = self._drivers_by_id.get(driver_id)
+            if driver is None:
+                return False
+            self._update(driver, location, None)
+            return True
+    
+    def set_driver_availability(self, driver_id: int, available: bool) -> bool:
+        """Mark a driver (un)available; keeps the indexes in sync"""
+        with self._lock:
+            driver = self._drivers_by_id.get(driver_id)
+            if driver is None:
+                return False
+            self._update(driver, None, available)
+            return True
+    
+    def reserve_driver(self, driver_id: int) -> bool:
+        """Atomically take an available driver; False if unknown or already taken"""
+        with self._lock:
+            driver = self._drivers_by_id.get(driver_id)
+            if driver is None or not driver.available:
+                return False
+            self._update(driver, None, False)
+            return True
+    
+    def release_driver(self, driver_id: int, location: Optional[int] = None) -> bool:
+        """Make a reserved driver available again, optionally at a new node"""
+        with self._lock:
+            driver = self._drivers_by_id.get(driver_id)
+            if driver is None:
+                return False
+            self._update(driver, location, True)
+            return True
+    
+    def update_drivers(self, updates: List[Tuple[int, Optional[int], Optional[bool]]]) -> List[int]:
+        """
+        Apply many (driver_id, location, available) updates; None leaves a field unchanged
+        Returns: IDs of unknown drivers (their updates are skipped)
+        """
+        unknown = []
+        with self._lock:
+            for driver_id, location, available in updates:
+                driver = self._drivers_by_id.get(driver_id)
+                if driver is None:
+                    unknown.append(driver_id)
+                    continue
+                self._update(driver, location, available)
+        return unknown
+    
+    def drivers_at(self, node: int, available_only: bool = False) -> List[Driver]:
+        """Drivers currently at a node"""
+        with self._lock:
+            drivers = [self._drivers_by_id[i] for i in self._drivers_by_node.get(node, ())]
+        if available_only:
+            drivers = [driver for driver in drivers if driver.available]
+        return drivers
+    
+    def available_drivers(self, car_type: Optional[str] = None) -> List[Driver]:
+        """Available drivers, optionally of one car type"""
+        with self._lock:
+            if car_type is not None:
+                ids = self._available_by_type.get(car_type, ())
+            else:
+                ids = [i for of_type in self._available_by_type.values() for i in of_type]
+            return [self._drivers_by_id[i] for i in ids]
+    
+    def find_nearby_drivers(self, pickup_location: int, limit: int = 3,
+                            car_type: Optional[str] = None) -> List[Tuple[Driver, List[int], float]]:
         """
-        Find multiple nearby drivers using Dijkstra's algorithm
+        Find multiple nearby drivers with a single Dijkstra search from the pickup
+        Roads are undirected, so the pickup -> driver path reversed is the driver -> pickup route.
         Returns: List of (driver, path, distance) sorted by distance
         """
-        available_drivers = [d for d in self.drivers if d.available]
-        if not available_drivers:
+        if self.spatial_pruning and pickup_location in self.city_map.node_positions:
+            return self._find_nearby_drivers_pruned(pickup_location, limit, car_type)
+        return self._search_drivers(pickup_location, self.available_drivers(car_type), limit)
+    
+    def _find_nearby_drivers_pruned(self, pickup_location: int, limit: int,
+                                    car_type: Optional[str] = None) -> List[Tuple[Driver, List[int], float]]:
+        """
+        Road search only over drivers that can still be among the nearest
+        The 'limit' straight-line nearest drivers give an upper bound R on the answer;
+        any closer driver by road is within R in a straight line, so the radius shrinks
+        from the whole fleet to R.
+        """
+        lon, lat = self.city_map.get_node_coordinates(pickup_location)
+        with self._lock:
+            of_type = None
+            if car_type is not None:
+                of_type = set(self._available_by_type.get(car_type, ()))
+            nearest = self.available_index.nearest(lon, lat, k=limit,
+                                                   predicate=of_type.__contains__ if of_type is not None else None)
+            nearest_drivers = [self._drivers_by_id[i] for _, i in nearest]
+        if not nearest:
             return []
+        first = self._search_drivers(pickup_location, nearest_drivers, limit)
+        if len(first) < limit:
+            # Some straight-line neighbours are unreachable: no usable bound
+            return self._search_drivers(pickup_location, self.available_drivers(car_type), limit)
         
-        driver_results = []
+        radius = first[-1][2] + 1e-9
+        with self._lock:
+            candidates = [self._drivers_by_id[i] for _, i in self.available_index.within_radius(lon, lat, radius)
+                          if of_type is None or i in of_type]
+        if len(candidates) == len(nearest):
+            return first
+        return self._search_drivers(pickup_location, candidates, limit)
+    
+    def _search_drivers(self, pickup_location: int, drivers: List[Driver], limit: int) -> List[Tuple[Driver, List[int], float]]:
+        """One search from the pickup towards the given drivers"""
+        drivers_by_location: Dict[int, List[Driver]] = {}
+        with self._lock:
+            for driver in drivers:
+                drivers_by_location.setdefault(driver.current_location, []).append(driver)
+        if not drivers_by_location:
+            return []
         
-        for driver in available_drivers:
-            path, distance = GraphAlgorithms.dijkstra(
-                self.city_map.graph,
-                driver.current_location,
-                pickup_location
-            )
-            if distance != float('inf'):
-                driver_results.append((driver, path, distance))
+        METRICS.observe('drivers.search_candidates', len(drivers))
+        reached = self.graph_algorithms.dijkstra_one_to_many(
+            self.city_map.graph,
+            pickup_location,
+            [location for location, drivers in drivers_by_location.items() for _ in drivers],
+            limit
+        )
         
-        # Sort by distance and return nearest 'limit' drivers
-        driver_results.sort(key=lambda x: x[2])
+        # Results arrive nearest first
+        driver_results = []
+        for location, (path, distance) in reached.items():
+            driver_path = path[::-1]
+            for driver in drivers_by_location[location]:
+                driver_results.append((driver, driver_path, distance))
         return driver_results[:limit]
     
     def find_nearest_driver(self, pickup_location: int) -> Optional[Tuple[Driver, List[int], float]]:
@@ -356,32 +936,389 @@ class FareCalculator:
 class RideService:
     """Main service for handling rides"""
     
-    def __init__(self):
-        self.city_map = CityMap()
-        self.driver_manager = DriverManager(self.city_map)
+    def __init__(self, backend: str = DEFAULT_GRAPH_BACKEND, route_cache_size: int = 10000,
+                 route_cache_ttl: Optional[float] = None, route_workers: Optional[int] = None,
+                 city_map: Optional[CityMap] = None, initialize_drivers: bool = True,
+                 solver_workers: int = 4, solver_queue: int = 64):
+        self.backend = backend
+        self.graph_algorithms = get_graph_algorithms(backend)
+        if self.graph_algorithms is PersistentGraphAlgorithms:
+            self.graph_algorithms._pool()  # Raises SolverUnavailableError now rather than on every query
+        self.city_map = city_map if city_map is not None else CityMap()
+        # Searches run on a bounded pool; once solver_queue searches are waiting, requests
+        # fail fast with SolverBusyError (0 workers: search on the request thread, unbounded)
+        self.solver_executor = SolverExecutor(solver_workers, solver_queue) if solver_workers > 0 else None
+        # Shortest-path queries go through the cache; on road changes it drops only the routes
+        # they can affect, bounding detours by straight-line distance. Identical searches
+        # requested at the same time run once.
+        self.route_cache = RouteCache(self.graph_algorithms, route_cache_size, route_cache_ttl,
+                                      lower_bound=self.city_map._distance, executor=self.solver_executor)
+        self.driver_manager = DriverManager(self.city_map, self.route_cache, initialize=initialize_drivers)
+        # Driver position deltas for streaming clients (see DriverFeed.stream)
+        self.driver_feed = DriverFeed(self.driver_manager)
+        self.map_tiles = MapTiles(self.city_map)
         self.fare_calculator = FareCalculator()
-        self.graph_algorithms = GraphAlgorithms()
+        # Requests submitted here are matched together every 0.5 s (see dispatch_rides)
+        self.dispatch_window = DispatchWindow(self.dispatch_rides)
+        # Workflows are compiled once here; requests only look plans up
+        self.workflows = WorkflowRegistry()
+        self.workflows.register(DEFAULT_WORKFLOW, RIDE_WORKFLOW_DEPENDENCIES)
+        # algorithm -> (graph version, MST response); the road network rarely changes
+        self._mst_cache: Dict[str, Tuple[int, Dict]] = {}
+        # Independent searches within one request run in parallel; only worthwhile when
+        # the backend releases the GIL (subprocess solvers), so off for 'inprocess' by default
+        if route_workers is None:
+            route_workers = 0 if backend == 'inprocess' else 4
+        self._executor = ThreadPoolExecutor(route_workers, 'ride-routes') if route_workers > 0 else None
+        self.shared_graph: Optional[SharedGraph] = None
+    
+    def set_routing_index(self, index):
+        """Answer shortest-path queries from a preprocessed index (None to go back to plain search)"""
+        previous = getattr(self.route_cache.graph_algorithms, 'index', None)
+        if isinstance(previous, RegionShards) and previous is not index:
+            previous.close()
+        if index is None:
+            self.route_cache.graph_algorithms = self.graph_algorithms
+        else:
+            self.route_cache.graph_algorithms = IndexedGraphAlgorithms(self.graph_algorithms, index)
+        self.route_cache.clear()
+    
+    def close(self):
+        """Stop the solver and route threads and any region shard processes"""
+        if self.solver_executor is not None:
+            self.solver_executor.shutdown()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        index = getattr(self.route_cache.graph_algorithms, 'index', None)
+        if isinstance(index, RegionShards):
+            index.close()
+    
+    def build_contraction_hierarchy(self, path: Optional[str] = None) -> ContractionHierarchy:
+        """
+        Build (or load from path when it matches the current map) a contraction hierarchy
+        and route with it; a freshly built index is saved to path for other workers.
+        """
+        index = None
+        if path and os.path.exists(path):
+            index = ContractionHierarchy.load(path)
+            if not index.matches(self.city_map.graph):
+                index = None
+        if index is None:
+            index = ContractionHierarchy.build(self.city_map.graph)
+            if path:
+                index.save(path)
+        self.set_routing_index(index)
+        return index
+    
+    def update_traffic(self, updates: List[Tuple[int, int, Optional[float]]]) -> int:
+        """
+        Apply a traffic tick (see CityMap.set_traffic); returns the number of roads changed
+        Cached routes and MSTs are only dropped where the changes can affect them, and
+        preprocessed routing indexes fall back to search until rebuilt for the new weights.
+        """
+        return len(self.city_map.set_traffic(updates))
+    
+    def attach_shared_graph(self, path: str) -> SharedGraph:
+        """
+        Route over the graph published at path (mapped, not copied), publishing this
+        worker's map there first if nobody has yet
+        """
+        shared = SharedGraph(path)
+        if not os.path.exists(path):
+            shared.publish(self.city_map)
+        shared.sync(self.city_map)
+        self.shared_graph = shared
+        return shared
+    
+    def sync_shared_graph(self) -> bool:
+        """Pick up a newer published graph, if any; cheap when nothing changed"""
+        if self.shared_graph is None:
+            return False
+        return self.shared_graph.sync(self.city_map)
+    
+    def publish_graph(self) -> int:
+        """Publish this worker's (edited) map as the next shared generation"""
+        if self.shared_graph is None:
+            raise ValueError("No shared graph attached")
+        return self.shared_graph.publish(self.city_map)
+    
+    SNAPSHOT_FORMAT = 2
+    
+    def save_snapshot(self, path: str):
+        """
+        Write the built service state to path: graph arrays, node positions and spatial
+        index, drivers with their indexes, workflows and a contraction hierarchy if one is
+        in use. Derived indexes are built first so restore() has nothing left to do.
+        """
+        self.city_map.graph.snapshot()
+        self.city_map.node_index
+        index = getattr(self.route_cache.graph_algorithms, 'index', None)
+        state = {
+            'format': self.SNAPSHOT_FORMAT,
+            'city_map': self.city_map,
+            'driver_manager': self.driver_manager,
+            'workflows': {name: self.workflows.dependencies(name) for name in self.workflows.names()},
+            # Distance matrices live in their own shared file and are reattached by path
+            'routing_index': index if isinstance(index, ContractionHierarchy) else None,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
     
-    def request_ride(self, pickup_node: int, dropoff_node: int) -> Dict:
+    @classmethod
+    def restore(cls, path: str, backend: str = DEFAULT_GRAPH_BACKEND, **kwargs) -> 'RideService':
+        """
+        Service restored from a save_snapshot() file with one bulk read
+        Only load snapshots you wrote yourself: the file is a pickle.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Millions of fresh container objects would otherwise trigger repeated, futile GC passes
+        gc.disable()
+        try:
+            state = pickle.loads(data)
+        finally:
+            gc.enable()
+        if not isinstance(state, dict) or state.get('format') != cls.SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} is not a RideX service snapshot")
+        service = cls(backend=backend, city_map=state['city_map'], initialize_drivers=False, **kwargs)
+        service.driver_manager = state['driver_manager']
+        service.driver_manager.graph_algorithms = service.route_cache
+        service.driver_feed = DriverFeed(service.driver_manager)
+        for name, dependencies in state['workflows'].items():
+            service.workflows.register(name, dependencies)
+        if state['routing_index'] is not None:
+            service.set_routing_index(state['routing_index'])
+        return service
+    
+    def use_distance_matrix(self, path: str, max_nodes: int = 5000,
+                            processes: Optional[int] = None) -> SharedDistanceMatrix:
+        """
+        Answer shortest-path queries from an all-pairs matrix memory-mapped from path
+        Workers pointing at the same path share one copy; the matrix is rebuilt in the
+        background whenever the map changes, with regular searches used meanwhile.
+        """
+        index = SharedDistanceMatrix(path, max_nodes, processes)
+        index.matches(self.city_map.graph)  # Attach or start building right away
+        self.set_routing_index(index)
+        return index
+    
+    def use_region_shards(self, regions: int = 4, processes: bool = True) -> RegionShards:
+        """
+        Route through region shards, each in its own process (see region_shards.py)
+        Distances are exactly those of a whole-graph search. Once the map changes,
+        regular searches answer queries until this is called again.
+        """
+        index = RegionShards.build(self.city_map.graph, self.city_map.node_positions, regions, processes)
+        self.set_routing_index(index)
+        return index
+    
+    def _run_all(self, tasks: List) -> List:
+        """Call each task, on the route thread pool when there is one; results in order"""
+        if self._executor is None or len(tasks) < 2:
+            return [task() for task in tasks]
+        futures = [self._executor.submit(task) for task in tasks[1:]]
+        first = tasks[0]()  # The calling thread takes a share of the work
+        return [first] + [future.result() for future in futures]
+    
+    def register_workflow(self, name: str, dependencies: Dict[str, List[str]]) -> List[str]:
+        """
+        Compile a named workflow (e.g. a car type with extra steps); raises ValueError on cycles
+        Ride options for drivers whose car type has its own workflow carry that plan.
+        """
+        return list(self.workflows.register(name, dependencies))
+    
+    def request_ride(self, pickup_node: int, dropoff_node: int, car_type: Optional[str] = None) -> Dict:
         """
         Process a ride request and return multiple options
         """
-        # Find nearby drivers (up to 3)
-        nearby_drivers = self.driver_manager.find_nearby_drivers(pickup_node, limit=3)
+        def find_drivers():
+            # Find nearby drivers (up to 3), optionally only of one car type
+            with METRICS.timer('ride.find_drivers_ms'):
+                return self.driver_manager.find_nearby_drivers(pickup_node, limit=3, car_type=car_type)
         
-        if not nearby_drivers:
-            return {
-                'success': False,
-                'error': 'No available drivers nearby'
-            }
+        def route():
+            # Common ride path (pickup -> dropoff), A* guided by straight-line distance
+            with METRICS.timer('ride.route_ms'):
+                return self.route_cache.astar(
+                    self.city_map.graph,
+                    pickup_node,
+                    dropoff_node,
+                    self.city_map._distance
+                )
+        
+        with METRICS.timer('ride.request_ms'):
+            nearby_drivers, (ride_path, ride_distance) = self._run_all([find_drivers, route])
             
-        # Common ride path (pickup -> dropoff)
-        ride_path, ride_distance = self.graph_algorithms.dijkstra(
-            self.city_map.graph,
-            pickup_node,
-            dropoff_node
+            if not nearby_drivers:
+                METRICS.count('ride.no_drivers')
+                return {
+                    'success': False,
+                    'error': 'No available drivers nearby'
+                }
+            
+            with METRICS.timer('ride.build_response_ms'):
+                return self._build_ride_response(pickup_node, dropoff_node, nearby_drivers,
+                                                 ride_path, ride_distance)
+    
+    def request_rides(self, ride_requests: List[Tuple[int, int]]) -> List[Dict]:
+        """
+        Process many (pickup, dropoff) requests, sharing work between them
+        Requests are grouped by pickup: each pickup gets one driver search and one
+        one-to-many search to all of its dropoffs.
+        Returns one result per request, in order, shaped like request_ride.
+        """
+        METRICS.count('ride.batch_requests', len(ride_requests))
+        graph = self.city_map.graph
+        
+        dropoffs_by_pickup: Dict[int, List[int]] = {}
+        for pickup_node, dropoff_node in ride_requests:
+            dropoffs_by_pickup.setdefault(pickup_node, []).append(dropoff_node)
+        
+        def serve_pickup(pickup_node: int, dropoffs: List[int]):
+            nearby_drivers = self.driver_manager.find_nearby_drivers(pickup_node, limit=3)
+            pickup_routes = {}
+            if not nearby_drivers:
+                return nearby_drivers, pickup_routes
+            unique_dropoffs = set(dropoffs)
+            if len(unique_dropoffs) == 1:
+                dropoff_node = dropoffs[0]
+                pickup_routes[dropoff_node] = self.route_cache.astar(
+                    graph, pickup_node, dropoff_node, self.city_map._distance
+                )
+            else:
+                reached = self.route_cache.dijkstra_one_to_many(graph, pickup_node, sorted(unique_dropoffs))
+                for dropoff_node in unique_dropoffs:
+                    pickup_routes[dropoff_node] = reached.get(dropoff_node, ([], float('inf')))
+            return nearby_drivers, pickup_routes
+        
+        # Pickups are independent of each other
+        served = self._run_all([
+            lambda pickup_node=pickup_node, dropoffs=dropoffs: serve_pickup(pickup_node, dropoffs)
+            for pickup_node, dropoffs in dropoffs_by_pickup.items()
+        ])
+        nearby_by_pickup = {}
+        routes: Dict[Tuple[int, int], Tuple[List[int], float]] = {}
+        for pickup_node, (nearby_drivers, pickup_routes) in zip(dropoffs_by_pickup, served):
+            nearby_by_pickup[pickup_node] = nearby_drivers
+            for dropoff_node, route in pickup_routes.items():
+                routes[(pickup_node, dropoff_node)] = route
+        
+        results = []
+        for pickup_node, dropoff_node in ride_requests:
+            nearby_drivers = nearby_by_pickup[pickup_node]
+            if not nearby_drivers:
+                results.append({
+                    'success': False,
+                    'error': 'No available drivers nearby'
+                })
+                continue
+            ride_path, ride_distance = routes[(pickup_node, dropoff_node)]
+            results.append(self._build_ride_response(pickup_node, dropoff_node, nearby_drivers,
+                                                     ride_path, ride_distance))
+        return results
+    
+    def dispatch_rides(self, ride_requests: List[Tuple[int, int]], candidates_per_rider: int = 10) -> List[Dict]:
+        """
+        Assign distinct drivers to a batch of requests, minimising total pickup distance
+        Each rider considers its `candidates_per_rider` nearest drivers (a pickup shared by
+        several riders searches that many more); the rider x driver costs come from
+        one-to-many searches shared per pickup. Riders left unmatched while their pickup may
+        have more drivers get a wider search and the batch is solved again. Assigned drivers
+        are marked unavailable until complete_ride.
+        Returns one result per request, shaped like request_ride with the assigned driver
+        as the only option.
+        """
+        graph = self.city_map.graph
+        
+        riders_at = Counter(pickup_node for pickup_node, _ in ride_requests)
+        limits = {pickup_node: candidates_per_rider + riders - 1 for pickup_node, riders in riders_at.items()}
+        pickups = list(riders_at)
+        pairs = list(dict.fromkeys(ride_requests))
+        searches = self._run_all(
+            [lambda pickup_node=pickup_node: self.driver_manager.find_nearby_drivers(
+                pickup_node, limit=limits[pickup_node]) for pickup_node in pickups] +
+            [lambda pair=pair: self.route_cache.astar(graph, pair[0], pair[1], self.city_map._distance)
+             for pair in pairs]
         )
+        nearby_by_pickup = dict(zip(pickups, searches[:len(pickups)]))
+        routes = dict(zip(pairs, searches[len(pickups):]))
         
+        while True:
+            costs: Dict[int, Dict[int, float]] = {}
+            for i, (pickup_node, dropoff_node) in enumerate(ride_requests):
+                if routes[(pickup_node, dropoff_node)][0]:
+                    costs[i] = {driver.driver_id: distance for driver, _, distance in nearby_by_pickup[pickup_node]}
+            
+            with METRICS.timer('dispatch.assignment_ms'):
+                assignment = solve_assignment(costs)
+            
+            # A full candidate list may have cut off drivers an unmatched rider could take
+            widen = list(dict.fromkeys(
+                pickup_node for i, (pickup_node, _) in enumerate(ride_requests)
+                if i in costs and i not in assignment and len(nearby_by_pickup[pickup_node]) >= limits[pickup_node]))
+            if not widen:
+                break
+            for pickup_node in widen:
+                limits[pickup_node] = max(2 * limits[pickup_node], 1)
+            nearby_by_pickup.update(zip(widen, self._run_all(
+                [lambda pickup_node=pickup_node: self.driver_manager.find_nearby_drivers(
+                    pickup_node, limit=limits[pickup_node]) for pickup_node in widen])))
+        
+        results = []
+        for i, (pickup_node, dropoff_node) in enumerate(ride_requests):
+            ride_path, ride_distance = routes[(pickup_node, dropoff_node)]
+            driver_id = assignment.get(i)
+            if driver_id is None:
+                results.append({
+                    'success': False,
+                    'error': 'No available drivers nearby' if ride_path
+                    else 'No path found between pickup and dropoff locations'
+                })
+                continue
+            if not self.driver_manager.reserve_driver(driver_id):
+                # Booked by a concurrent request since the search
+                METRICS.count('ride.booking_conflicts')
+                results.append({
+                    'success': False,
+                    'error': 'Driver is no longer available'
+                })
+                continue
+            candidate = next(c for c in nearby_by_pickup[pickup_node] if c[0].driver_id == driver_id)
+            result = self._build_ride_response(pickup_node, dropoff_node, [candidate],
+                                               ride_path, ride_distance)
+            result['assigned_driver_id'] = driver_id
+            results.append(result)
+        return results
+    
+    def book_ride(self, driver_id: int, pickup_node: int, dropoff_node: int) -> Dict:
+        """
+        Book one of the drivers offered by request_ride
+        The reservation is atomic: of two concurrent bookings for the same driver only one
+        succeeds. The driver stays unavailable until complete_ride.
+        """
+        if not self.driver_manager.reserve_driver(driver_id):
+            METRICS.count('ride.booking_conflicts')
+            return {
+                'success': False,
+                'error': 'Driver is no longer available'
+            }
+        return {
+            'success': True,
+            'driver_id': driver_id,
+            'pickup': pickup_node,
+            'dropoff': dropoff_node
+        }
+    
+    def complete_ride(self, driver_id: int, dropoff_node: int) -> bool:
+        """Driver finished a trip: park them at the dropoff and make them available again"""
+        return self.driver_manager.release_driver(driver_id, dropoff_node)
+    
+    def _build_ride_response(self, pickup_node: int, dropoff_node: int,
+                             nearby_drivers: List[Tuple[Driver, List[int], float]],
+                             ride_path: List[int], ride_distance: float) -> Dict:
+        """Ride options payload for one request"""
         if not ride_path:
             return {
                 'success': False,
@@ -389,7 +1326,6 @@ class RideService:
             }
             
         ride_path_coords = self.city_map.get_path_coordinates(ride_path)
-        workflow = self.graph_algorithms.topological_sort(RIDE_WORKFLOW_DEPENDENCIES)
         
         options = []
         
@@ -412,7 +1348,7 @@ class RideService:
             # Helper for coordinates
             driver_path_coords = self.city_map.get_path_coordinates(driver_path)
             
-            options.append({
+            option = {
                 'driver': {
                     'id': driver.driver_id,
                     'name': driver.name,
@@ -430,7 +1366,10 @@ class RideService:
                 },
                 'fare': round(fare),
                 'total_distance_km': round(driver_dist + ride_distance, 2)
-            })
+            }
+            if driver.car_type in self.workflows:
+                option['workflow'] = list(self.workflows.plan(driver.car_type))
+            options.append(option)
             
         return {
             'success': True,
@@ -449,16 +1388,29 @@ class RideService:
                     'path_coords': ride_path_coords,
                     'distance_km': round(ride_distance, 2)
                 },
-                'workflow': workflow
+                'workflow': list(self.workflows.plan())
             },
             'options': options
         }
     
-    def get_mst_prim(self) -> Dict:
-        """Get Minimum Spanning Tree using Prim's algorithm"""
-        mst_edges = self.graph_algorithms.prim_mst(self.city_map.graph)
-        return {
-            'algorithm': 'Prim',
+    def _get_mst(self, algorithm: str) -> Dict:
+        """MST response for 'Prim' or 'Kruskal', computed once per graph version"""
+        graph = self.city_map.graph
+        version = graph.version
+        cached = self._mst_cache.get(algorithm)
+        if cached is not None and cached[0] != version:
+            changes = graph.changes_since(cached[0])
+            if changes is not None and self._mst_unaffected(cached[1], changes):
+                cached = (version, cached[1])
+                self._mst_cache[algorithm] = cached
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if algorithm == 'Prim':
+            mst_edges = self.graph_algorithms.prim_mst(graph)
+        else:
+            mst_edges = self.graph_algorithms.kruskal_mst(graph)
+        result = {
+            'algorithm': algorithm,
             'edges': mst_edges,
             'total_edges': len(mst_edges),
             'edge_coords': [
@@ -472,50 +1424,61 @@ class RideService:
                 for u, v, weight in mst_edges
             ]
         }
+        self._mst_cache[algorithm] = (version, result)
+        return result
+    
+    @staticmethod
+    def _mst_unaffected(mst: Dict, changes: List[EdgeChange]) -> bool:
+        """A tree stays minimal when the only changes are non-tree roads getting slower or closing"""
+        tree = {(u, v) if u < v else (v, u) for u, v, _ in mst['edges']}
+        return all(new >= old and ((u, v) if u < v else (v, u)) not in tree
+                   for u, v, old, new in changes)
+    
+    def get_mst_prim(self) -> Dict:
+        """Get Minimum Spanning Tree using Prim's algorithm"""
+        return self._get_mst('Prim')
     
     def get_mst_kruskal(self) -> Dict:
         """Get Minimum Spanning Tree using Kruskal's algorithm"""
-        mst_edges = self.graph_algorithms.kruskal_mst(self.city_map.graph)
-        return {
-            'algorithm': 'Kruskal',
-            'edges': mst_edges,
-            'total_edges': len(mst_edges),
-            'edge_coords': [
-                {
-                    'u': u,
-                    'v': v,
-                    'weight': weight,
-                    'u_coords': self.city_map.get_node_coordinates(u),
-                    'v_coords': self.city_map.get_node_coordinates(v)
-                }
-                for u, v, weight in mst_edges
-            ]
-        }
+        return self._get_mst('Kruskal')
+    
+    # Maps larger than this are only served as tiles (see MapTiles)
+    CITY_MAP_INLINE_NODES = 5000
     
     def get_city_map_info(self) -> Dict:
-        """Get city map information"""
+        """Get city map information; nodes and edges are only inlined for small maps"""
+        # Read from one snapshot so concurrent edits can't change the map mid-way
+        snapshot = self.city_map.graph.snapshot()
+        nodes = snapshot.nodes
+        info = {
+            'total_nodes': len(nodes),
+            'total_edges': len(snapshot.edge_columns()[0]),
+            'bounds': self.map_tiles.bounds(),
+            'tiles': {'url': '/api/tiles/{z}/{x}/{y}', 'max_zoom': MAX_ZOOM}
+        }
+        if len(nodes) > self.CITY_MAP_INLINE_NODES:
+            return info
+        
         nodes_coords = {
             node: self.city_map.get_node_coordinates(node)
-            for node in self.city_map.graph.nodes
+            for node in nodes
         }
         
         edges_info = []
-        for u in self.city_map.graph.adjacency_list:
-            for v, weight in self.city_map.graph.adjacency_list[u]:
-                if u < v:  # Avoid duplicates
-                    edges_info.append({
-                        'u': u,
-                        'v': v,
-                        'weight': weight,
-                        'u_coords': self.city_map.get_node_coordinates(u),
-                        'v_coords': self.city_map.get_node_coordinates(v)
-                    })
+        for iu, iv, weight in snapshot.edges:
+            u, v = nodes[iu], nodes[iv]
+            edges_info.append({
+                'u': u,
+                'v': v,
+                'weight': weight,
+                'u_coords': self.city_map.get_node_coordinates(u),
+                'v_coords': self.city_map.get_node_coordinates(v)
+            })
         
-        return {
-            'nodes': list(self.city_map.graph.nodes),
+        info.update({
+            'nodes': list(nodes),
             'nodes_coords': nodes_coords,
-            'edges': edges_info,
-            'total_nodes': len(self.city_map.graph.nodes),
-            'total_edges': len(edges_info)
-        }
+            'edges': edges_info
+        })
+        return info
 
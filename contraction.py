@@ -0,0 +1,324 @@
+"""
+Contraction hierarchy routing index for RideX
+
+Preprocesses a Graph once so point-to-point and one-to-many queries only search
+"upward" through a small part of the network. Indices are bound to the graph
+content they were built from (CSRGraph.fingerprint) and can be saved to disk so
+workers load them instead of rebuilding at startup.
+"""
+import heapq
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Iterable, Optional, TYPE_CHECKING
+
+from graph_engine import INF
+
+if TYPE_CHECKING:
+    from city_map import Graph
+
+_MAGIC = b'RIDEXCH1'
+_HEADER = '=qq16s'  # Native byte order like the arrays, standard sizes
+
+# Above this many distinct targets a one-to-many query is cheaper as one plain Dijkstra
+# than as an upward search per target (see IndexedGraphAlgorithms)
+MAX_ONE_TO_MANY_TARGETS = 64
+
+
+class ContractionHierarchy:
+    """Upward graph of a contraction hierarchy; shortcuts remember the node they bypass"""
+
+    def __init__(self, nodes: array, rank: array, up_offsets: array, up_targets: array,
+                 up_weights: array, up_mids: array, fingerprint: str):
+        self.nodes = nodes
+        self.node_to_idx: Dict[int, int] = {node: i for i, node in enumerate(nodes)}
+        self.rank = rank
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_mids = up_mids  # -1 for an original road
+        self.fingerprint = fingerprint
+        self._matched: Tuple[int, int] = (-1, -1)  # (id(graph), version) last seen matching
+        self.max_targets = MAX_ONE_TO_MANY_TARGETS
+        # Target set -> (buckets, backward parents per target); drivers often stay put between queries
+        self._bucket_cache: "OrderedDict[Tuple[int, ...], Tuple[Dict, Dict]]" = OrderedDict()
+        self._bucket_lock = threading.Lock()
+
+    def __getstate__(self) -> Dict:
+        # Saved in service snapshots; the lock and bucket cache are per process
+        state = dict(self.__dict__)
+        del state['_bucket_lock']
+        state['_bucket_cache'] = OrderedDict()
+        state['_matched'] = (-1, -1)
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._bucket_lock = threading.Lock()
+
+    # --- Preprocessing ---
+
+    @classmethod
+    def build(cls, graph: 'Graph', witness_limit: int = 100) -> 'ContractionHierarchy':
+        """
+        Contract nodes in edge-difference order, adding shortcuts where no witness path exists
+        witness_limit caps nodes settled per witness search; a cut-off search only adds
+        a redundant shortcut, never a wrong one.
+        """
+        csr = graph.snapshot()
+        n = len(csr)
+        adj: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(n)]
+        for u in range(n):
+            for i in range(csr.offsets[u], csr.offsets[u + 1]):
+                v, w = csr.targets[i], csr.weights[i]
+                if v != u and (v not in adj[u] or w < adj[u][v][0]):
+                    adj[u][v] = (w, -1)
+
+        def witness_distances(source: int, avoid: int, max_dist: float) -> Dict[int, float]:
+            dist = {source: 0.0}
+            pq = [(0.0, source)]
+            settled = 0
+            while pq and settled < witness_limit:
+                d, x = heapq.heappop(pq)
+                if d > dist[x]:
+                    continue
+                if d > max_dist:
+                    break
+                settled += 1
+                for y, (w, _) in adj[x].items():
+                    if y == avoid:
+                        continue
+                    nd = d + w
+                    if nd < dist.get(y, INF):
+                        dist[y] = nd
+                        heapq.heappush(pq, (nd, y))
+            return dist
+
+        def shortcuts_for(v: int) -> List[Tuple[int, int, float]]:
+            neighbors = list(adj[v].items())
+            shortcuts = []
+            for i, (u, (w_uv, _)) in enumerate(neighbors):
+                rest = neighbors[i + 1:]
+                if not rest:
+                    continue
+                max_dist = w_uv + max(w for _, (w, _) in rest)
+                dist = witness_distances(u, v, max_dist)
+                for x, (w_vx, _) in rest:
+                    via = w_uv + w_vx
+                    if dist.get(x, INF) > via:
+                        shortcuts.append((u, x, via))
+            return shortcuts
+
+        deleted_neighbors = [0] * n
+
+        def priority(v: int) -> int:
+            return len(shortcuts_for(v)) - len(adj[v]) + deleted_neighbors[v]
+
+        pq = [(priority(v), v) for v in range(n)]
+        heapq.heapify(pq)
+        rank = array('i', [0]) * n
+        up: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+        contracted = [False] * n
+        order = 0
+
+        while pq:
+            _, v = heapq.heappop(pq)
+            if contracted[v]:
+                continue
+            # Lazy update: re-evaluate and requeue if v is no longer the cheapest
+            current = priority(v)
+            if pq and current > pq[0][0]:
+                heapq.heappush(pq, (current, v))
+                continue
+
+            for u, x, via in shortcuts_for(v):
+                if x not in adj[u] or via < adj[u][x][0]:
+                    adj[u][x] = (via, v)
+                    adj[x][u] = (via, v)
+            for u, (w, mid) in adj[v].items():
+                up[v].append((u, w, mid))
+                del adj[u][v]
+                deleted_neighbors[u] += 1
+            adj[v] = {}
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+
+        up_offsets = array('i', [0]) * (n + 1)
+        up_targets, up_weights, up_mids = array('i'), array('d'), array('i')
+        for v in range(n):
+            for u, w, mid in up[v]:
+                up_targets.append(u)
+                up_weights.append(w)
+                up_mids.append(mid)
+            up_offsets[v + 1] = len(up_targets)
+        return cls(array('q', csr.nodes), rank, up_offsets, up_targets, up_weights, up_mids, csr.fingerprint)
+
+    def matches(self, graph: 'Graph') -> bool:
+        """Whether this index was built from the graph's current content"""
+        key = (id(graph), graph.version)
+        if key == self._matched:
+            return True
+        if graph.snapshot().fingerprint != self.fingerprint:
+            return False
+        self._matched = key
+        return True
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        """Write the index in a compact native-endian binary format"""
+        with open(path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(struct.pack(_HEADER, len(self.nodes), len(self.up_targets), bytes.fromhex(self.fingerprint)))
+            for arr in (self.nodes, self.rank, self.up_offsets, self.up_targets, self.up_weights, self.up_mids):
+                arr.tofile(f)
+
+    @classmethod
+    def load(cls, path: str) -> 'ContractionHierarchy':
+        """Read an index written by save()"""
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{path} is not a RideX contraction hierarchy")
+            n, m, fingerprint = struct.unpack(_HEADER, f.read(struct.calcsize(_HEADER)))
+            arrays = []
+            for typecode, count in (('q', n), ('i', n), ('i', n + 1), ('i', m), ('d', m), ('i', m)):
+                arr = array(typecode)
+                arr.fromfile(f, count)
+                arrays.append(arr)
+        return cls(*arrays, fingerprint.hex())
+
+    # --- Queries ---
+
+    def _upward_search(self, source: int, bound: float = INF) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """Dijkstra over upward edges only, from an index"""
+        offsets, targets, weights = self.up_offsets, self.up_targets, self.up_weights
+        dist = {source: 0.0}
+        parent = {source: -1}
+        pq = [(0.0, source)]
+        while pq:
+            d, u = heapq.heappop(pq)
+            if d > dist[u]:
+                continue
+            if d >= bound:
+                break
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                nd = d + weights[i]
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(pq, (nd, v))
+        return dist, parent
+
+    def _up_edge(self, a: int, b: int) -> Tuple[float, int]:
+        """(weight, mid) of the hierarchy edge between a and b, stored at the lower-ranked end"""
+        low, high = (a, b) if self.rank[a] < self.rank[b] else (b, a)
+        best = (INF, -1)
+        for i in range(self.up_offsets[low], self.up_offsets[low + 1]):
+            if self.up_targets[i] == high and self.up_weights[i] < best[0]:
+                best = (self.up_weights[i], self.up_mids[i])
+        return best
+
+    def _unpack(self, chain: List[int]) -> Tuple[List[int], float]:
+        """Expand shortcuts along a chain of indices; returns node IDs and the re-summed distance"""
+        path = [chain[0]]
+        distance = 0.0
+        for a, b in zip(chain, chain[1:]):
+            stack = [(a, b)]
+            while stack:
+                x, y = stack.pop()
+                weight, mid = self._up_edge(x, y)
+                if mid == -1:
+                    path.append(y)
+                    distance += weight  # Summed from the start like dijkstra
+                else:
+                    stack.append((mid, y))
+                    stack.append((x, mid))
+        return [self.nodes[i] for i in path], distance
+
+    @staticmethod
+    def _chain(forward_parent: Dict[int, int], backward_parent: Dict[int, int], meet: int) -> List[int]:
+        chain = []
+        v = meet
+        while v != -1:
+            chain.append(v)
+            v = forward_parent[v]
+        chain.reverse()
+        v = backward_parent[meet]
+        while v != -1:
+            chain.append(v)
+            v = backward_parent[v]
+        return chain
+
+    def shortest_path(self, start: int, end: int) -> Tuple[List[int], float]:
+        """Exact point-to-point shortest path (node IDs)"""
+        if start not in self.node_to_idx or end not in self.node_to_idx:
+            return [], float('inf')
+        s, t = self.node_to_idx[start], self.node_to_idx[end]
+        forward, forward_parent = self._upward_search(s)
+        backward, backward_parent = self._upward_search(t)
+
+        best, meet = INF, -1
+        for v, d in forward.items():
+            other = backward.get(v)
+            if other is not None and d + other < best:
+                best, meet = d + other, v
+        if meet == -1:
+            return [], float('inf')
+        return self._unpack(self._chain(forward_parent, backward_parent, meet))
+
+    def _buckets(self, targets: Tuple[int, ...]) -> Tuple[Dict[int, List[Tuple[int, float]]], Dict[int, Dict[int, int]]]:
+        """Backward upward searches of a target set: node -> [(target, distance)], and their parents"""
+        with self._bucket_lock:
+            cached = self._bucket_cache.get(targets)
+            if cached is not None:
+                self._bucket_cache.move_to_end(targets)
+                return cached
+        buckets: Dict[int, List[Tuple[int, float]]] = {}
+        parents: Dict[int, Dict[int, int]] = {}
+        for target in targets:
+            dist, parents[target] = self._upward_search(self.node_to_idx[target])
+            for v, d in dist.items():
+                buckets.setdefault(v, []).append((target, d))
+        with self._bucket_lock:
+            self._bucket_cache[targets] = (buckets, parents)
+            while len(self._bucket_cache) > 8:
+                self._bucket_cache.popitem(last=False)
+        return buckets, parents
+
+    def one_to_many(self, start: int, targets: Iterable[int],
+                    limit: Optional[int] = None) -> Dict[int, Tuple[List[int], float]]:
+        """
+        Bucket-based one-to-many query, same contract as dijkstra_one_to_many
+        Each target's upward search fills buckets, once per target set; one upward
+        search from start scans them.
+        """
+        if start not in self.node_to_idx:
+            return {}
+        counts: Dict[int, int] = {}
+        for target in targets:
+            if target in self.node_to_idx:
+                counts[target] = counts.get(target, 0) + 1
+        if not counts:
+            return {}
+
+        buckets, backward_parents = self._buckets(tuple(sorted(counts)))
+
+        s = self.node_to_idx[start]
+        forward, forward_parent = self._upward_search(s)
+        best: Dict[int, Tuple[float, int]] = {}
+        for v, d in forward.items():
+            for target, d_back in buckets.get(v, ()):
+                if d + d_back < best.get(target, (INF, -1))[0]:
+                    best[target] = (d + d_back, v)
+
+        results = {}
+        found = 0
+        for target, (_, meet) in sorted(best.items(), key=lambda item: item[1][0]):
+            results[target] = self._unpack(self._chain(forward_parent, backward_parents[target], meet))
+            found += counts[target]
+            if limit is not None and found >= limit:
+                break
+        return results
@@ -0,0 +1,151 @@
+"""
+Batch dispatch for RideX
+
+Riders collected over a short window are matched to drivers all at once by a
+min-cost assignment on pickup distance, instead of each request greedily
+taking its nearest drivers.
+"""
+import heapq
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Tuple, Hashable, Callable, Optional
+
+
+_UNASSIGNED = object()
+
+
+def solve_assignment(costs: Dict[Hashable, Dict[Hashable, float]]) -> Dict[Hashable, Hashable]:
+    """
+    Min-cost maximum matching of riders to drivers on a sparse cost table
+    costs[rider][driver] is the pickup cost of each allowed pair. Riders are added
+    one at a time along shortest augmenting paths (Dijkstra on reduced costs, with
+    potentials keeping them non-negative). Every rider also gets a private
+    "unassigned" option priced above any real matching, so the result matches as
+    many riders as possible and, among those matchings, has the lowest total cost.
+    Returns: {rider: driver} for matched riders
+    """
+    penalty = 1.0 + sum(max(row.values()) for row in costs.values() if row)
+    costs = {rider: dict(row) for rider, row in costs.items()}
+    for rider, row in costs.items():
+        row[(_UNASSIGNED, rider)] = penalty
+
+    rider_potential: Dict[Hashable, float] = {}
+    driver_potential: Dict[Hashable, float] = {}
+    driver_of: Dict[Hashable, Hashable] = {}
+    rider_of: Dict[Hashable, Hashable] = {}
+
+    for source in costs:
+        rider_potential.setdefault(source, 0.0)
+        rider_dist = {source: 0.0}
+        driver_dist: Dict[Hashable, float] = {}
+        came_from: Dict[Hashable, Hashable] = {}  # driver -> rider that reached it
+        settled_drivers = []
+        pq: List[Tuple[float, int, Hashable]] = []
+        counter = 0
+        done = set()
+
+        def relax(rider):
+            nonlocal counter
+            base = rider_dist[rider] - rider_potential[rider]
+            for driver, cost in costs[rider].items():
+                if driver in done:
+                    continue  # Settled; rounding must not reopen it
+                nd = base + cost - driver_potential.get(driver, 0.0)
+                if nd < driver_dist.get(driver, float('inf')):
+                    driver_dist[driver] = nd
+                    came_from[driver] = rider
+                    counter += 1
+                    heapq.heappush(pq, (nd, counter, driver))
+
+        relax(source)
+        free_driver, delta = None, 0.0
+        while pq:
+            d, _, driver = heapq.heappop(pq)
+            if driver in done or d > driver_dist[driver]:
+                continue
+            done.add(driver)
+            if driver not in rider_of:
+                free_driver, delta = driver, d
+                break
+            settled_drivers.append(driver)
+            rider = rider_of[driver]
+            rider_dist[rider] = d
+            rider_potential.setdefault(rider, 0.0)
+            relax(rider)
+
+        if free_driver is None:
+            continue  # No augmenting path: this rider cannot be matched
+
+        # Keep reduced costs non-negative and matched edges tight
+        for rider, dist in rider_dist.items():
+            rider_potential[rider] += delta - dist
+        for driver in settled_drivers:
+            driver_potential[driver] = driver_potential.get(driver, 0.0) - (delta - driver_dist[driver])
+
+        driver = free_driver
+        while True:
+            rider = came_from[driver]
+            previous = driver_of.get(rider)
+            driver_of[rider] = driver
+            rider_of[driver] = rider
+            if rider == source:
+                break
+            driver = previous
+
+    return {rider: driver for rider, driver in driver_of.items()
+            if not (isinstance(driver, tuple) and driver and driver[0] is _UNASSIGNED)}
+
+
+class DispatchWindow:
+    """
+    Collects ride requests for up to `window` seconds (or `max_batch` requests) and
+    hands each batch to a dispatch function; callers wait on a Future for their result
+    """
+
+    def __init__(self, dispatch: Callable[[List[Tuple[int, int]]], List[Dict]],
+                 window: float = 0.5, max_batch: int = 1000):
+        self.dispatch = dispatch
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Tuple[int, int], Future]] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, pickup_node: int, dropoff_node: int) -> Future:
+        """Queue a request for the next batch"""
+        future: Future = Future()
+        with self._lock:
+            self._pending.append(((pickup_node, dropoff_node), future))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='dispatch-window', daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.max_batch:
+                self._wakeup.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[Tuple[int, int], Future]]):
+        try:
+            results = self.dispatch([request for request, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
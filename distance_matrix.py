@@ -0,0 +1,248 @@
+"""
+Precomputed all-pairs distance matrix for RideX
+
+For small and medium maps every shortest-path query becomes a table lookup.
+Distances and next hops live in one memory-mapped file, so every worker process
+shares the same pages instead of holding its own copy.
+
+File layout (native endianness):
+    magic 'RIDEXDM1' | int64 N | 16-byte graph fingerprint | int64 nodes[N]
+    | float64 dist[N * N] | int32 next_hop[N * N]
+"""
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+from array import array
+from typing import List, Dict, Tuple, Iterable, Optional, TYPE_CHECKING
+
+from graph_engine import INF, CSRGraph, InProcessGraphAlgorithms
+
+if TYPE_CHECKING:
+    from city_map import Graph
+
+_MAGIC = b'RIDEXDM1'
+_HEADER = struct.Struct('<8sq16s')
+
+
+def _row(csr: CSRGraph, source: int) -> Tuple[bytes, bytes]:
+    """Distances and first hops from one source index"""
+    dist, parent = InProcessGraphAlgorithms._dijkstra_indices(csr, source, -1)
+    n = len(csr)
+    first_hop = array('i', [-1]) * n
+    first_hop[source] = source
+    # A node inherits its parent's first hop. Walk up to the nearest node that has one
+    # rather than trusting distance order, which zero-weight roads make ambiguous.
+    for v in range(n):
+        if dist[v] == INF:
+            continue
+        chain = []
+        u = v
+        while first_hop[u] == -1:
+            chain.append(u)
+            u = parent[u]
+        hop = chain[-1] if u == source and chain else first_hop[u]
+        for u in chain:
+            first_hop[u] = hop
+    return array('d', [d if d != INF else float('inf') for d in dist]).tobytes(), first_hop.tobytes()
+
+
+_worker_csr: Optional[CSRGraph] = None
+
+
+def _init_worker(csr: CSRGraph):
+    global _worker_csr
+    _worker_csr = csr
+
+
+def _worker_row(source: int) -> Tuple[int, bytes, bytes]:
+    return (source,) + _row(_worker_csr, source)
+
+
+class DistanceMatrix:
+    """Read-only view over a distance matrix file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, fingerprint = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a RideX distance matrix")
+        self.n = n
+        self.fingerprint = fingerprint.hex()
+        view = memoryview(self._mm)
+        offset = _HEADER.size
+        self.nodes = view[offset:offset + 8 * n].cast('q')
+        offset += 8 * n
+        self.dist = view[offset:offset + 8 * n * n].cast('d')
+        offset += 8 * n * n
+        self.next_hop = view[offset:offset + 4 * n * n].cast('i')
+        self.node_to_idx: Dict[int, int] = {node: i for i, node in enumerate(self.nodes)}
+        self._matched: Tuple[int, int] = (-1, -1)
+
+    @classmethod
+    def build(cls, graph: 'Graph', path: str, processes: Optional[int] = None) -> 'DistanceMatrix':
+        """
+        Run Dijkstra from every node (in parallel worker processes) and write the file
+        The file is written next to path and renamed into place, so readers never see
+        a half-built matrix.
+        """
+        csr = graph.snapshot()
+        n = len(csr)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        size = _HEADER.size + 8 * n + 12 * n * n
+        with open(tmp_path, 'wb+') as f:
+            f.truncate(size)
+            mm = mmap.mmap(f.fileno(), size)
+            _HEADER.pack_into(mm, 0, _MAGIC, n, bytes.fromhex(csr.fingerprint))
+            offset = _HEADER.size
+            mm[offset:offset + 8 * n] = array('q', csr.nodes).tobytes()
+            dist_offset = offset + 8 * n
+            hop_offset = dist_offset + 8 * n * n
+
+            def store(source: int, dist_row: bytes, hop_row: bytes):
+                mm[dist_offset + 8 * n * source:dist_offset + 8 * n * (source + 1)] = dist_row
+                mm[hop_offset + 4 * n * source:hop_offset + 4 * n * (source + 1)] = hop_row
+
+            if processes == 1 or n < 200:
+                for source in range(n):
+                    store(source, *_row(csr, source))
+            else:
+                # Spawned, not forked: builds run on a background thread of a threaded server,
+                # and a fork could copy locks other threads are holding
+                context = multiprocessing.get_context('spawn')
+                with context.Pool(processes, initializer=_init_worker, initargs=(csr,)) as pool:
+                    for row in pool.imap_unordered(_worker_row, range(n), chunksize=max(1, n // 64)):
+                        store(*row)
+            mm.flush()
+            mm.close()
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def matches(self, graph: 'Graph') -> bool:
+        """Whether the matrix was built from the graph's current content"""
+        key = (id(graph), graph.version)
+        if key == self._matched:
+            return True
+        if graph.snapshot().fingerprint != self.fingerprint:
+            return False
+        self._matched = key
+        return True
+
+    def distance(self, start: int, end: int) -> float:
+        s, t = self.node_to_idx.get(start), self.node_to_idx.get(end)
+        if s is None or t is None:
+            return float('inf')
+        return self.dist[s * self.n + t]
+
+    def _path_indices(self, s: int, t: int) -> List[int]:
+        """Follow next hops from s to t"""
+        n, next_hop = self.n, self.next_hop
+        path = [s]
+        v = s
+        while v != t and len(path) <= n:
+            v = next_hop[v * n + t]
+            if v < 0:
+                return []
+            path.append(v)
+        return path if v == t else []
+
+    def shortest_path(self, start: int, end: int) -> Tuple[List[int], float]:
+        """Table lookup for the distance, path rebuilt from the next-hop table"""
+        s, t = self.node_to_idx.get(start), self.node_to_idx.get(end)
+        if s is None or t is None:
+            return [], float('inf')
+        distance = self.dist[s * self.n + t]
+        if distance == float('inf'):
+            return [], float('inf')
+        return [self.nodes[i] for i in self._path_indices(s, t)], distance
+
+    def one_to_many(self, start: int, targets: Iterable[int],
+                    limit: Optional[int] = None) -> Dict[int, Tuple[List[int], float]]:
+        """Same contract as dijkstra_one_to_many, answered from one matrix row"""
+        s = self.node_to_idx.get(start)
+        if s is None:
+            return {}
+        counts: Dict[int, int] = {}
+        for target in targets:
+            if target in self.node_to_idx:
+                counts[target] = counts.get(target, 0) + 1
+        row = s * self.n
+        reachable = sorted((self.dist[row + self.node_to_idx[t]], t) for t in counts)
+        results = {}
+        found = 0
+        for distance, target in reachable:
+            if distance == float('inf'):
+                break
+            results[target] = ([self.nodes[i] for i in self._path_indices(s, self.node_to_idx[target])], distance)
+            found += counts[target]
+            if limit is not None and found >= limit:
+                break
+        return results
+
+
+class SharedDistanceMatrix:
+    """
+    Keeps the matrix file at `path` in step with a graph
+    Reopens the file when another process has rebuilt it for the current map, and
+    otherwise rebuilds it in a background thread; until then matches() is False and
+    callers fall back to regular searches.
+    """
+
+    def __init__(self, path: str, max_nodes: int = 5000, processes: Optional[int] = None):
+        self.path = path
+        self.max_nodes = max_nodes
+        self.processes = processes
+        self.matrix: Optional[DistanceMatrix] = None
+        self._building: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._seen_file: Optional[Tuple[int, int]] = None  # (inode, mtime) of the last file opened
+
+    def _rebuild(self, graph: 'Graph'):
+        try:
+            matrix = DistanceMatrix.build(graph, self.path, self.processes)
+            if matrix.matches(graph):
+                self.matrix = matrix
+        finally:
+            self._building = None
+
+    def matches(self, graph: 'Graph') -> bool:
+        matrix = self.matrix
+        if matrix is not None and matrix.matches(graph):
+            return True
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+                seen = (stat.st_ino, stat.st_mtime_ns)
+            except OSError:
+                seen = None
+            if seen is not None and seen != self._seen_file:
+                # A new file appeared (possibly from another worker): attach if it fits this map
+                self._seen_file = seen
+                try:
+                    matrix = DistanceMatrix(self.path)
+                except (OSError, ValueError):
+                    matrix = None
+                if matrix is not None and matrix.matches(graph):
+                    self.matrix = matrix
+                    return True
+            if len(graph.nodes) <= self.max_nodes and self._building is None:
+                self._building = threading.Thread(target=self._rebuild, args=(graph,),
+                                                  name='distance-matrix-build', daemon=True)
+                self._building.start()
+        return False
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until a running rebuild finishes"""
+        building = self._building
+        if building is not None:
+            building.join(timeout)
+
+    def shortest_path(self, start: int, end: int) -> Tuple[List[int], float]:
+        return self.matrix.shortest_path(start, end)
+
+    def one_to_many(self, start: int, targets: Iterable[int],
+                    limit: Optional[int] = None) -> Dict[int, Tuple[List[int], float]]:
+        return self.matrix.one_to_many(start, targets, limit)
@@ -0,0 +1,185 @@
+"""
+Streaming driver-position feed for RideX
+
+A background thread collects driver changes from the DriverManager once per
+tick, so a driver that moves several times within a tick is sent once, in its
+latest state. Each frame is encoded once per distinct viewport and handed to
+subscribers as ready-made bytes. Frames are server-sent events:
+
+    event: snapshot  data: {"version": v, "fields": [...], "drivers": [[...], ...]}
+    event: delta     data: {"version": v, "fields": [...], "drivers": [[...], ...], "removed": [id, ...]}
+
+A delta carries drivers added or changed inside the viewport; "removed" lists
+drivers that left it. Deltas no newer than the snapshot a client was sent are
+skipped. A subscriber that falls too far behind has its queued frames replaced
+by a resync marker and is sent a fresh snapshot straight away.
+
+Each open stream occupies one server thread for as long as the client stays
+connected (stream() is a blocking generator). With a threaded WSGI server the
+number of concurrent viewers is therefore capped by its thread count; size the
+pool for them, or serve the feed from a separate process.
+"""
+import json
+import queue
+import threading
+import time
+from typing import List, Dict, Tuple, Set, Iterator, Optional, TYPE_CHECKING
+
+from metrics import METRICS
+
+if TYPE_CHECKING:
+    from city_map import Driver, DriverManager
+
+FIELDS = ['id', 'node', 'lon', 'lat', 'available', 'car_type']
+
+# (min_lon, min_lat, max_lon, max_lat)
+BBox = Tuple[float, float, float, float]
+
+
+def _inside(bbox: Optional[BBox], lon: float, lat: float) -> bool:
+    return bbox is None or (bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3])
+
+
+def _event(name: str, version: int, payload: Dict) -> bytes:
+    return f"event: {name}\nid: {version}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+
+
+# Queued in place of dropped frames: the client needs a new snapshot
+_RESYNC: Tuple[int, bytes] = (-1, b'')
+
+
+class Subscription:
+    """One client's queue of (version, encoded frame)"""
+
+    def __init__(self, bbox: Optional[BBox], max_pending: int):
+        self.bbox = bbox
+        self._frames: "queue.Queue[Tuple[int, bytes]]" = queue.Queue(max_pending)
+
+    def push(self, version: int, frame: bytes):
+        """Queue a frame; on overflow, drop everything queued and wake the reader with _RESYNC"""
+        try:
+            self._frames.put_nowait((version, frame))
+        except queue.Full:
+            while True:
+                try:
+                    self._frames.get_nowait()
+                except queue.Empty:
+                    break
+            self._frames.put_nowait(_RESYNC)  # Only the feed thread pushes, so there is room now
+
+    def next(self, timeout: float) -> Optional[Tuple[int, bytes]]:
+        """Next (version, frame) or _RESYNC, or None if nothing arrived within timeout"""
+        try:
+            return self._frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class DriverFeed:
+    """Driver location/availability deltas fanned out to streaming subscribers"""
+
+    def __init__(self, driver_manager: 'DriverManager', tick: float = 0.5, max_pending: int = 64):
+        self.driver_manager = driver_manager
+        self.tick = tick
+        self.max_pending = max_pending
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._version = 0  # DriverManager version covered by the last frame
+        # Last published position of every driver, to tell viewports about drivers leaving them
+        self._positions: Dict[int, Tuple[float, float]] = {}
+
+    def _row(self, driver: 'Driver') -> list:
+        lon, lat = self.driver_manager.city_map.get_node_coordinates(driver.current_location)
+        return [driver.driver_id, driver.current_location, lon, lat, driver.available, driver.car_type]
+
+    def subscribe(self, bbox: Optional[BBox] = None) -> Subscription:
+        subscription = Subscription(bbox, self.max_pending)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if self._thread is None:
+                # Positions are only tracked while someone is listening
+                self._version, drivers = self.driver_manager.changes_since(0)
+                self._positions = {row[0]: (row[2], row[3]) for row in map(self._row, drivers)}
+                self._thread = threading.Thread(target=self._run, name='driver-feed', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def snapshot(self, bbox: Optional[BBox] = None) -> bytes:
+        """Snapshot event with every driver inside bbox"""
+        return self._snapshot(bbox)[1]
+
+    def _snapshot(self, bbox: Optional[BBox]) -> Tuple[int, bytes]:
+        version, drivers = self.driver_manager.changes_since(0)
+        rows = [row for row in map(self._row, drivers) if _inside(bbox, row[2], row[3])]
+        return version, _event('snapshot', version, {'version': version, 'fields': FIELDS, 'drivers': rows})
+
+    def stream(self, bbox: Optional[BBox] = None, keepalive: float = 15.0) -> Iterator[bytes]:
+        """
+        Server-sent event stream: a snapshot, then deltas every tick with changes in view
+        Blocks its (WSGI) thread for as long as the client stays connected.
+        """
+        subscription = self.subscribe(bbox)
+        METRICS.count('feed.subscriptions')
+        try:
+            version, frame = self._snapshot(bbox)
+            yield frame
+            while True:
+                item = subscription.next(keepalive)
+                if item is None:
+                    yield b": keepalive\n\n"
+                elif item is _RESYNC:
+                    METRICS.count('feed.resyncs')
+                    version, frame = self._snapshot(bbox)
+                    yield frame
+                elif item[0] > version:
+                    # Older deltas were read before the snapshot and would roll drivers back
+                    version, frame = item
+                    yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            with self._lock:
+                if not self._subscriptions:
+                    self._thread = None
+                    return
+                subscriptions = list(self._subscriptions)
+            with METRICS.timer('feed.tick_ms'):
+                self.publish(subscriptions)
+
+    def publish(self, subscriptions: List[Subscription]):
+        """Send one delta frame covering the changes since the last one"""
+        version, drivers = self.driver_manager.changes_since(self._version)
+        self._version = version
+        if not drivers:
+            return
+        changes = []  # (row, previous position or None)
+        for row in map(self._row, drivers):
+            changes.append((row, self._positions.get(row[0])))
+            self._positions[row[0]] = (row[2], row[3])
+
+        by_bbox: Dict[Optional[BBox], List[Subscription]] = {}
+        for subscription in subscriptions:
+            by_bbox.setdefault(subscription.bbox, []).append(subscription)
+        for bbox, group in by_bbox.items():
+            rows, removed = [], []
+            for row, previous in changes:
+                if _inside(bbox, row[2], row[3]):
+                    rows.append(row)
+                elif previous is not None and _inside(bbox, *previous):
+                    removed.append(row[0])
+            if not rows and not removed:
+                continue
+            frame = _event('delta', version, {'version': version, 'fields': FIELDS,
+                                              'drivers': rows, 'removed': removed})
+            METRICS.count('feed.frames')
+            METRICS.count('feed.bytes', len(frame) * len(group))
+            for subscription in group:
+                subscription.push(version, frame)
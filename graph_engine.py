@@ -0,0 +1,611 @@
+"""
+In-process graph engine for RideX
+
+Pure Python counterparts of the algorithms in graph_solver.cpp, running over a
+compact array-backed (CSR) adjacency instead of a solver subprocess. Neighbour
+order and tie-breaking follow the C++ solver so both backends return the same
+paths, trees and orderings.
+"""
+import copy
+import hashlib
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import deque
+from collections import Counter
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional, Callable, Sequence, Mapping, TYPE_CHECKING
+
+from metrics import METRICS
+
+if TYPE_CHECKING:
+    from city_map import Graph
+
+INF = 1e18  # Same "infinite" distance sentinel as graph_solver.cpp
+
+# heuristic(node, target): lower bound on the road distance between two node IDs
+Heuristic = Callable[[int, int], float]
+
+
+class SortedNodeIndex(Mapping):
+    """Read-only {node: index} over a sorted node column: binary search instead of a dict per process"""
+
+    def __init__(self, nodes: Sequence[int]):
+        self.nodes = nodes
+
+    def __getitem__(self, node: int) -> int:
+        try:
+            i = bisect_left(self.nodes, node)
+        except TypeError:
+            raise KeyError(node) from None
+        if i == len(self.nodes) or self.nodes[i] != node:
+            raise KeyError(node)
+        return i
+
+    def __contains__(self, node) -> bool:
+        try:
+            self[node]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.nodes)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+class CSRGraph:
+    """Compressed sparse row adjacency: neighbours of index i live in targets[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, nodes: List[int], edges: List[Tuple[int, int, float]], directed: bool = False,
+                 version: int = 0, node_to_idx: Optional[Mapping[int, int]] = None):
+        self.nodes = nodes
+        self.version = version
+        self._solver_input: Optional[str] = None
+        self._fingerprint: Optional[str] = None
+        if node_to_idx is None:
+            node_to_idx = {node: i for i, node in enumerate(nodes)}
+        self.node_to_idx: Mapping[int, int] = node_to_idx
+        self._edges: Optional[List[Tuple[int, int, float]]] = edges
+        self._edge_columns: Optional[Tuple[Sequence[int], Sequence[int], Sequence[float]]] = None
+        self._edge_ids: Optional[array] = None
+        self.directed = directed
+
+        n = len(nodes)
+        degree = [0] * (n + 1)
+        for u, v, _ in edges:
+            degree[u + 1] += 1
+            if not directed:
+                degree[v + 1] += 1
+        for i in range(n):
+            degree[i + 1] += degree[i]
+
+        # Fill in edge order so each node keeps the neighbour order graph_solver.cpp builds
+        self.offsets = array('i', degree)
+        self.targets = array('i', [0]) * degree[n]
+        self.weights = array('d', [0.0]) * degree[n]
+        cursor = degree[:n]
+        for u, v, w in edges:
+            pos = cursor[u]
+            self.targets[pos] = v
+            self.weights[pos] = w
+            cursor[u] = pos + 1
+            if not directed:
+                pos = cursor[v]
+                self.targets[pos] = u
+                self.weights[pos] = w
+                cursor[v] = pos + 1
+
+    @classmethod
+    def from_graph(cls, graph: 'Graph') -> 'CSRGraph':
+        """Build the undirected CSR view of a Graph (same edge order as the solver input)"""
+        nodes = sorted(graph.nodes)
+        node_to_idx = {node: i for i, node in enumerate(nodes)}
+        edges = []
+        for u, neighbors in graph.adjacency_list.items():
+            iu = node_to_idx[u]
+            for v, weight in neighbors:
+                if u < v:  # Avoid duplicates for undirected
+                    edges.append((iu, node_to_idx[v], weight))
+        return cls(nodes, edges, version=graph.version, node_to_idx=node_to_idx)
+
+    @classmethod
+    def from_arrays(cls, nodes: Sequence[int], offsets: Sequence[int], targets: Sequence[int],
+                    weights: Sequence[float], edge_columns: Tuple[Sequence[int], Sequence[int], Sequence[float]],
+                    version: int = 0, fingerprint: Optional[str] = None) -> 'CSRGraph':
+        """
+        Wrap existing undirected CSR arrays (e.g. memoryviews over shared memory) without copying
+        nodes must be sorted: node lookups binary-search it rather than building a dict.
+        edge_columns holds the edge list as (u, v, w) columns; the tuple list is only built
+        if something asks for edges.
+        """
+        csr = cls.__new__(cls)
+        csr.nodes = nodes
+        csr.version = version
+        csr._solver_input = None
+        csr._fingerprint = fingerprint
+        csr.node_to_idx = SortedNodeIndex(nodes)
+        csr._edges = None
+        csr._edge_columns = edge_columns
+        csr._edge_ids = None
+        csr.directed = False
+        csr.offsets = offsets
+        csr.targets = targets
+        csr.weights = weights
+        return csr
+
+    @property
+    def edges(self) -> List[Tuple[int, int, float]]:
+        """(u, v, w) index triples in insertion order"""
+        if self._edges is None:
+            self._edges = list(zip(*self._edge_columns))
+        return self._edges
+
+    def edge_columns(self) -> Tuple[Sequence[int], Sequence[int], Sequence[float]]:
+        """Edge list as separate u, v, w columns"""
+        if self._edge_columns is None:
+            self._edge_columns = (array('i', [u for u, _, _ in self._edges]),
+                                  array('i', [v for _, v, _ in self._edges]),
+                                  array('d', [w for _, _, w in self._edges]))
+        return self._edge_columns
+
+    def edge_weight(self, u: int, v: int) -> float:
+        """Weight of the shortest u-v road (node IDs), INF if there is none"""
+        iu, iv = self.node_to_idx.get(u), self.node_to_idx.get(v)
+        if iu is None or iv is None:
+            return INF
+        targets, weights = self.targets, self.weights
+        return min((weights[i] for i in range(self.offsets[iu], self.offsets[iu + 1]) if targets[i] == iv),
+                   default=INF)
+
+    def _slot_edge_ids(self) -> array:
+        """Edge-list index behind every adjacency slot, replaying the fill order of __init__"""
+        if self._edge_ids is None:
+            n = len(self.nodes)
+            edge_ids = array('i', [0]) * len(self.targets)
+            cursor = list(self.offsets[:n])
+            edge_u, edge_v, _ = self.edge_columns()
+            for e, (u, v) in enumerate(zip(edge_u, edge_v)):
+                edge_ids[cursor[u]] = e
+                cursor[u] += 1
+                edge_ids[cursor[v]] = e
+                cursor[v] += 1
+            self._edge_ids = edge_ids
+        return self._edge_ids
+
+    def reweighted(self, updates: List[Tuple[int, int, float]], version: int) -> 'CSRGraph':
+        """
+        Copy with new weights for existing u-v roads (node IDs); topology arrays are shared
+        Cheaper than a rebuild: only the weight columns are copied.
+        """
+        edge_ids = self._slot_edge_ids()
+        edge_u, edge_v, edge_w = self.edge_columns()
+        weights = array('d', self.weights)
+        edge_w = array('d', edge_w)
+        offsets, targets = self.offsets, self.targets
+        for u, v, weight in updates:
+            iu, iv = self.node_to_idx[u], self.node_to_idx[v]
+            for a, b in ((iu, iv), (iv, iu)):
+                for i in range(offsets[a], offsets[a + 1]):
+                    if targets[i] == b:
+                        weights[i] = weight
+                        edge_w[edge_ids[i]] = weight
+
+        csr = copy.copy(self)
+        csr.version = version
+        csr.weights = weights
+        csr._edges = None
+        csr._edge_columns = (edge_u, edge_v, edge_w)
+        csr._solver_input = None
+        csr._fingerprint = None
+        return csr
+
+    def __getstate__(self) -> Dict:
+        # Memoryviews over shared buffers can't be pickled: send plain arrays instead.
+        # Edges travel as columns, which pickle as raw bytes rather than one tuple per edge.
+        state = dict(self.__dict__)
+        state['_edge_columns'] = self.edge_columns()
+        state['_edges'] = None
+        for name in ('nodes', 'offsets', 'targets', 'weights'):
+            if isinstance(state[name], memoryview):
+                state[name] = array(state[name].format, state[name])
+        if isinstance(state['node_to_idx'], SortedNodeIndex):
+            state['node_to_idx'] = SortedNodeIndex(state['nodes'])
+        if state['_edge_columns'] is not None:
+            state['_edge_columns'] = tuple(array(column.format, column) if isinstance(column, memoryview) else column
+                                           for column in state['_edge_columns'])
+        return state
+
+    @property
+    def solver_input(self) -> str:
+        """graph_solver text input (N M, then one 'u v w' line per edge), built once"""
+        if self._solver_input is None:
+            lines = [f"{len(self.nodes)} {len(self.edges)}\n"]
+            lines.extend(f"{u} {v} {w}\n" for u, v, w in self.edges)
+            self._solver_input = "".join(lines)
+        return self._solver_input
+
+    @property
+    def fingerprint(self) -> str:
+        """Content hash of nodes and adjacency; stable across processes, unlike version"""
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(array('q', self.nodes).tobytes())
+            digest.update(self.offsets.tobytes())
+            digest.update(self.targets.tobytes())
+            digest.update(self.weights.tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+class InProcessGraphAlgorithms:
+    """Graph algorithms for RideX running in-process over CSR arrays"""
+
+    @staticmethod
+    def _dijkstra_indices(csr: CSRGraph, start: int, end: int) -> Tuple[List[float], List[int]]:
+        """Dijkstra over CSR indices, stopping once end is settled"""
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        dist = [INF] * len(csr)
+        parent = [-1] * len(csr)
+        dist[start] = 0.0
+        pq = [(0.0, start)]
+        settled = 0
+
+        while pq:
+            d, u = heapq.heappop(pq)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if u == end:
+                break
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                nd = d + weights[i]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(pq, (nd, v))
+        METRICS.observe('search.dijkstra.settled', settled)
+        return dist, parent
+
+    @staticmethod
+    def _path_from_parents(csr: CSRGraph, parent: List[int], end: int) -> List[int]:
+        """Node IDs from the search root to end, following parent indices"""
+        path = []
+        v = end
+        while v != -1:
+            path.append(csr.nodes[v])
+            v = parent[v]
+        path.reverse()
+        return path
+
+    @staticmethod
+    def dijkstra(graph: 'Graph', start: int, end: int) -> Tuple[List[int], float]:
+        """Dijkstra's algorithm"""
+        if start not in graph.nodes or end not in graph.nodes:
+            return [], float('inf')
+
+        csr = graph.snapshot()
+        end_idx = csr.node_to_idx[end]
+        dist, parent = InProcessGraphAlgorithms._dijkstra_indices(csr, csr.node_to_idx[start], end_idx)
+        if dist[end_idx] == INF:
+            return [], float('inf')
+        return InProcessGraphAlgorithms._path_from_parents(csr, parent, end_idx), dist[end_idx]
+
+    @staticmethod
+    def dijkstra_one_to_many(graph: 'Graph', start: int, targets: Iterable[int],
+                             limit: Optional[int] = None) -> Dict[int, Tuple[List[int], float]]:
+        """
+        Single-source Dijkstra from start towards many targets
+        Targets may repeat (e.g. several drivers on one node); each copy counts towards limit.
+        Returns: {target: (path from start, distance)} in order of increasing distance
+        """
+        if start not in graph.nodes:
+            return {}
+
+        csr = graph.snapshot()
+        node_to_idx = csr.node_to_idx
+        wanted = Counter(node_to_idx[t] for t in targets if t in node_to_idx)
+        if not wanted:
+            return {}
+
+        offsets, targets_arr, weights = csr.offsets, csr.targets, csr.weights
+        dist = [INF] * len(csr)
+        parent = [-1] * len(csr)
+        start_idx = node_to_idx[start]
+        dist[start_idx] = 0.0
+        pq = [(0.0, start_idx)]
+        found = 0
+        settled = 0
+        results = {}
+
+        while pq:
+            d, u = heapq.heappop(pq)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if u in wanted:
+                results[csr.nodes[u]] = (InProcessGraphAlgorithms._path_from_parents(csr, parent, u), d)
+                found += wanted[u]
+                if (limit is not None and found >= limit) or len(results) == len(wanted):
+                    break
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets_arr[i]
+                nd = d + weights[i]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(pq, (nd, v))
+        METRICS.observe('search.one_to_many.settled', settled)
+        return results
+
+    @staticmethod
+    def astar(graph: 'Graph', start: int, end: int, heuristic: Heuristic) -> Tuple[List[int], float]:
+        """
+        A* search guided by an admissible, consistent heuristic
+        Returns the same distance as dijkstra while settling only nodes that look promising.
+        """
+        if start not in graph.nodes or end not in graph.nodes:
+            return [], float('inf')
+
+        csr = graph.snapshot()
+        offsets, targets, weights, nodes = csr.offsets, csr.targets, csr.weights, csr.nodes
+        start_idx, end_idx = csr.node_to_idx[start], csr.node_to_idx[end]
+        dist = [INF] * len(csr)
+        parent = [-1] * len(csr)
+        estimate: Dict[int, float] = {}
+        dist[start_idx] = 0.0
+        pq = [(heuristic(start, end), 0.0, start_idx)]
+        settled = 0
+
+        while pq:
+            _, d, u = heapq.heappop(pq)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if u == end_idx:
+                break
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                nd = d + weights[i]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    parent[v] = u
+                    h = estimate.get(v)
+                    if h is None:
+                        h = estimate[v] = heuristic(nodes[v], end)
+                    heapq.heappush(pq, (nd + h, nd, v))
+        METRICS.observe('search.astar.settled', settled)
+
+        if dist[end_idx] == INF:
+            return [], float('inf')
+        return InProcessGraphAlgorithms._path_from_parents(csr, parent, end_idx), dist[end_idx]
+
+    @staticmethod
+    def bidirectional_astar(graph: 'Graph', start: int, end: int, heuristic: Heuristic) -> Tuple[List[int], float]:
+        """
+        Bidirectional A* with averaged potentials p(v) = (h(v, end) - h(v, start)) / 2
+        Both searches then see consistent reduced costs, so they can stop as soon as the
+        two queue minima together reach the best meeting distance found so far.
+        """
+        if start not in graph.nodes or end not in graph.nodes:
+            return [], float('inf')
+        if start == end:
+            return [start], 0.0
+
+        csr = graph.snapshot()
+        offsets, targets, weights, nodes = csr.offsets, csr.targets, csr.weights, csr.nodes
+        start_idx, end_idx = csr.node_to_idx[start], csr.node_to_idx[end]
+        potential: Dict[int, float] = {}
+
+        def p(v: int) -> float:
+            value = potential.get(v)
+            if value is None:
+                node = nodes[v]
+                value = (heuristic(node, end) - heuristic(node, start)) / 2
+                potential[v] = value
+            return value
+
+        # Index 0: forward from start with potential p, index 1: backward from end with -p
+        dist = ({start_idx: 0.0}, {end_idx: 0.0})
+        parent = ({start_idx: -1}, {end_idx: -1})
+        settled = (set(), set())
+        queues = ([(p(start_idx), start_idx)], [(-p(end_idx), end_idx)])
+        best, meet = INF, -1
+
+        while queues[0] and queues[1]:
+            if queues[0][0][0] + queues[1][0][0] >= best:
+                break
+            side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+            sign = 1 if side == 0 else -1
+            _, u = heapq.heappop(queues[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+            d = dist[side][u]
+            own, other = dist[side], dist[1 - side]
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                nd = d + weights[i]
+                if nd < own.get(v, INF):
+                    own[v] = nd
+                    parent[side][v] = u
+                    heapq.heappush(queues[side], (nd + sign * p(v), v))
+                if v in other and nd + other[v] < best:
+                    best, meet = nd + other[v], v
+
+        METRICS.observe('search.bidirectional_astar.settled', len(settled[0]) + len(settled[1]))
+        if meet == -1:
+            return [], float('inf')
+
+        path = []
+        v = meet
+        while v != -1:
+            path.append(v)
+            v = parent[0][v]
+        path.reverse()
+        v = parent[1][meet]
+        while v != -1:
+            path.append(v)
+            v = parent[1][v]
+
+        # Re-sum along the path from start so the distance matches dijkstra bit for bit
+        distance = 0.0
+        for a, b in zip(path, path[1:]):
+            distance += min(weights[i] for i in range(offsets[a], offsets[a + 1]) if targets[i] == b)
+        return [nodes[v] for v in path], distance
+
+    @staticmethod
+    def _prim_indices(csr: CSRGraph) -> List[Tuple[int, int, float]]:
+        """Prim's algorithm from index 0 over CSR indices"""
+        n = len(csr)
+        if n == 0:
+            return []
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        key = [INF] * n
+        parent = [-1] * n
+        in_mst = [False] * n
+        key[0] = 0.0
+        pq = [(0.0, 0)]
+        tree = []
+
+        while pq:
+            _, u = heapq.heappop(pq)
+            if in_mst[u]:
+                continue
+            in_mst[u] = True
+            if parent[u] != -1:
+                tree.append((parent[u], u, key[u]))
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                w = weights[i]
+                if not in_mst[v] and w < key[v]:
+                    key[v] = w
+                    parent[v] = u
+                    heapq.heappush(pq, (w, v))
+        return tree
+
+    @staticmethod
+    def prim_mst(graph: 'Graph') -> List[Tuple[int, int, float]]:
+        """Prim's algorithm"""
+        csr = graph.snapshot()
+        nodes = csr.nodes
+        return [(nodes[u], nodes[v], w) for u, v, w in InProcessGraphAlgorithms._prim_indices(csr)]
+
+    @staticmethod
+    def _kruskal_indices(csr: CSRGraph) -> List[Tuple[int, int, float]]:
+        """Kruskal's algorithm with a path-compressing disjoint set"""
+        parent = list(range(len(csr)))
+
+        def find(i: int) -> int:
+            root = i
+            while parent[root] != root:
+                root = parent[root]
+            while parent[i] != root:
+                parent[i], i = root, parent[i]
+            return root
+
+        tree = []
+        # Ties broken by endpoints, like the C++ solver, so both backends pick the same tree
+        for u, v, w in sorted(csr.edges, key=lambda edge: (edge[2], edge[0], edge[1])):
+            root_u, root_v = find(u), find(v)
+            if root_u != root_v:
+                parent[root_u] = root_v
+                tree.append((u, v, w))
+        return tree
+
+    @staticmethod
+    def kruskal_mst(graph: 'Graph') -> List[Tuple[int, int, float]]:
+        """Kruskal's algorithm"""
+        csr = graph.snapshot()
+        nodes = csr.nodes
+        return [(nodes[u], nodes[v], w) for u, v, w in InProcessGraphAlgorithms._kruskal_indices(csr)]
+
+    @staticmethod
+    def topological_sort(dependencies: Dict[str, List[str]]) -> List[str]:
+        """Topological sort (Kahn's algorithm)"""
+        tasks = sorted(dependencies.keys())
+        task_to_idx = {task: i for i, task in enumerate(tasks)}
+        edges = []
+        for task, prereqs in dependencies.items():
+            for prereq in prereqs:
+                if prereq in task_to_idx:
+                    # prereq -> task
+                    edges.append((task_to_idx[prereq], task_to_idx[task], 1.0))
+        csr = CSRGraph(tasks, edges, directed=True)
+
+        in_degree = [0] * len(tasks)
+        for v in csr.targets:
+            in_degree[v] += 1
+
+        queue = deque(i for i in range(len(tasks)) if in_degree[i] == 0)
+        result = []
+        while queue:
+            u = queue.popleft()
+            result.append(u)
+            for i in range(csr.offsets[u], csr.offsets[u + 1]):
+                v = csr.targets[i]
+                in_degree[v] -= 1
+                if in_degree[v] == 0:
+                    queue.append(v)
+
+        if len(result) != len(tasks):
+            return []
+        return [tasks[i] for i in result]
+
+
+class IndexUnavailableError(RuntimeError):
+    """A routing index failed mid-query (e.g. a shard process died); ask the base backend instead"""
+
+
+class IndexedGraphAlgorithms:
+    """
+    Serves shortest-path queries from a preprocessed routing index while it matches the graph
+    The index must provide matches(graph), shortest_path(start, end) and
+    one_to_many(start, targets, limit). Other calls, and queries against a graph
+    the index was not built from, go to the base backend. An index may set
+    max_targets to hand one-to-many queries with more distinct targets to the base too.
+    An index that raises IndexUnavailableError has its query retried on the base; it
+    should stop matching from then on.
+    """
+
+    def __init__(self, base, index):
+        self.base = base
+        self.index = index
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+    def _shortest_path(self, graph: 'Graph', start: int, end: int,
+                       fallback: Callable[[], Tuple[List[int], float]]) -> Tuple[List[int], float]:
+        if self.index.matches(graph):
+            try:
+                return self.index.shortest_path(start, end)
+            except IndexUnavailableError:
+                pass
+        return fallback()
+
+    def dijkstra(self, graph: 'Graph', start: int, end: int) -> Tuple[List[int], float]:
+        return self._shortest_path(graph, start, end, lambda: self.base.dijkstra(graph, start, end))
+
+    def astar(self, graph: 'Graph', start: int, end: int, heuristic: Heuristic) -> Tuple[List[int], float]:
+        return self._shortest_path(graph, start, end, lambda: self.base.astar(graph, start, end, heuristic))
+
+    def bidirectional_astar(self, graph: 'Graph', start: int, end: int, heuristic: Heuristic) -> Tuple[List[int], float]:
+        return self._shortest_path(graph, start, end,
+                                   lambda: self.base.bidirectional_astar(graph, start, end, heuristic))
+
+    def dijkstra_one_to_many(self, graph: 'Graph', start: int, targets: Iterable[int],
+                             limit: Optional[int] = None) -> Dict[int, Tuple[List[int], float]]:
+        targets = list(targets)
+        max_targets = getattr(self.index, 'max_targets', None)
+        if self.index.matches(graph) and (max_targets is None or len(set(targets)) <= max_targets):
+            try:
+                return self.index.one_to_many(start, targets, limit)
+            except IndexUnavailableError:
+                pass
+        return self.base.dijkstra_one_to_many(graph, start, targets, limit)
@@ -6,6 +6,7 @@
 #include <string>
 #include <iomanip>
 #include <map>
+#include <sstream>
 
 using namespace std;
 
@@ -14,9 +15,11 @@ struct Edge {
     int u, v;
     double weight;
     
-    // For sorting in Kruskal's
+    // For sorting in Kruskal's; ties broken by endpoints so every backend picks the same tree
     bool operator<(const Edge& other) const {
-        return weight < other.weight;
+        if (weight != other.weight) return weight < other.weight;
+        if (u != other.u) return u < other.u;
+        return v < other.v;
     }
 };
 
@@ -76,7 +79,7 @@ void run_kruskal(Graph& g) {
     for (const auto& edge : g.all_edges) {
         if (dsu.find(edge.u) != dsu.find(edge.v)) {
             dsu.unite(edge.u, edge.v);
-            cout << edge.u << " " << edge.v << " " << edge.weight << endl;
+            cout << edge.u << " " << edge.v << " " << edge.weight << '\n';
         }
     }
 }
@@ -102,7 +105,7 @@ void run_prim(Graph& g) {
         inMST[u] = true;
         
         if (parent[u] != -1) {
-             cout << parent[u] << " " << u << " " << key[u] << endl;
+             cout << parent[u] << " " << u << " " << key[u] << '\n';
         }
 
         for (auto& neighbor : g.adj[u]) {
@@ -159,11 +162,62 @@ void run_dijkstra(Graph& g, int start_node, int end_node) {
     reverse(path.begin(), path.end());
 
     // Output: distance line 1, path line 2
-    cout << dist[end_node] << endl;
+    cout << dist[end_node] << '\n';
     for (size_t i = 0; i < path.size(); ++i) {
         cout << path[i] << (i == path.size() - 1 ? "" : " ");
     }
-    cout << endl;
+    cout << '\n';
+}
+
+// One-to-many Dijkstra: settle nodes from start until `limit` targets are reached.
+// targets may repeat (e.g. several drivers on one node); each copy counts towards limit.
+void run_sssp(Graph& g, int start_node, int limit, const vector<int>& targets) {
+    vector<int> wanted(g.V, 0);
+    for (int t : targets) {
+        if (t >= 0 && t < g.V) wanted[t]++;
+    }
+
+    priority_queue<pair<double, int>, vector<pair<double, int>>, greater<pair<double, int>>> pq;
+    vector<double> dist(g.V, 1e18);
+    vector<int> parent(g.V, -1);
+
+    dist[start_node] = 0;
+    pq.push({0, start_node});
+    int found = 0;
+
+    while (!pq.empty()) {
+        double d = pq.top().first;
+        int u = pq.top().second;
+        pq.pop();
+
+        if (d > dist[u]) continue;
+
+        if (wanted[u] > 0) {
+            // Output: target distance path...
+            vector<int> path;
+            for (int v = u; v != -1; v = parent[v]) {
+                path.push_back(v);
+            }
+            reverse(path.begin(), path.end());
+            cout << u << " " << dist[u];
+            for (int v : path) cout << " " << v;
+            cout << '\n';
+
+            found += wanted[u];
+            if (limit > 0 && found >= limit) break;
+        }
+
+        for (auto& neighbor : g.adj[u]) {
+            int v = neighbor.first;
+            double weight = neighbor.second;
+
+            if (dist[u] + weight < dist[v]) {
+                dist[v] = dist[u] + weight;
+                parent[v] = u;
+                pq.push({dist[v], v});
+            }
+        }
+    }
 }
 
 void run_bfs(Graph& g, int start_node, int target_node) {
@@ -196,7 +250,7 @@ void run_bfs(Graph& g, int start_node, int target_node) {
     }
 
     if (found) {
-        cout << "1" << endl; // Found
+        cout << "1" << '\n'; // Found
         vector<int> path;
         for (int v = target_node; v != -1; v = parent[v]) {
             path.push_back(v);
@@ -205,9 +259,9 @@ void run_bfs(Graph& g, int start_node, int target_node) {
         for (size_t i = 0; i < path.size(); ++i) {
             cout << path[i] << (i == path.size() - 1 ? "" : " ");
         }
-        cout << endl;
+        cout << '\n';
     } else {
-        cout << "0" << endl; // Not found
+        cout << "0" << '\n'; // Not found
     }
 }
 
@@ -241,7 +295,7 @@ void run_dfs(Graph& g, int start_node) {
     for (size_t i = 0; i < visit_order.size(); ++i) {
         cout << visit_order[i] << (i == visit_order.size() - 1 ? "" : " ");
     }
-    cout << endl;
+    cout << '\n';
 }
 
 void run_toposort(Graph& g) {
@@ -276,13 +330,94 @@ void run_toposort(Graph& g) {
 
     if (result.size() != g.V) {
         // Cycle detected or invalid
-        cout << "CYCLE" << endl;
+        cout << "CYCLE" << '\n';
     } else {
         for (size_t i = 0; i < result.size(); ++i) {
             cout << result[i] << (i == result.size() - 1 ? "" : " ");
         }
-        cout << endl;
+        cout << '\n';
+    }
+}
+
+// --- Server mode ---
+//
+// graph_solver serve
+// Loads a graph once and answers queries from stdin, one command per line:
+//   load N M [directed]      followed by M lines "u v w"; replaces the graph
+//   dijkstra S T | sssp S LIMIT K t1..tK | bfs S T | dfs S | prim | kruskal | topo
+//   sync                     flush all pending responses
+// Every load/query response is terminated by a line "END"; failures print "ERR <reason>".
+
+bool valid_node(const Graph& g, int node) {
+    return node >= 0 && node < g.V;
+}
+
+void run_server() {
+    Graph g(0);
+    string line;
+
+    while (getline(cin, line)) {
+        istringstream in(line);
+        string cmd;
+        if (!(in >> cmd)) continue;
+
+        if (cmd == "sync") {
+            cout.flush();
+            continue;
+        }
+
+        if (cmd == "load") {
+            int N, M;
+            string mode;
+            in >> N >> M >> mode;
+            g = Graph(N);
+            bool directed = (mode == "directed");
+            for (int i = 0; i < M; ++i) {
+                int u, v;
+                double w;
+                cin >> u >> v >> w;
+                if (directed) {
+                    g.add_directed_edge(u, v, w);
+                } else {
+                    g.add_edge(u, v, w);
+                }
+            }
+            getline(cin, line);  // Rest of the last edge line
+            cout << "OK" << '\n';
+        } else if (cmd == "dijkstra") {
+            int start = -1, end = -1;
+            in >> start >> end;
+            if (valid_node(g, start) && valid_node(g, end)) run_dijkstra(g, start, end);
+            else cout << "ERR bad node" << '\n';
+        } else if (cmd == "sssp") {
+            int start = -1, limit = 0, K = 0;
+            in >> start >> limit >> K;
+            vector<int> targets(max(K, 0));
+            for (int i = 0; i < K; ++i) in >> targets[i];
+            if (valid_node(g, start)) run_sssp(g, start, limit, targets);
+            else cout << "ERR bad node" << '\n';
+        } else if (cmd == "bfs") {
+            int start = -1, target = -1;
+            in >> start >> target;
+            if (valid_node(g, start) && valid_node(g, target)) run_bfs(g, start, target);
+            else cout << "ERR bad node" << '\n';
+        } else if (cmd == "dfs") {
+            int start = -1;
+            in >> start;
+            if (valid_node(g, start)) run_dfs(g, start);
+            else cout << "ERR bad node" << '\n';
+        } else if (cmd == "prim") {
+            run_prim(g);
+        } else if (cmd == "kruskal") {
+            run_kruskal(g);
+        } else if (cmd == "topo") {
+            run_toposort(g);
+        } else {
+            cout << "ERR unknown command " << cmd << '\n';
+        }
+        cout << "END" << '\n';
     }
+    cout.flush();
 }
 
 
@@ -292,11 +427,24 @@ int main(int argc, char* argv[]) {
     cin.tie(NULL);
 
     if (argc < 2) {
-        cerr << "Usage: " << argv[0] << " [prim|kruskal|dijkstra|bfs|dfs|topo] [args...]" << endl;
+        cerr << "Usage: " << argv[0] << " [prim|kruskal|dijkstra|sssp|bfs|dfs|topo|serve|modes] [args...]" << endl;
         return 1;
     }
 
     string algo = argv[1];
+
+    cout << fixed << setprecision(6);
+
+    if (algo == "modes") {
+        // Lets callers detect builds that predate a mode
+        cout << "prim kruskal dijkstra sssp bfs dfs topo serve" << endl;
+        return 0;
+    }
+
+    if (algo == "serve") {
+        run_server();
+        return 0;
+    }
     
     int N, M;
     if (!(cin >> N >> M)) return 0;
@@ -316,8 +464,6 @@ int main(int argc, char* argv[]) {
         }
     }
 
-    cout << fixed << setprecision(6);
-
     if (algo == "prim") {
         run_prim(g);
     } else if (algo == "kruskal") {
@@ -327,6 +473,16 @@ int main(int argc, char* argv[]) {
         int start = stoi(argv[2]);
         int end = stoi(argv[3]);
         run_dijkstra(g, start, end);
+    } else if (algo == "sssp") {
+        // Targets follow the edge list: K t1 t2 ... tK
+        if (argc < 4) return 1;
+        int start = stoi(argv[2]);
+        int limit = stoi(argv[3]);
+        int K = 0;
+        cin >> K;
+        vector<int> targets(K);
+        for (int i = 0; i < K; ++i) cin >> targets[i];
+        run_sssp(g, start, limit, targets);
     } else if (algo == "bfs") {
         if (argc < 4) return 1;
         int start = stoi(argv[2]);
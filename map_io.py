@@ -0,0 +1,144 @@
+"""
+Road network import/export for RideX
+
+Large maps come from CSV files (nodes: node_id,lon,lat; edges: u,v[,weight_km];
+weights are never shorter than the straight-line distance between the ends)
+and are stored in a compact binary format that loads with a few bulk reads:
+
+    magic 'RIDEXMP1' | int64 N | int64 M
+    | int64 nodes[N] | float64 lon[N] | float64 lat[N]   (nodes sorted by ID)
+    | int32 edge_u[M] | int32 edge_v[M] | float64 edge_w[M]   (node indices)
+    | int32 offsets[N + 1] | int32 targets[2M] | float64 weights[2M]   (CSR adjacency)
+"""
+import csv
+import logging
+import struct
+from array import array
+from typing import Tuple, Iterator, Mapping
+
+from graph_engine import CSRGraph
+from spatial_index import haversine_many
+
+logger = logging.getLogger(__name__)
+_MAGIC = b'RIDEXMP1'
+_HEADER = struct.Struct('<8sqq')
+
+
+class NodePositions(Mapping):
+    """Read-only {node: (lon, lat)} view over coordinate columns, without a tuple per node"""
+
+    def __init__(self, node_to_idx: Mapping[int, int], lon: array, lat: array):
+        self._node_to_idx = node_to_idx
+        self._lon = lon
+        self._lat = lat
+
+    def __getitem__(self, node: int) -> Tuple[float, float]:
+        i = self._node_to_idx[node]
+        return (self._lon[i], self._lat[i])
+
+    def __contains__(self, node) -> bool:
+        return node in self._node_to_idx
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._node_to_idx)
+
+    def __len__(self) -> int:
+        return len(self._node_to_idx)
+
+
+def read_csv(nodes_path: str, edges_path: str) -> Tuple[CSRGraph, NodePositions]:
+    """
+    Road graph and node positions from CSV files with header rows
+    Edges without a weight_km column (or with it empty) are weighted by the haversine
+    distance between their ends, computed in one vectorized pass. A weight_km shorter
+    than that distance is raised to it (A*, driver pruning and the route cache all rely
+    on straight-line distance never exceeding the road length), and the number of roads
+    raised is logged as a warning.
+    """
+    with open(nodes_path, newline='') as f:
+        rows = sorted((int(row[0]), float(row[1]), float(row[2])) for row in _data_rows(f))
+    nodes = array('q', [row[0] for row in rows])
+    lon = array('d', [row[1] for row in rows])
+    lat = array('d', [row[2] for row in rows])
+    node_to_idx = {node: i for i, node in enumerate(nodes)}
+    if len(node_to_idx) != len(nodes):
+        raise ValueError(f"{nodes_path} lists a node ID more than once")
+
+    edge_u, edge_v, edge_w = array('i'), array('i'), array('d')
+    weighted = bytearray()  # 1 where the row gave a weight_km
+    with open(edges_path, newline='') as f:
+        for row in _data_rows(f):
+            try:
+                edge_u.append(node_to_idx[int(row[0])])
+                edge_v.append(node_to_idx[int(row[1])])
+            except KeyError as e:
+                raise ValueError(f"{edges_path} references unknown node {e}") from None
+            # Missing weights become 0.0 and are then raised to the straight-line distance
+            given = len(row) > 2 and bool(row[2].strip())
+            edge_w.append(float(row[2]) if given else 0.0)
+            weighted.append(given)
+    straight = haversine_many([lon[u] for u in edge_u], [lat[u] for u in edge_u],
+                              [lon[v] for v in edge_v], [lat[v] for v in edge_v])
+    raised = []
+    for i, distance in enumerate(straight):
+        if not edge_w[i] >= distance:  # Also catches NaN
+            if weighted[i]:
+                raised.append((i, edge_w[i]))
+            edge_w[i] = distance
+    if raised:
+        i, weight = raised[0]
+        logger.warning("%s: raised %d of %d road weights to the straight-line distance between their ends "
+                       "(first: %d-%d, weight_km %r < %r)", edges_path, len(raised), len(edge_w),
+                       nodes[edge_u[i]], nodes[edge_v[i]], weight, edge_w[i])
+
+    csr = CSRGraph(nodes, list(zip(edge_u, edge_v, edge_w)), node_to_idx=node_to_idx)
+    return csr, NodePositions(node_to_idx, lon, lat)
+
+
+def _data_rows(f) -> Iterator[list]:
+    reader = csv.reader(f)
+    next(reader, None)  # Header
+    return (row for row in reader if row)
+
+
+def save_map(path: str, csr: CSRGraph, positions: Mapping[int, Tuple[float, float]]):
+    """Write a graph and its node positions in the binary map format"""
+    n = len(csr)
+    edge_u, edge_v, edge_w = csr.edge_columns()
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, n, len(edge_u)))
+        array('q', csr.nodes).tofile(f)
+        array('d', [positions[node][0] for node in csr.nodes]).tofile(f)
+        array('d', [positions[node][1] for node in csr.nodes]).tofile(f)
+        for typecode, column in (('i', edge_u), ('i', edge_v), ('d', edge_w),
+                                 ('i', csr.offsets), ('i', csr.targets), ('d', csr.weights)):
+            array(typecode, column).tofile(f)
+
+
+def load_map(path: str) -> Tuple[CSRGraph, NodePositions]:
+    """Read a binary map file: one bulk read per column, no per-edge Python work"""
+    with open(path, 'rb') as f:
+        magic, n, m = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a RideX map file")
+        columns = []
+        for typecode, count in (('q', n), ('d', n), ('d', n), ('i', m), ('i', m), ('d', m),
+                                ('i', n + 1), ('i', 2 * m), ('d', 2 * m)):
+            column = array(typecode)
+            column.fromfile(f, count)
+            columns.append(column)
+    nodes, lon, lat, edge_u, edge_v, edge_w, offsets, targets, weights = columns
+    csr = CSRGraph.from_arrays(nodes, offsets, targets, weights, (edge_u, edge_v, edge_w))
+    return csr, NodePositions(csr.node_to_idx, lon, lat)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    if len(sys.argv) != 4:
+        print("Usage: python map_io.py <nodes.csv> <edges.csv> <output.map>")
+        sys.exit(1)
+    t0 = time.perf_counter()
+    graph, node_positions = read_csv(sys.argv[1], sys.argv[2])
+    save_map(sys.argv[3], graph, node_positions)
+    print(f"Wrote {len(graph)} nodes, {len(graph.edges)} edges to {sys.argv[3]} in {time.perf_counter() - t0:.1f}s")
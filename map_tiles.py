@@ -0,0 +1,215 @@
+"""
+Road network tiles for RideX
+
+The map is served as web-mercator tiles (z/x/y, the scheme MapLibre and other
+slippy maps use), so clients only download what is in view. Below
+FULL_DETAIL_ZOOM roads are simplified: their ends snap to a grid of
+LOD_CELL_PX-pixel cells and one segment is kept per pair of cells, which
+bounds a tile's size however dense the network is. From FULL_DETAIL_ZOOM on
+every road and intersection is included with its node IDs.
+
+Tile bodies are built on first request, gzip-compressed once and cached until
+the road geometry changes; reweights such as traffic leave them untouched.
+Cold tiles are built outside the cache lock, so one slow tile doesn't hold up
+cached ones; concurrent requests for the same cold tile wait for a single build.
+"""
+import gzip
+import hashlib
+import json
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, List, Dict, Tuple, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from city_map import CityMap
+
+TILE_PX = 256
+MAX_ZOOM = 22
+FULL_DETAIL_ZOOM = 15
+LOD_CELL_PX = 4
+BUCKET_MAX_ZOOM = 16  # Deeper tiles filter their zoom-16 ancestor's roads
+MAX_LAT = 85.05112878  # Web mercator limit
+
+
+def mercator(lon: float, lat: float) -> Tuple[float, float]:
+    """Position in [0, 1) x [0, 1) web-mercator world coordinates (y grows southwards)"""
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    s = math.sin(math.radians(lat))
+    return (lon + 180.0) / 360.0, 0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+
+
+def inverse_mercator(mx: float, my: float) -> Tuple[float, float]:
+    return mx * 360.0 - 180.0, math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * my))))
+
+
+class MapTiles:
+    """Per-tile road geometry for a CityMap, encoded and compressed once per geometry"""
+
+    def __init__(self, city_map: 'CityMap', max_tiles: int = 4096):
+        self.city_map = city_map
+        self.max_tiles = max_tiles
+        self._geometry = None  # Edge column the tiles below were built from
+        self._mx = array('d')  # Mercator position per node index
+        self._my = array('d')
+        self._buckets: Dict[int, Dict[Tuple[int, int], List[int]]] = {}  # zoom -> tile -> edge ids
+        self._tiles: "OrderedDict[Tuple[int, int, int], Tuple[str, bytes]]" = OrderedDict()
+        # Builds in progress, by key of the cache they will fill
+        self._buckets_building: Dict[int, Future] = {}
+        self._tiles_building: Dict[Tuple[int, int, int], Future] = {}
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        """Drop everything derived from an older road geometry; call with the lock held"""
+        csr = self.city_map.graph.snapshot()
+        edge_u, edge_v, _ = csr.edge_columns()
+        if edge_u is self._geometry:
+            return csr  # Same roads (a reweighted snapshot shares its edge columns)
+        positions = self.city_map.node_positions
+        self._mx, self._my = array('d'), array('d')
+        for node in csr.nodes:
+            mx, my = mercator(*positions.get(node, (0.0, 0.0)))
+            self._mx.append(mx)
+            self._my.append(my)
+        self._geometry = edge_u
+        self._buckets.clear()
+        self._tiles.clear()
+        # Builds for the old geometry still finish for their waiters but are not cached
+        self._buckets_building.clear()
+        self._tiles_building.clear()
+        return csr
+
+    def _once(self, cache: Dict, building: Dict[Hashable, Future], key: Hashable, geometry,
+              build: Callable[[], Any]):
+        """
+        cache[key], computed by build() without holding the lock; concurrent callers for
+        the same key wait for that one build. geometry is the edge column build() works on:
+        if the roads changed since, the result is built but not cached. Call without the lock.
+        """
+        with self._lock:
+            if geometry is not self._geometry:
+                future = None
+            else:
+                value = cache.get(key)
+                if value is not None:
+                    return value
+                future = building.get(key)
+                owner = future is None
+                if owner:
+                    future = building[key] = Future()
+        if future is None:
+            return build()
+        if not owner:
+            return future.result()
+        try:
+            value = build()
+        except BaseException as e:
+            with self._lock:
+                if building.get(key) is future:
+                    del building[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            if building.get(key) is future:  # Otherwise the geometry changed meanwhile
+                del building[key]
+                cache[key] = value
+        future.set_result(value)
+        return value
+
+    def _bucket(self, z: int, edge_u, edge_v, mx: array, my: array) -> Dict[Tuple[int, int], List[int]]:
+        """Edge ids per tile at zoom z, each edge in every tile its bounding box touches"""
+        def build():
+            n = 1 << z
+            buckets = {}
+            for e, (u, v) in enumerate(zip(edge_u, edge_v)):
+                x1, x2 = int(mx[u] * n), int(mx[v] * n)
+                y1, y2 = int(my[u] * n), int(my[v] * n)
+                if x1 == x2 and y1 == y2:
+                    buckets.setdefault((x1, y1), []).append(e)
+                    continue
+                for tx in range(min(x1, x2), max(x1, x2) + 1):
+                    for ty in range(min(y1, y2), max(y1, y2) + 1):
+                        buckets.setdefault((tx, ty), []).append(e)
+            return buckets
+        return self._once(self._buckets, self._buckets_building, z, edge_u, build)
+
+    def _encode(self, z: int, x: int, y: int, csr, mx: array, my: array) -> bytes:
+        edge_u, edge_v, _ = csr.edge_columns()
+        bz = min(z, BUCKET_MAX_ZOOM)
+        shift = z - bz
+        edges = self._bucket(bz, edge_u, edge_v, mx, my).get((x >> shift, y >> shift), [])
+        n = 1 << z
+        if shift:
+            # Keep roads whose bounding box meets this tile
+            x0, y0, x1, y1 = x / n, y / n, (x + 1) / n, (y + 1) / n
+            edges = [e for e in edges
+                     if min(mx[edge_u[e]], mx[edge_v[e]]) < x1 and max(mx[edge_u[e]], mx[edge_v[e]]) >= x0
+                     and min(my[edge_u[e]], my[edge_v[e]]) < y1 and max(my[edge_u[e]], my[edge_v[e]]) >= y0]
+
+        payload = {'z': z, 'x': x, 'y': y, 'simplified': z < FULL_DETAIL_ZOOM}
+        if z < FULL_DETAIL_ZOOM:
+            # Snap ends to cell centres: consecutive roads still join up, roads inside a cell vanish
+            scale = n * TILE_PX / LOD_CELL_PX
+            cells = set()
+            for e in edges:
+                a = (int(mx[edge_u[e]] * scale), int(my[edge_u[e]] * scale))
+                b = (int(mx[edge_v[e]] * scale), int(my[edge_v[e]] * scale))
+                if a != b:
+                    cells.add((a, b) if a < b else (b, a))
+            roads = []
+            for a, b in sorted(cells):
+                lon1, lat1 = inverse_mercator((a[0] + 0.5) / scale, (a[1] + 0.5) / scale)
+                lon2, lat2 = inverse_mercator((b[0] + 0.5) / scale, (b[1] + 0.5) / scale)
+                roads.append([round(lon1, 6), round(lat1, 6), round(lon2, 6), round(lat2, 6)])
+            payload['fields'] = ['lon1', 'lat1', 'lon2', 'lat2']
+            payload['roads'] = roads
+        else:
+            nodes, positions = csr.nodes, self.city_map.node_positions
+            roads, in_tile = [], set()
+            for e in edges:
+                u, v = edge_u[e], edge_v[e]
+                (lon1, lat1), (lon2, lat2) = positions[nodes[u]], positions[nodes[v]]
+                roads.append([nodes[u], nodes[v], lon1, lat1, lon2, lat2])
+                for i in (u, v):
+                    if int(mx[i] * n) == x and int(my[i] * n) == y:
+                        in_tile.add(i)
+            payload['fields'] = ['u', 'v', 'lon1', 'lat1', 'lon2', 'lat2']
+            payload['roads'] = roads
+            payload['nodes'] = [[nodes[i], *positions[nodes[i]]] for i in sorted(in_tile)]
+        return json.dumps(payload, separators=(',', ':')).encode()
+
+    def tile(self, z: int, x: int, y: int) -> Tuple[str, bytes]:
+        """(etag, gzip-compressed JSON body) of a tile; raises ValueError outside the tile grid"""
+        if not (0 <= z <= MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            raise ValueError(f"No tile {z}/{x}/{y}")
+        key = (z, x, y)
+        with self._lock:
+            csr = self._sync()
+            geometry, mx, my = self._geometry, self._mx, self._my
+            cached = self._tiles.get(key)
+            if cached is not None:
+                self._tiles.move_to_end(key)
+                return cached
+
+        def build():
+            body = self._encode(z, x, y, csr, mx, my)
+            # Content-based so every worker hands out the same tag for the same tile
+            return hashlib.blake2b(body, digest_size=16).hexdigest(), gzip.compress(body, 6)
+
+        cached = self._once(self._tiles, self._tiles_building, key, geometry, build)
+        with self._lock:
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return cached
+
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """(min_lon, min_lat, max_lon, max_lat) of the road network"""
+        with self._lock:
+            self._sync()
+            if not self._mx:
+                return None
+            min_lon, max_lat = inverse_mercator(min(self._mx), min(self._my))
+            max_lon, min_lat = inverse_mercator(max(self._mx), max(self._my))
+            return round(min_lon, 6), round(min_lat, 6), round(max_lon, 6), round(max_lat, 6)
@@ -0,0 +1,224 @@
+"""
+Runtime metrics for RideX
+
+Counters and histograms (per-stage latencies, solver calls, nodes settled per
+search), plus an optional sampling profiler. Recording is a lock-protected
+dict update; with RIDEX_METRICS=0 (or METRICS.enabled = False) every call
+returns immediately and timers are a shared no-op.
+
+Histogram names ending in `_ms` hold latencies; others hold plain values
+(e.g. nodes settled per search).
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Dict, Callable, Optional
+
+# 1-2-5 series from 1 µs-scale values up to 10 million: wide enough for both ms and node counts
+_BOUNDS = [m * 10.0 ** e for e in range(-3, 7) for m in (1, 2, 5)] + [1e7]
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are bucket upper bounds (capped at the maximum seen)"""
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.buckets[bisect.bisect_left(_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(_BOUNDS[i], self.max) if i < len(_BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': round(self.total, 4),
+            'mean': round(self.total / self.count, 4) if self.count else 0.0,
+            'max': round(self.max, 4),
+            'p50': round(self.percentile(50), 4),
+            'p95': round(self.percentile(95), 4),
+            'p99': round(self.percentile(99), 4),
+        }
+
+
+class _Timer:
+    __slots__ = ('_metrics', '_name', '_start')
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._name, (time.perf_counter() - self._start) * 1000)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class SamplingProfiler:
+    """
+    Background thread sampling every other thread's Python stack at a fixed interval
+    Samples are aggregated as collapsed stacks ("outer;inner count" lines, the input
+    format of flamegraph tools); hooks also receive each raw sample (thread id, frames).
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._hooks: List[Callable[[int, List[str]], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_hook(self, hook: Callable[[int, List[str]], None]):
+        """Call hook(thread_id, frames outermost first) for every sampled stack"""
+        self._hooks.append(hook)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='ridex-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                frames.reverse()
+                with self._lock:
+                    self._stacks[';'.join(frames)] += 1
+                    self.samples += 1
+                for hook in self._hooks:
+                    hook(thread_id, frames)
+
+    def collapsed(self) -> str:
+        """Aggregated samples in collapsed-stack format, most frequent first"""
+        with self._lock:
+            return ''.join(f"{stack} {n}\n" for stack, n in self._stacks.most_common())
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+
+class Metrics:
+    """Process-wide counters and histograms"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started = time.time()
+        self.profiler: Optional[SamplingProfiler] = None
+        self._counters: Dict[str, int] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1):
+        """Add n to a counter"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float):
+        """Record one value (a latency in ms for `_ms` names) in a histogram"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(value)
+
+    def timer(self, name: str):
+        """Context manager recording its block's wall time in ms under name"""
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def start_profiler(self, interval: float = 0.01) -> SamplingProfiler:
+        """Start (or return the running) sampling profiler"""
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(interval)
+        self.profiler.start()
+        return self.profiler
+
+    def stop_profiler(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def snapshot(self) -> Dict:
+        """All counters and histogram summaries"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: histogram.summary() for name, histogram in self._histograms.items()}
+        return {
+            'enabled': self.enabled,
+            'uptime_s': round(time.time() - self.started, 1),
+            'counters': dict(sorted(counters.items())),
+            'histograms': dict(sorted(histograms.items())),
+            'profiler_samples': self.profiler.samples if self.profiler is not None else 0,
+        }
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+        if self.profiler is not None:
+            self.profiler.reset()
+
+
+METRICS = Metrics(enabled=os.environ.get('RIDEX_METRICS', '1') != '0')
@@ -0,0 +1,489 @@
+"""
+Region-partitioned routing for RideX
+
+The road graph is cut into geographic regions by recursive coordinate
+bisection. Each region is a RegionShard holding only its own roads, served from
+its own process (a stand-in for one machine per region). Roads crossing a cut
+are kept by the coordinator, and their ends are the region's boundary nodes.
+Every shard precomputes the shortest in-region distance between each pair of
+its boundary nodes.
+
+Those tables and the crossing roads form a small overlay graph on which every
+shortest path survives: a path splits into in-region stretches between boundary
+nodes (a table entry) and crossing roads. A query therefore runs in three steps,
+each one fan-out to the shards involved:
+
+    1. the start's shard: distances from start to its boundary nodes
+    2. coordinator: overlay search from those boundary nodes
+    3. each target's shard: search seeded at its boundary nodes with the overlay
+       distances (plus start itself for the home region)
+
+Winning paths are expanded through the shards and their lengths re-summed
+road by road from the start, the way Dijkstra adds them up on the whole graph.
+"""
+import heapq
+import math
+import multiprocessing
+import threading
+from array import array
+from collections import Counter
+from typing import List, Dict, Tuple, Iterable, Optional, Any, TYPE_CHECKING
+
+from graph_engine import INF, CSRGraph, IndexUnavailableError
+from metrics import METRICS
+
+if TYPE_CHECKING:
+    from city_map import Graph
+
+# (method name, arguments) sent to a shard
+ShardCall = Tuple[str, tuple]
+
+
+def partition(csr: CSRGraph, positions: Dict[int, Tuple[float, float]], regions: int) -> array:
+    """
+    Region of every node index: recursive bisection at the median along the longer
+    side of the bounding box, so regions are compact and hold similar node counts
+    """
+    region_of = array('i', [0]) * len(csr)
+    coords = [positions.get(node, (0.0, 0.0)) for node in csr.nodes]
+
+    def split(indices: List[int], first: int, count: int):
+        if count <= 1 or len(indices) <= 1:
+            for i in indices:
+                region_of[i] = first
+            return
+        lons = [coords[i][0] for i in indices]
+        lats = [coords[i][1] for i in indices]
+        mid_lat = (min(lats) + max(lats)) / 2
+        lon_span = (max(lons) - min(lons)) * math.cos(math.radians(mid_lat))
+        axis = 0 if lon_span >= max(lats) - min(lats) else 1
+        indices.sort(key=lambda i: coords[i][axis])
+        left = count // 2
+        cut = len(indices) * left // count
+        split(indices[:cut], first, left)
+        split(indices[cut:], first + left, count - left)
+
+    split(list(range(len(csr))), 0, regions)
+    return region_of
+
+
+def _multi_source(csr: CSRGraph, sources: Dict[int, float], wanted: Optional[Counter] = None,
+                  limit: Optional[int] = None) -> Tuple[List[float], List[int], List[float], List[int]]:
+    """
+    Dijkstra over CSR indices from several sources, each starting at its own distance
+    Stops once limit copies of the wanted indices (or all of them) are settled.
+    Returns dist, parent, weight of the road to the parent, and wanted indices in settle order.
+    """
+    offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+    dist = [INF] * len(csr)
+    parent = [-1] * len(csr)
+    via = [0.0] * len(csr)
+    pq = []
+    for i, d in sources.items():
+        if d < dist[i]:
+            dist[i] = d
+            pq.append((d, i))
+    heapq.heapify(pq)
+    reached = []
+    found = 0
+
+    while pq:
+        d, u = heapq.heappop(pq)
+        if d > dist[u]:
+            continue
+        if wanted is not None and u in wanted:
+            reached.append(u)
+            found += wanted[u]
+            if (limit is not None and found >= limit) or len(reached) == len(wanted):
+                break
+        for i in range(offsets[u], offsets[u + 1]):
+            v = targets[i]
+            nd = d + weights[i]
+            if nd < dist[v]:
+                dist[v] = nd
+                parent[v] = u
+                via[v] = weights[i]
+                heapq.heappush(pq, (nd, v))
+    return dist, parent, via, reached
+
+
+def _trace(parent: List[int], via: List[float], v: int) -> Tuple[List[int], List[float]]:
+    """Indices from the search root to v, and the weight of each road taken"""
+    path, legs = [v], []
+    while parent[v] != -1:
+        legs.append(via[v])
+        v = parent[v]
+        path.append(v)
+    path.reverse()
+    legs.reverse()
+    return path, legs
+
+
+class RegionShard:
+    """One region's roads; answers searches that stay inside the region"""
+
+    def __init__(self, region: int, nodes: List[int], edges: List[Tuple[int, int, float]], boundary: List[int]):
+        self.region = region
+        self.csr = CSRGraph(nodes, edges)
+        self.boundary = boundary  # Node IDs with a road leaving the region
+        self._boundary_idx = Counter(self.csr.node_to_idx[b] for b in boundary)
+
+    def boundary_table(self) -> List[array]:
+        """In-region distance between every pair of boundary nodes, one row per node in boundary order"""
+        idx = [self.csr.node_to_idx[b] for b in self.boundary]
+        rows = []
+        for s in idx:
+            dist, _, _, _ = _multi_source(self.csr, {s: 0.0}, self._boundary_idx)
+            rows.append(array('d', [dist[t] for t in idx]))
+        return rows
+
+    def distances_from(self, start: int) -> Dict[int, float]:
+        """In-region distance from start to each boundary node it can reach"""
+        dist, _, _, reached = _multi_source(self.csr, {self.csr.node_to_idx[start]: 0.0}, self._boundary_idx)
+        return {self.csr.nodes[i]: dist[i] for i in reached}
+
+    def search(self, sources: Dict[int, float], targets: List[int],
+               limit: Optional[int] = None) -> List[Tuple[int, float, List[int], List[float]]]:
+        """
+        Nearest targets (node IDs, repeats count towards limit) from sources seeded at their distances
+        Returns (target, distance, path from its source, road weights) in order of distance.
+        """
+        node_to_idx, nodes = self.csr.node_to_idx, self.csr.nodes
+        wanted = Counter(node_to_idx[t] for t in targets)
+        dist, parent, via, reached = _multi_source(self.csr, {node_to_idx[s]: d for s, d in sources.items()},
+                                                   wanted, limit)
+        results = []
+        for t in reached:
+            path, legs = _trace(parent, via, t)
+            results.append((nodes[t], dist[t], [nodes[i] for i in path], legs))
+        return results
+
+    def paths(self, pairs: List[Tuple[int, int]]) -> List[Tuple[List[int], List[float]]]:
+        """In-region shortest path and its road weights for each (start, end) pair"""
+        node_to_idx, nodes = self.csr.node_to_idx, self.csr.nodes
+        results = []
+        for start, end in pairs:
+            s, t = node_to_idx[start], node_to_idx[end]
+            _, parent, via, reached = _multi_source(self.csr, {s: 0.0}, Counter((t,)))
+            path, legs = _trace(parent, via, t) if reached else ([], [])
+            results.append(([nodes[i] for i in path], legs))
+        return results
+
+    def run(self, calls: List[ShardCall]) -> List[Any]:
+        return [getattr(self, method)(*args) for method, args in calls]
+
+
+def _serve(conn, shard: RegionShard):
+    """Shard process main loop: a list of calls in, a list of results (or the exception) out"""
+    while True:
+        try:
+            calls = conn.recv()
+        except EOFError:
+            return
+        if calls is None:
+            return
+        try:
+            conn.send(shard.run(calls))
+        except Exception as e:
+            conn.send(e)
+
+
+class _LocalShard:
+    """Shard answered in the calling process"""
+
+    def __init__(self, shard: RegionShard):
+        self.shard = shard
+        self.lock = threading.Lock()
+        self._results: List[Any] = []
+
+    def send(self, calls: List[ShardCall]):
+        self._results = self.shard.run(calls)
+
+    def receive(self) -> List[Any]:
+        return self._results
+
+    def close(self):
+        pass
+
+
+class _ShardProcess:
+    """Shard served from its own process over a pipe"""
+
+    def __init__(self, shard: RegionShard):
+        self.lock = threading.Lock()  # One request in flight per pipe
+        # Spawned, not forked: a running service has solver and request threads,
+        # and a fork could copy locks other threads are holding
+        context = multiprocessing.get_context('spawn')
+        self._conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, shard),
+                                       name=f'ridex-shard-{shard.region}', daemon=True)
+        self.process.start()
+        child.close()
+
+    def send(self, calls: List[ShardCall]):
+        self._conn.send(calls)
+
+    def receive(self) -> List[Any]:
+        result = self._conn.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+        self._conn.close()
+
+
+class RegionShards:
+    """
+    Coordinator over one shard per region; a routing index (see
+    RideService.use_region_shards) with the same contract as dijkstra and
+    dijkstra_one_to_many on the unsplit graph
+    """
+
+    def __init__(self, shards: List, region_of: Dict[int, int], boundary: List[List[int]],
+                 overlay: CSRGraph, fingerprint: str):
+        self.shards = shards
+        self.region_of = region_of  # Node ID -> region
+        self.boundary = boundary  # Boundary node IDs per region
+        self.overlay = overlay  # Boundary nodes; edges are table entries and crossing roads
+        self.fingerprint = fingerprint
+        self.healthy = True
+        self._matched: Tuple[int, int] = (-1, -1)
+
+    @classmethod
+    def build(cls, graph: 'Graph', positions: Dict[int, Tuple[float, float]], regions: int = 4,
+              processes: bool = True) -> 'RegionShards':
+        """
+        Partition the graph, start one shard per region (in its own process unless
+        processes is False) and assemble the overlay from their boundary tables
+        """
+        with METRICS.timer('shards.build_ms'):
+            csr = graph.snapshot()
+            regions = max(1, min(regions, len(csr)))
+            region_idx = partition(csr, positions, regions)
+
+            members: List[List[int]] = [[] for _ in range(regions)]
+            for i, region in enumerate(region_idx):
+                members[region].append(i)
+            local = {}  # Index -> position within its region
+            for indices in members:
+                local.update((i, k) for k, i in enumerate(indices))
+
+            inner: List[List[Tuple[int, int, float]]] = [[] for _ in range(regions)]
+            crossing: Dict[Tuple[int, int], float] = {}  # (u, v) node IDs, both directions -> shortest road
+            edge_u, edge_v, edge_w = csr.edge_columns()
+            for u, v, w in zip(edge_u, edge_v, edge_w):
+                if region_idx[u] == region_idx[v]:
+                    inner[region_idx[u]].append((local[u], local[v], w))
+                elif w < crossing.get((csr.nodes[u], csr.nodes[v]), INF):
+                    crossing[(csr.nodes[u], csr.nodes[v])] = w
+                    crossing[(csr.nodes[v], csr.nodes[u])] = w
+
+            boundary_sets = [set() for _ in range(regions)]
+            region_of = {node: region_idx[i] for i, node in enumerate(csr.nodes)}
+            for u, _ in crossing:
+                boundary_sets[region_of[u]].add(u)
+            boundary = [sorted(nodes) for nodes in boundary_sets]
+
+            handle = _ShardProcess if processes else _LocalShard
+            shards = [handle(RegionShard(r, [csr.nodes[i] for i in members[r]], inner[r], boundary[r]))
+                      for r in range(regions)]
+            index = cls(shards, region_of, boundary, None, csr.fingerprint)
+            try:
+                # Every shard fills its table at the same time
+                tables = index._call({r: [('boundary_table', ())] for r in range(regions)})
+            except BaseException:
+                index.close()
+                raise
+
+            overlay_nodes = sorted(set().union(*boundary_sets))
+            overlay_idx = {node: i for i, node in enumerate(overlay_nodes)}
+            overlay_edges = [(overlay_idx[u], overlay_idx[v], w) for (u, v), w in crossing.items()]
+            for r in range(regions):
+                ids = [overlay_idx[b] for b in boundary[r]]
+                for a, row in zip(ids, tables[r][0]):
+                    overlay_edges.extend((a, b, d) for b, d in zip(ids, row) if a != b and d < INF)
+            index.overlay = CSRGraph(overlay_nodes, overlay_edges, directed=True, node_to_idx=overlay_idx)
+        METRICS.observe('shards.boundary_nodes', len(overlay_nodes))
+        return index
+
+    def close(self):
+        """Stop the shard processes"""
+        for shard in self.shards:
+            shard.close()
+        self.healthy = False
+
+    def matches(self, graph: 'Graph') -> bool:
+        """Whether the shards were built from the graph's current content and are all running"""
+        if not self.healthy:
+            return False
+        key = (id(graph), graph.version)
+        if key == self._matched:
+            return True
+        if graph.snapshot().fingerprint != self.fingerprint:
+            return False
+        self._matched = key
+        return True
+
+    def _call(self, calls: Dict[int, List[ShardCall]]) -> Dict[int, List[Any]]:
+        """Send each region its calls, then collect the answers: shards work in parallel"""
+        regions = sorted(calls)  # Fixed lock order across threads
+        locked = []
+        try:
+            for r in regions:
+                self.shards[r].lock.acquire()
+                locked.append(r)
+                self.shards[r].send(calls[r])
+            return {r: self.shards[r].receive() for r in regions}
+        except (OSError, EOFError) as e:
+            METRICS.count('shards.failures')
+            self.healthy = False  # This and later queries fall back to searching the whole graph
+            raise IndexUnavailableError(f"Region shard failed: {e!r}") from e
+        finally:
+            for r in locked:
+                self.shards[r].lock.release()
+
+    def one_to_many(self, start: int, targets: Iterable[int],
+                    limit: Optional[int] = None) -> Dict[int, Tuple[List[int], float]]:
+        """Same contract as dijkstra_one_to_many, answered by the shards holding start and the targets"""
+        if start not in self.region_of:
+            return {}
+        counts = Counter(t for t in targets if t in self.region_of)
+        if not counts:
+            return {}
+        with METRICS.timer('shards.query_ms'):
+            home = self.region_of[start]
+            by_region: Dict[int, List[int]] = {}
+            for target, n in counts.items():
+                by_region.setdefault(self.region_of[target], []).extend([target] * n)
+
+            # 1. Start to its region's boundary
+            overlay, overlay_idx = self.overlay, self.overlay.node_to_idx
+            exits = self._call({home: [('distances_from', (start,))]})[home][0]
+
+            # 2. Overlay search until every boundary node of a target region is settled
+            wanted = Counter(overlay_idx[b] for r in by_region for b in self.boundary[r])
+            seeds = {overlay_idx[b]: d for b, d in exits.items()} if wanted else {}
+            dist, parent, via, _ = _multi_source(overlay, seeds, wanted)
+
+            # 3. Target regions, entered through their boundary at overlay distance
+            calls = {}
+            for r, region_targets in by_region.items():
+                sources = {b: dist[overlay_idx[b]] for b in self.boundary[r] if dist[overlay_idx[b]] < INF}
+                if r == home:
+                    sources[start] = 0.0
+                if sources:
+                    calls[r] = [('search', (sources, region_targets, limit))]
+            found = sorted((distance, target, r, path, legs)
+                           for r, answers in self._call(calls).items()
+                           for target, distance, path, legs in answers[0])
+            chosen = []
+            n = 0
+            for entry in found:
+                chosen.append(entry)
+                n += counts[entry[1]]
+                if limit is not None and n >= limit:
+                    break
+            METRICS.observe('shards.regions_per_query', len(calls))
+            return self._expand(start, home, exits, chosen, parent, via)
+
+    def _expand(self, start: int, home: int, exits: Dict[int, float], chosen: List,
+                parent: List[int], via: List[float]) -> Dict[int, Tuple[List[int], float]]:
+        """Full start -> target paths for the chosen answers, with distances re-summed from start"""
+        nodes = self.overlay.nodes
+        plans = []  # Per answer: list of pieces, each ('road', weight) or ('shard', region, a, b)
+        needed: Dict[int, List[Tuple[int, int]]] = {}
+        for _, target, r, path, legs in chosen:
+            pieces = []
+            if path[0] != start or r != home:
+                # Entered from the overlay: walk back to the home boundary node it started from
+                v = self.overlay.node_to_idx[path[0]]
+                while parent[v] != -1:
+                    u = parent[v]
+                    a, b = nodes[u], nodes[v]
+                    if self.region_of[a] == self.region_of[b]:
+                        pieces.append(('shard', self.region_of[a], a, b))
+                    else:
+                        pieces.append(('road', b, via[v]))
+                    v = u
+                if nodes[v] != start:
+                    pieces.append(('shard', home, start, nodes[v]))
+                pieces.reverse()
+            plans.append((target, pieces, path, legs))
+            for piece in pieces:
+                if piece[0] == 'shard':
+                    needed.setdefault(piece[1], []).append(piece[2:])
+
+        segments: Dict[Tuple[int, int], Tuple[List[int], List[float]]] = {}
+        if needed:
+            for r, answers in self._call({r: [('paths', (pairs,))] for r, pairs in needed.items()}).items():
+                segments.update(zip(needed[r], answers[0]))
+
+        results = {}
+        for target, pieces, path, legs in plans:
+            full, weights = [start], []
+            for piece in pieces:
+                if piece[0] == 'shard':
+                    segment_path, segment_legs = segments[piece[2:]]
+                    full.extend(segment_path[1:])
+                    weights.extend(segment_legs)
+                else:
+                    full.append(piece[1])
+                    weights.append(piece[2])
+            full.extend(path[1:])
+            weights.extend(legs)
+            distance = 0.0
+            for w in weights:
+                distance += w
+            results[target] = (full, distance)
+        return dict(sorted(results.items(), key=lambda item: item[1][1]))
+
+    def shortest_path(self, start: int, end: int) -> Tuple[List[int], float]:
+        """Exact point-to-point shortest path (node IDs)"""
+        return self.one_to_many(start, [end]).get(end, ([], float('inf')))
+
+
+if __name__ == '__main__':
+    import random
+    import sys
+    import time
+    from graph_engine import InProcessGraphAlgorithms
+    from synthetic_city import grid_city, random_geometric_city
+    if len(sys.argv) < 4 or sys.argv[1] not in ('grid', 'geometric'):
+        print("Usage: python region_shards.py <grid|geometric> <num_nodes> <regions> [queries] [seed]")
+        sys.exit(1)
+    queries = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else 42
+    generate = grid_city if sys.argv[1] == 'grid' else random_geometric_city
+    city = generate(int(sys.argv[2]), seed=seed)
+    t0 = time.perf_counter()
+    shards = RegionShards.build(city.graph, city.node_positions, int(sys.argv[3]))
+    print(f"Built {len(shards.shards)} shards ({len(shards.overlay)} boundary nodes) "
+          f"in {time.perf_counter() - t0:.1f}s")
+    rng = random.Random(seed)
+    nodes = sorted(city.graph.nodes)
+    mismatches = 0
+    sharded_s = whole_s = 0.0
+    for _ in range(queries):
+        start, end = rng.choice(nodes), rng.choice(nodes)
+        t0 = time.perf_counter()
+        _, sharded = shards.shortest_path(start, end)
+        t1 = time.perf_counter()
+        _, whole = InProcessGraphAlgorithms.dijkstra(city.graph, start, end)
+        t2 = time.perf_counter()
+        sharded_s += t1 - t0
+        whole_s += t2 - t1
+        if sharded != whole:
+            mismatches += 1
+            print(f"Mismatch {start} -> {end}: sharded {sharded!r}, dijkstra {whole!r}")
+    shards.close()
+    print(f"{queries} queries, {mismatches} mismatches; mean {sharded_s / queries * 1000:.1f} ms sharded, "
+          f"{whole_s / queries * 1000:.1f} ms whole-graph dijkstra")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,263 @@
+"""
+Shortest-path result cache for RideX
+
+Misses are single-flight: when several threads ask for the same route at the
+same graph version (a surge of requests from one stadium pickup), the first one
+runs the search and the others wait for its result.
+"""
+import hashlib
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from typing import List, Dict, Tuple, Set, Optional, Hashable, Callable
+
+from graph_engine import INF
+
+
+class RouteCache:
+    """
+    Bounded LRU/TTL cache in front of a graph algorithms backend
+    Entries belong to one graph version. When the graph changes, only routes the
+    logged road changes can affect are dropped: those using a road that got slower
+    or closed, and those a faster road could shorten. The second check needs
+    lower_bound(u, v), a distance no u-v route can beat (e.g. straight-line
+    distance); without it any speed-up drops everything. Unknown changes clear the cache.
+    Exposes the backend's dijkstra / dijkstra_one_to_many signatures, so it can be
+    handed to anything that expects a graph algorithms implementation.
+    With an executor (see solver_executor.py), searches run there rather than on
+    the calling thread.
+    One-to-many searches (driver lookups) live in a separate, much smaller LRU keyed
+    by a digest of their targets: driver positions change all the time, so these
+    rarely hit again and must not push point-to-point routes out.
+    """
+
+    def __init__(self, graph_algorithms, maxsize: int = 10000, ttl: Optional[float] = None,
+                 lower_bound: Optional[Callable[[int, int], float]] = None, executor=None,
+                 search_maxsize: int = 256):
+        self.graph_algorithms = graph_algorithms
+        self.maxsize = maxsize
+        self.search_maxsize = search_maxsize
+        self.ttl = ttl
+        self.lower_bound = lower_bound
+        self.executor = executor
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._searches: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()  # One-to-many results
+        self._inflight: Dict[Tuple[int, Hashable], Future] = {}  # (version, key) -> result being computed
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.dropped = 0  # Entries removed by incremental invalidation
+        self.coalesced = 0  # Misses that waited for an identical search already running
+
+    def __getattr__(self, name):
+        # Everything not cached (MST, topological sort, ...) goes straight to the backend
+        return getattr(self.graph_algorithms, name)
+
+    def _sync_version(self, version: int, graph=None) -> bool:
+        """
+        Drop entries the graph's changes may affect; call with the lock held
+        Returns False for a version older than the cache's (a request that started
+        before a concurrent edit), whose results must not be mixed in.
+        """
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._entries or self._searches:
+                changes = None
+                if graph is not None and self._version is not None:
+                    changes = graph.changes_since(self._version)
+                if changes is None:
+                    self.invalidations += 1
+                    self._entries.clear()
+                    self._searches.clear()
+                else:
+                    self._drop_affected(changes)
+            self._version = version
+        return True
+
+    def _drop_affected(self, changes):
+        slower: Set[Tuple[int, int]] = set()
+        faster: List[Tuple[int, int, float]] = []
+        added = False  # A new road can connect previously unreachable places
+        for u, v, old, new in changes:
+            if new > old:
+                slower.add((u, v) if u < v else (v, u))
+            elif new < old:
+                faster.append((u, v, new))
+                added = added or old == INF
+        for entries in (self._entries, self._searches):
+            for key in [key for key, (_, value) in entries.items()
+                        if self._affected(key, value, slower, faster, added)]:
+                del entries[key]
+                self.dropped += 1
+
+    def _could_shorten(self, start: int, end: Optional[int], distance: float,
+                       faster: List[Tuple[int, int, float]]) -> bool:
+        """Whether a faster road could give a route from start (to end) under distance"""
+        if not faster:
+            return False
+        if self.lower_bound is None:
+            return True
+        bound = self.lower_bound
+        for u, v, weight in faster:
+            if end is None:
+                via = weight + min(bound(start, u), bound(start, v))
+            else:
+                via = weight + min(bound(start, u) + bound(v, end), bound(start, v) + bound(u, end))
+            if via <= distance:
+                return True
+        return False
+
+    def _affected(self, key: Hashable, value, slower: Set[Tuple[int, int]],
+                  faster: List[Tuple[int, int, float]], added: bool) -> bool:
+        pending = False
+        if key[0] == 'many':
+            start = key[1]
+            value, pending = value
+            routes = list(value.values())
+            end = None
+        else:
+            start, end = key
+            routes = [value]
+        for path, _ in routes:
+            for a, b in zip(path, path[1:]):
+                if ((a, b) if a < b else (b, a)) in slower:
+                    return True
+        reached = [distance for path, distance in routes if path]
+        if not reached:
+            # Nothing reachable: only a new road can change that
+            return added
+        if added and pending:
+            return True  # Some targets were unreachable and may now be connected
+        return self._could_shorten(start, end, max(reached), faster)
+
+    def get(self, version: int, key: Hashable, graph=None):
+        """Cached value for key at this graph version, or None; pass graph for incremental invalidation"""
+        with self._lock:
+            return self._get_locked(version, key, graph)
+
+    def _store(self, key: Hashable) -> Tuple["OrderedDict[Hashable, Tuple[float, object]]", int]:
+        return (self._searches, self.search_maxsize) if key[0] == 'many' else (self._entries, self.maxsize)
+
+    def _get_locked(self, version: int, key: Hashable, graph=None):
+        if not self._sync_version(version, graph):
+            self.misses += 1
+            return None
+        entries, _ = self._store(key)
+        entry = entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, value = entry
+        if expires and expires < time.monotonic():
+            del entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, version: int, key: Hashable, value, graph=None):
+        """Store a value computed at this graph version, evicting the least recently used entry"""
+        with self._lock:
+            if not self._sync_version(version, graph):
+                return
+            expires = time.monotonic() + self.ttl if self.ttl else 0.0
+            entries, maxsize = self._store(key)
+            entries[key] = (expires, value)
+            entries.move_to_end(key)
+            while len(entries) > maxsize:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached routes"""
+        with self._lock:
+            self._entries.clear()
+            self._searches.clear()
+
+    def _fetch(self, graph, key: Hashable, compute: Callable[[], object]):
+        """Cached value for key, or compute() run once for every thread missing on it meanwhile"""
+        version = graph.version
+        flight_key = (version, key)
+        with self._lock:
+            cached = self._get_locked(version, key, graph)
+            if cached is not None:
+                return cached
+            flight = self._inflight.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[flight_key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.result()
+        try:
+            value = compute() if self.executor is None else self.executor.submit(compute).result()
+            self.put(version, key, value, graph)
+            flight.set_result(value)
+            return value
+        except BaseException as e:
+            # Waiting threads get the same error (e.g. SolverBusyError) instead of retrying
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[flight_key]
+
+    def _cached_route(self, graph, start: int, end: int, compute) -> Tuple[List[int], float]:
+        # Roads are undirected: both directions share one entry
+        key = (start, end) if start <= end else (end, start)
+        path, distance = self._fetch(graph, key, lambda: compute(key[0], key[1]))
+        return (list(path) if start <= end else path[::-1]), distance
+
+    def dijkstra(self, graph, start: int, end: int) -> Tuple[List[int], float]:
+        """Cached point-to-point shortest path"""
+        return self._cached_route(graph, start, end,
+                                  lambda u, v: self.graph_algorithms.dijkstra(graph, u, v))
+
+    def astar(self, graph, start: int, end: int, heuristic) -> Tuple[List[int], float]:
+        """Cached A* route; shares entries with dijkstra since distances are identical"""
+        return self._cached_route(graph, start, end,
+                                  lambda u, v: self.graph_algorithms.astar(graph, u, v, heuristic))
+
+    def dijkstra_one_to_many(self, graph, start: int, targets: List[int],
+                             limit: Optional[int] = None) -> Dict[int, Tuple[List[int], float]]:
+        """Cached one-to-many search, keyed by a digest of the exact target multiset"""
+        targets = sorted(targets)
+        digest = hashlib.blake2b(array('q', targets).tobytes(), digest_size=16).digest()
+        key = ('many', start, digest, limit)
+
+        def search():
+            reached = self.graph_algorithms.dijkstra_one_to_many(graph, start, targets, limit)
+            counts = Counter(targets)
+            found = sum(counts[target] for target in reached)
+            # Short of limit with targets left over: a new road could still add results
+            pending = len(reached) < len(counts) and (limit is None or found < limit)
+            return reached, pending
+
+        return dict(self._fetch(graph, key, search)[0])
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'searches': len(self._searches),
+                'search_maxsize': self.search_maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+            }
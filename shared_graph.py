@@ -0,0 +1,151 @@
+"""
+Shared road graph for multi-process RideX deployments
+
+One process publishes the graph's CSR arrays to a file (ideally on a RAM-backed
+filesystem such as /dev/shm); every worker maps that file and routes over it
+without a private copy. Updates are published as a new file renamed over the
+old one, so workers swap to a complete new generation or keep the previous one.
+Publishers take an O_EXCL lock file next to the graph while they pick and write
+the next generation, so concurrent publishers never reuse a generation number.
+
+File layout (native endianness, sections padded to 8 bytes):
+    header | int64 nodes[N] | int32 offsets[N + 1] | int32 targets[2M] | float64 weights[2M]
+    | int32 edge_u[M] | int32 edge_v[M] | float64 edge_w[M]
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import List, Tuple, Optional, TYPE_CHECKING
+
+from graph_engine import CSRGraph
+
+if TYPE_CHECKING:
+    from city_map import Graph, CityMap
+
+_MAGIC = b'RIDEXSG1'
+_HEADER = struct.Struct('<8sqqq16s')  # magic, generation, N, M, fingerprint
+LOCK_TIMEOUT = 30.0  # Seconds to wait for another publisher before giving up
+STALE_LOCK_AGE = 120.0  # A lock file older than this was left behind by a crashed publisher
+
+
+def _padded(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _sections(n: int, m: int) -> List[Tuple[str, int]]:
+    """(typecode, count) of each array section, in file order"""
+    return [('q', n), ('i', n + 1), ('i', 2 * m), ('d', 2 * m), ('i', m), ('i', m), ('d', m)]
+
+
+def read_generation(path: str) -> int:
+    """Generation number of a published graph file, 0 if there is none"""
+    try:
+        with open(path, 'rb') as f:
+            magic, generation, _, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+    except (OSError, struct.error):
+        return 0
+    return generation if magic == _MAGIC else 0
+
+
+def _lock(lock_path: str):
+    """Create lock_path exclusively, breaking a stale one; raises TimeoutError if it stays held"""
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return
+        except FileExistsError:
+            pass
+        try:
+            if time.time() - os.stat(lock_path).st_mtime > STALE_LOCK_AGE:
+                os.unlink(lock_path)
+                continue
+        except FileNotFoundError:
+            continue  # Released meanwhile
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{lock_path} is held by another publisher")
+        time.sleep(0.01)
+
+
+def publish_graph(graph: 'Graph', path: str) -> int:
+    """Write the graph's current snapshot as the next generation; returns the generation"""
+    csr = graph.snapshot()
+    if csr.directed:
+        raise ValueError("Only undirected road graphs can be shared")
+    edge_u, edge_v, edge_w = csr.edge_columns()
+    columns = [csr.nodes, csr.offsets, csr.targets, csr.weights, edge_u, edge_v, edge_w]
+    lock_path = f"{path}.lock"
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    _lock(lock_path)
+    try:
+        generation = read_generation(path) + 1  # Stable while we hold the lock
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, generation, len(csr), len(edge_u), bytes.fromhex(csr.fingerprint)))
+            for (typecode, _), column in zip(_sections(len(csr), len(edge_u)), columns):
+                data = array(typecode, column).tobytes()
+                f.write(data)
+                f.write(b'\0' * (_padded(len(data)) - len(data)))
+        os.replace(tmp_path, path)  # Readers see the old or the new generation, never a mix
+    finally:
+        os.unlink(lock_path)
+    return generation
+
+
+def open_shared_graph(path: str) -> Tuple[int, CSRGraph]:
+    """Map a published graph file; returns (generation, zero-copy CSR view)"""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, generation, n, m, fingerprint = _HEADER.unpack_from(mm, 0)
+    if magic != _MAGIC:
+        raise ValueError(f"{path} is not a RideX shared graph")
+    view = memoryview(mm)
+    offset = _HEADER.size
+    arrays = []
+    for typecode, count in _sections(n, m):
+        size = struct.calcsize(typecode) * count
+        arrays.append(view[offset:offset + size].cast(typecode))
+        offset += _padded(size)
+    nodes, offsets, targets, weights, edge_u, edge_v, edge_w = arrays
+    csr = CSRGraph.from_arrays(nodes, offsets, targets, weights, (edge_u, edge_v, edge_w),
+                               fingerprint=fingerprint.hex())
+    return generation, csr
+
+
+class SharedGraph:
+    """A worker's link to a published graph file; sync() swaps in newer generations"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.generation = 0
+        self._seen_file: Optional[Tuple[int, int]] = None  # (inode, mtime) last looked at
+        self._lock = threading.Lock()
+
+    def publish(self, city_map: 'CityMap') -> int:
+        """Publish the map's road graph as the next generation and mark it as already attached here"""
+        with self._lock:
+            self.generation = publish_graph(city_map.graph, self.path)
+            self._seen_file = None
+            return self.generation
+
+    def sync(self, city_map: 'CityMap') -> bool:
+        """Attach the map to the newest published generation; True if it changed"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        seen = (stat.st_ino, stat.st_mtime_ns)
+        if seen == self._seen_file:
+            return False  # Cheap path taken on almost every request
+        with self._lock:
+            if seen == self._seen_file:
+                return False
+            generation, csr = open_shared_graph(self.path)
+            self._seen_file = seen
+            if generation <= self.generation:
+                return False
+            city_map.attach_graph(csr)  # Also resets the map's state derived from the old graph
+            self.generation = generation
+            return True
@@ -0,0 +1,76 @@
+"""
+Bounded execution of graph searches for RideX
+
+Searches that miss the route cache run on a fixed set of solver threads instead
+of the request threads that asked for them. At most `workers` searches run at
+once and at most `max_pending` more wait for a thread; past that, submit()
+raises SolverBusyError straight away. An overload is then answered with 503
+rather than by piling up threads and solver processes until everything is slow.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+from metrics import METRICS
+
+
+class SolverBusyError(RuntimeError):
+    """Every solver thread is busy and the wait queue is full; retry later"""
+
+
+class SolverExecutor:
+    """Fixed pool of solver threads with a bounded queue in front"""
+
+    def __init__(self, workers: int = 4, max_pending: int = 64):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(workers, 'ridex-solver')
+        # One slot per running or queued search
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue fn(*args) on a solver thread; raises SolverBusyError when the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            METRICS.count('solver.rejected')
+            raise SolverBusyError(f"Solver busy: {self.workers} searches running and "
+                                  f"{self.max_pending} queued")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self._pool.submit(self._run, time.perf_counter(), fn, args)
+        except BaseException:
+            self._release()
+            raise
+
+    def _run(self, queued_at: float, fn: Callable, args: tuple):
+        METRICS.observe('solver.queue_ms', (time.perf_counter() - queued_at) * 1000)
+        try:
+            return fn(*args)
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
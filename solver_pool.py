@@ -0,0 +1,197 @@
+"""
+Persistent graph_solver workers for RideX
+
+Each worker is a long-lived `graph_solver serve` process that keeps the last
+loaded graph in memory, so queries only send a one-line command instead of
+spawning a process and re-sending the whole graph.
+
+Builds of graph_solver older than the serve mode (such as a stale prebuilt
+graph_solver.exe) are detected through `graph_solver modes` when a pool is
+created, and rejected with SolverUnavailableError instead of failing every query.
+"""
+import atexit
+import os
+import queue
+import subprocess
+import threading
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from metrics import METRICS
+
+REBUILD_HINT = "rebuild it with: g++ -O2 -std=c++17 -o graph_solver graph_solver.cpp"
+
+_modes: Dict[Tuple[str, int], FrozenSet[str]] = {}  # (path, mtime) -> modes
+_modes_lock = threading.Lock()
+
+
+class SolverUnavailableError(RuntimeError):
+    """The graph_solver executable is missing or lacks a mode the caller needs"""
+
+
+def solver_modes(exe_path: str) -> FrozenSet[str]:
+    """Modes an executable supports; empty if it is missing or predates `graph_solver modes`"""
+    try:
+        key = (exe_path, os.stat(exe_path).st_mtime_ns)
+    except OSError:
+        return frozenset()
+    with _modes_lock:
+        modes = _modes.get(key)
+    if modes is None:
+        try:
+            # Older builds read a graph from stdin for unknown modes: empty input, no output
+            output = subprocess.run([exe_path, 'modes'], input='', capture_output=True,
+                                    text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            output = ''
+        modes = frozenset(output.split())
+        with _modes_lock:
+            _modes[key] = modes
+    return modes
+
+
+class SolverWorker:
+    """One `graph_solver serve` process speaking the line protocol"""
+
+    def __init__(self, exe_path: str):
+        self.exe_path = exe_path
+        self.process: Optional[subprocess.Popen] = None
+        # (solver input, directed) currently loaded in the process
+        self._loaded: Optional[Tuple[str, bool]] = None
+
+    def _start(self):
+        METRICS.count('solver.worker_starts')
+        self.process = subprocess.Popen(
+            [self.exe_path, 'serve'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+        self._loaded = None
+
+    def close(self):
+        """Stop the worker process"""
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except Exception:
+                self.process.kill()
+            self.process = None
+            self._loaded = None
+
+    def _is_loaded(self, input_str: str, directed: bool) -> bool:
+        if self._loaded is None or self._loaded[1] != directed:
+            return False
+        loaded = self._loaded[0]
+        return loaded is input_str or loaded == input_str
+
+    def _read_response(self) -> List[str]:
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise EOFError("graph_solver worker exited")
+            line = line.rstrip('\n')
+            if line == 'END':
+                return lines
+            lines.append(line)
+
+    def run_batch(self, input_str: str, queries: List[str], directed: bool = False) -> List[List[str]]:
+        """Send queries against the given graph in one round-trip; one output list per query"""
+        if self.process is None or self.process.poll() is not None:
+            self._start()
+
+        reload = not self._is_loaded(input_str, directed)
+        payload = []
+        if reload:
+            header, _, edges = input_str.partition('\n')
+            payload.append(f"load {header}{' directed' if directed else ''}\n{edges}")
+            if edges and not edges.endswith('\n'):
+                payload.append('\n')
+        payload.extend(query + '\n' for query in queries)
+        payload.append('sync\n')
+
+        # Write from a separate thread while this one reads: the server only flushes on sync
+        # or a full buffer, so writing a large batch first could fill both pipes and deadlock
+        stdin = self.process.stdin
+        write_error: List[BaseException] = []
+
+        def write():
+            try:
+                stdin.write(''.join(payload))
+                stdin.flush()
+            except BaseException as e:
+                write_error.append(e)
+
+        writer = threading.Thread(target=write, name='solver-writer', daemon=True)
+        writer.start()
+        # On a read error the pool closes this worker, which also ends a blocked writer
+        if reload:
+            # Includes sending the graph: the cost a one-shot solver pays on every query
+            with METRICS.timer('solver.load_ms'):
+                self._read_response()
+            self._loaded = (input_str, directed)
+        responses = [self._read_response() for _ in queries]
+        writer.join()
+        if write_error:
+            raise write_error[0]
+        return responses
+
+
+class SolverPool:
+    """Fixed-size pool of SolverWorkers; crashed workers are restarted and retried once"""
+
+    def __init__(self, exe_path: str, size: int = 2):
+        if 'serve' not in solver_modes(exe_path):
+            raise SolverUnavailableError(f"{exe_path} is missing or was built without the serve mode; "
+                                         f"{REBUILD_HINT}")
+        self.exe_path = exe_path
+        self.size = size
+        self._idle: "queue.Queue[SolverWorker]" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(SolverWorker(exe_path))
+
+    def run_batch(self, input_str: str, queries: List[str], directed: bool = False) -> Optional[List[List[str]]]:
+        """Run a batch on an idle worker; None if the solver could not answer"""
+        worker = self._idle.get()
+        try:
+            for attempt in range(2):
+                try:
+                    return worker.run_batch(input_str, queries, directed)
+                except (OSError, EOFError, ValueError):
+                    # Broken pipe or crash: restart the process and resend the graph
+                    METRICS.count('solver.worker_failures')
+                    worker.close()
+            return None
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        """Stop all idle workers"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.close()
+
+
+_default_pools = {}
+_default_pools_lock = threading.Lock()
+
+
+def get_pool(exe_path: str, size: int = 2) -> SolverPool:
+    """Shared pool per solver executable, created on first use"""
+    with _default_pools_lock:
+        pool = _default_pools.get(exe_path)
+        if pool is None:
+            pool = SolverPool(exe_path, size)
+            _default_pools[exe_path] = pool
+        return pool
+
+
+@atexit.register
+def _close_pools():
+    for pool in _default_pools.values():
+        pool.close()
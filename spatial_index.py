@@ -0,0 +1,155 @@
+"""
+Spatial indexing for RideX
+
+Uniform lon/lat grid used to snap GPS coordinates to intersections and to find
+drivers near a point without scanning the whole fleet.
+"""
+import heapq
+import math
+from typing import List, Dict, Tuple, Set, Hashable, Callable, Optional, Sequence
+
+try:
+    import numpy as np  # Optional: vectorizes bulk distance computation
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+def haversine_km(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """Great-circle distance between two lon/lat points (km)"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dlon / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_many(lon1: Sequence[float], lat1: Sequence[float],
+                   lon2: Sequence[float], lat2: Sequence[float]) -> List[float]:
+    """haversine_km over equal-length coordinate columns; uses numpy when installed"""
+    if np is not None:
+        lon1, lat1, lon2, lat2 = (np.radians(np.asarray(c, dtype=np.float64)) for c in (lon1, lat1, lon2, lat2))
+        a = (np.sin((lat2 - lat1) / 2) ** 2 +
+             np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+        return (EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).tolist()
+    return [haversine_km(*coords) for coords in zip(lon1, lat1, lon2, lat2)]
+
+
+class GridIndex:
+    """Points bucketed into square lon/lat cells; supports moves, k-nearest and radius queries"""
+
+    def __init__(self, cell_size: float = 0.01):
+        self.cell_size = cell_size  # Degrees; 0.01 is roughly 1 km
+        self.cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self.points: Dict[Hashable, Tuple[float, float]] = {}
+        self._bounds: Optional[Tuple[int, int, int, int]] = None  # Cell x/y range ever used
+
+    def _cell(self, lon: float, lat: float) -> Tuple[int, int]:
+        return (math.floor(lon / self.cell_size), math.floor(lat / self.cell_size))
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self.points
+
+    def insert(self, item: Hashable, lon: float, lat: float):
+        """Add an item, or move it if already indexed"""
+        if item in self.points:
+            self.remove(item)
+        self.points[item] = (lon, lat)
+        cell = self._cell(lon, lat)
+        self.cells.setdefault(cell, set()).add(item)
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[0], cell[1], cell[1])
+        else:
+            min_x, max_x, min_y, max_y = self._bounds
+            self._bounds = (min(min_x, cell[0]), max(max_x, cell[0]), min(min_y, cell[1]), max(max_y, cell[1]))
+
+    def remove(self, item: Hashable):
+        """Drop an item if present"""
+        point = self.points.pop(item, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(item)
+            if not bucket:
+                del self.cells[cell]
+
+    def _ring(self, cx: int, cy: int, r: int):
+        """Cells at Chebyshev distance exactly r from (cx, cy)"""
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def _ring_lower_bound(self, lat: float, r: int) -> float:
+        """Distance (km) that every point in ring r or beyond is at least away"""
+        if r <= 1:
+            return 0.0
+        # Longitude degrees are shortest at the highest latitude the ring can reach
+        max_lat = min(abs(lat) + r * self.cell_size, 89.9)
+        return (r - 1) * self.cell_size * KM_PER_DEGREE * math.cos(math.radians(max_lat))
+
+    def _max_ring(self, cx: int, cy: int) -> int:
+        """Ring beyond which no indexed cell can lie"""
+        if self._bounds is None:
+            return 0
+        min_x, max_x, min_y, max_y = self._bounds
+        return max(abs(min_x - cx), abs(max_x - cx), abs(min_y - cy), abs(max_y - cy))
+
+    def nearest(self, lon: float, lat: float, k: int = 1,
+                predicate: Optional[Callable[[Hashable], bool]] = None) -> List[Tuple[float, Hashable]]:
+        """k nearest items as (distance_km, item), nearest first"""
+        if k <= 0 or not self.points:
+            return []
+        cx, cy = self._cell(lon, lat)
+        best: List[Tuple[float, Hashable]] = []  # Max-heap via negated distance
+        counter = 0
+        for r in range(self._max_ring(cx, cy) + 1):
+            if len(best) == k and -best[0][0] < self._ring_lower_bound(lat, r):
+                break
+            for cell in self._ring(cx, cy, r):
+                for item in self.cells.get(cell, ()):
+                    if predicate is not None and not predicate(item):
+                        continue
+                    d = haversine_km(lon, lat, *self.points[item])
+                    counter += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, counter, item))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, counter, item))
+        return sorted(((-neg_d, item) for neg_d, _, item in best), key=lambda entry: entry[0])
+
+    def within_radius(self, lon: float, lat: float, radius_km: float) -> List[Tuple[float, Hashable]]:
+        """All items within radius_km as (distance_km, item), nearest first"""
+        cx, cy = self._cell(lon, lat)
+        # Cells needed in each axis, using the narrowest longitude degree in range
+        lat_span = radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(abs(lat) + lat_span, 89.9)))
+        rx = math.ceil(radius_km / (KM_PER_DEGREE * cos_lat) / self.cell_size)
+        ry = math.ceil(lat_span / self.cell_size)
+
+        found = []
+        if (2 * rx + 1) * (2 * ry + 1) > len(self.cells):
+            cells = [cell for cell in self.cells
+                     if abs(cell[0] - cx) <= rx and abs(cell[1] - cy) <= ry]
+        else:
+            cells = [(cx + dx, cy + dy) for dx in range(-rx, rx + 1) for dy in range(-ry, ry + 1)]
+        for cell in cells:
+            for item in self.cells.get(cell, ()):
+                d = haversine_km(lon, lat, *self.points[item])
+                if d <= radius_km:
+                    found.append((d, item))
+        found.sort(key=lambda entry: entry[0])
+        return found
@@ -38,7 +38,8 @@ let candidateMarkers = [];
 let currentRideOptions = null;
 
 // Load city map data
-fetch('/api/city-map?t=' + Date.now())
+// The server answers with an ETag and revalidation, so no cache-buster is needed
+fetch('/api/city-map')
     .then(res => res.json())
     .then(data => {
         if (data.success) {
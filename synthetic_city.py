@@ -0,0 +1,129 @@
+"""
+Synthetic road networks for RideX benchmarks and tests
+
+Grid cities (jittered Manhattan blocks) and random geometric cities (each
+intersection joined to its nearest neighbours), from a few thousand to a
+million nodes, with edge weights in km like the built-in Lahore map.
+"""
+import math
+import random
+from array import array
+from typing import List, Tuple, Optional
+
+from city_map import CityMap, Driver, RideService
+from graph_engine import CSRGraph
+from map_io import NodePositions
+from spatial_index import haversine_many, KM_PER_DEGREE
+
+# Lahore center, so synthetic maps sit where the sample map does
+BASE_LON, BASE_LAT = 74.3436, 31.5497
+
+
+def _build(lon: array, lat: array, edges: List[Tuple[int, int]]) -> CityMap:
+    """CityMap with node IDs 0..N-1 and haversine edge weights"""
+    nodes = array('q', range(len(lon)))
+    us = [u for u, _ in edges]
+    vs = [v for _, v in edges]
+    weights = haversine_many([lon[u] for u in us], [lat[u] for u in us],
+                             [lon[v] for v in vs], [lat[v] for v in vs])
+    node_to_idx = {node: node for node in nodes}
+    csr = CSRGraph(nodes, list(zip(us, vs, weights)), node_to_idx=node_to_idx)
+    return CityMap.from_snapshot(csr, NodePositions(node_to_idx, lon, lat))
+
+
+def grid_city(num_nodes: int, block_km: float = 0.2, jitter: float = 0.25, seed: Optional[int] = None) -> CityMap:
+    """
+    Roughly square grid of about num_nodes intersections, block_km apart
+    Intersections are nudged by up to jitter x block size so routes have unique lengths.
+    """
+    rng = random.Random(seed)
+    side = max(2, math.isqrt(num_nodes))
+    step_lat = block_km / KM_PER_DEGREE
+    step_lon = step_lat / math.cos(math.radians(BASE_LAT))
+    lon, lat = array('d'), array('d')
+    for row in range(side):
+        for col in range(side):
+            lon.append(BASE_LON + (col + rng.uniform(-jitter, jitter)) * step_lon)
+            lat.append(BASE_LAT + (row + rng.uniform(-jitter, jitter)) * step_lat)
+
+    edges = []
+    for row in range(side):
+        for col in range(side):
+            node = row * side + col
+            if col + 1 < side:
+                edges.append((node, node + 1))
+            if row + 1 < side:
+                edges.append((node, node + side))
+    return _build(lon, lat, edges)
+
+
+def random_geometric_city(num_nodes: int, neighbors: int = 3, density_per_km2: float = 25.0,
+                          seed: Optional[int] = None) -> CityMap:
+    """
+    num_nodes intersections scattered uniformly, each joined to its `neighbors` nearest
+    Not guaranteed connected; with neighbors >= 3 almost all nodes end up in one component.
+    """
+    rng = random.Random(seed)
+    side_km = math.sqrt(num_nodes / density_per_km2)
+    span_lat = side_km / KM_PER_DEGREE
+    span_lon = span_lat / math.cos(math.radians(BASE_LAT))
+    lon = array('d', (BASE_LON + rng.random() * span_lon for _ in range(num_nodes)))
+    lat = array('d', (BASE_LAT + rng.random() * span_lat for _ in range(num_nodes)))
+
+    # Bucket points on a planar km grid; neighbours come from the surrounding 3x3 cells
+    # (widened if too few), which at city scale is indistinguishable from haversine order
+    spacing = side_km / math.sqrt(num_nodes)
+    cell_km = spacing
+    xs = [(x - BASE_LON) / span_lon * side_km for x in lon]
+    ys = [(y - BASE_LAT) / span_lat * side_km for y in lat]
+    cells = {}
+    for node in range(num_nodes):
+        cells.setdefault((int(xs[node] // cell_km), int(ys[node] // cell_km)), []).append(node)
+    seen = set()
+    edges = []
+    for node in range(num_nodes):
+        x, y = xs[node], ys[node]
+        cx, cy = int(x // cell_km), int(y // cell_km)
+        reach = 1
+        while True:
+            candidates = [other for i in range(cx - reach, cx + reach + 1) for j in range(cy - reach, cy + reach + 1)
+                          for other in cells.get((i, j), ()) if other != node]
+            if len(candidates) >= neighbors or len(candidates) == num_nodes - 1:
+                break
+            reach += 1
+        candidates.sort(key=lambda other: (xs[other] - x) ** 2 + (ys[other] - y) ** 2)
+        for other in candidates[:neighbors]:
+            key = (node, other) if node < other else (other, node)
+            if key not in seen:
+                seen.add(key)
+                edges.append(key)
+    return _build(lon, lat, edges)
+
+
+def add_drivers(ride_service: RideService, count: int, seed: Optional[int] = None) -> List[Driver]:
+    """Register count available drivers at random intersections"""
+    rng = random.Random(seed)
+    nodes = sorted(ride_service.city_map.graph.nodes)
+    manager = ride_service.driver_manager
+    first_id = max((driver.driver_id for driver in manager.drivers), default=0) + 1
+    car_types = ["Standard", "Premium", "Eco"]
+    drivers = []
+    for i in range(count):
+        driver = Driver(first_id + i, rng.choice(nodes), f"Driver {first_id + i}", rng.choice(car_types))
+        manager.add_driver(driver)
+        drivers.append(driver)
+    return drivers
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    if len(sys.argv) < 4 or sys.argv[1] not in ('grid', 'geometric'):
+        print("Usage: python synthetic_city.py <grid|geometric> <num_nodes> <output.map> [seed]")
+        sys.exit(1)
+    t0 = time.perf_counter()
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    generate = grid_city if sys.argv[1] == 'grid' else random_geometric_city
+    city = generate(int(sys.argv[2]), seed=seed)
+    city.save(sys.argv[3])
+    print(f"Wrote {len(city.graph.nodes)} nodes to {sys.argv[3]} in {time.perf_counter() - t0:.1f}s")
@@ -4,7 +4,33 @@ import os
 # Ensure current dir is in path
 sys.path.append(os.getcwd())
 
-from city_map import CityMap, GraphAlgorithms, RIDE_WORKFLOW_DEPENDENCIES
+from city_map import CityMap, Driver, DriverManager, Graph, GraphAlgorithms, RideService, RIDE_WORKFLOW_DEPENDENCIES
+from graph_engine import INF, InProcessGraphAlgorithms
+from region_shards import RegionShards
+from contraction import ContractionHierarchy
+from dispatch import solve_assignment
+from driver_feed import DriverFeed
+from distance_matrix import DistanceMatrix
+from workflow import WorkflowRegistry
+from map_tiles import FULL_DETAIL_ZOOM, MapTiles, mercator
+from metrics import METRICS, Histogram
+from route_cache import RouteCache
+from shared_graph import publish_graph
+from solver_executor import SolverBusyError, SolverExecutor
+from spatial_index import haversine_km
+from solver_pool import SolverPool, SolverUnavailableError, solver_modes
+from synthetic_city import add_drivers, grid_city, random_geometric_city
+import copy
+import gzip
+import itertools
+import json
+import logging
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import random
+import tempfile
 
 def test_graph_algorithms():
     print("Initializing City Map...")
@@ -59,5 +85,995 @@ def test_graph_algorithms():
     else:
         print("Topological Sort FAILED")
 
+def test_backend_parity():
+    print("\n--- Comparing In-Process Engine with C++ Solver ---")
+    city = CityMap()
+    mismatches = 0
+    for start in city.graph.nodes:
+        for end in city.graph.nodes:
+            cpp_path, cpp_dist = GraphAlgorithms.dijkstra(city.graph, start, end)
+            py_path, py_dist = InProcessGraphAlgorithms.dijkstra(city.graph, start, end)
+            # The C++ solver prints distances with 6 decimals
+            if cpp_path != py_path or abs(cpp_dist - py_dist) > 1e-5:
+                mismatches += 1
+    for name in ('prim_mst', 'kruskal_mst'):
+        cpp_edges = [(u, v) for u, v, _ in getattr(GraphAlgorithms, name)(city.graph)]
+        py_edges = [(u, v) for u, v, _ in getattr(InProcessGraphAlgorithms, name)(city.graph)]
+        if cpp_edges != py_edges:
+            mismatches += 1
+    # A build without the serve mode (like a stale prebuilt binary) is refused up front
+    if not {'serve', 'sssp'} <= solver_modes(GraphAlgorithms._solver_path()):
+        mismatches += 1
+    with tempfile.TemporaryDirectory() as tmp:
+        stale = os.path.join(tmp, 'graph_solver')
+        with open(stale, 'w') as f:
+            f.write("#!/bin/sh\ncat > /dev/null\n")
+        os.chmod(stale, 0o755)
+        try:
+            SolverPool(stale)
+            mismatches += 1
+        except SolverUnavailableError:
+            pass
+    if mismatches == 0:
+        print("Backend parity PASSED")
+    else:
+        print(f"Backend parity FAILED: {mismatches} mismatching results")
+
+def test_astar_parity():
+    print("\n--- Comparing A* and Bidirectional A* with Dijkstra on Random Graphs ---")
+    rng = random.Random(6)
+    mismatches = unreachable = 0
+    for _ in range(200):
+        n = rng.randint(2, 60)
+        positions = {node: (74.3 + rng.uniform(0, 0.05), 31.5 + rng.uniform(0, 0.05)) for node in range(n)}
+        # Up to three separate components, so some pairs are unreachable
+        component = [rng.randrange(rng.randint(1, 3)) for _ in range(n)]
+        graph = Graph()
+        for _ in range(rng.randint(1, 3 * n)):
+            u, v = rng.randrange(n), rng.randrange(n)
+            if u != v and component[u] == component[v]:
+                # Roads are never shorter than the straight line, so the heuristic stays admissible
+                graph.add_edge(u, v, haversine_km(*positions[u], *positions[v]) * rng.uniform(1.0, 2.0))
+        if not graph.nodes:
+            continue
+
+        def heuristic(u, v):
+            return haversine_km(*positions[u], *positions[v])
+
+        nodes = sorted(graph.nodes)
+        pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(30)] + [(nodes[0], nodes[0])]
+        for start, end in pairs:
+            expected = InProcessGraphAlgorithms.dijkstra(graph, start, end)
+            unreachable += not expected[0]
+            for search in (InProcessGraphAlgorithms.astar, InProcessGraphAlgorithms.bidirectional_astar):
+                path, distance = search(graph, start, end, heuristic)
+                if distance != expected[1] or bool(path) != bool(expected[0]):
+                    mismatches += 1
+                elif path and (path[0] != start or path[-1] != end):
+                    mismatches += 1
+    if mismatches == 0 and unreachable > 0:
+        print(f"A* parity PASSED ({unreachable} unreachable pairs)")
+    else:
+        print(f"A* parity FAILED: {mismatches} mismatching results")
+
+def test_kruskal_ties():
+    print("\n--- Comparing C++ and In-Process Kruskal on Tied Weights ---")
+    rng = random.Random(1)
+    mismatches = 0
+    for _ in range(200):
+        graph = Graph()
+        nodes = rng.sample(range(1000), rng.randint(2, 40))
+        for i in range(1, len(nodes)):
+            graph.add_edge(nodes[i], rng.choice(nodes[:i]), float(rng.randint(1, 3)))
+        for _ in range(rng.randint(0, 3 * len(nodes))):
+            u, v = rng.sample(nodes, 2)
+            graph.add_edge(u, v, float(rng.randint(1, 3)))  # Few distinct weights: many ties
+        cpp_tree = {(u, v) if u < v else (v, u) for u, v, _ in GraphAlgorithms.kruskal_mst(graph)}
+        py_tree = {(u, v) if u < v else (v, u) for u, v, _ in InProcessGraphAlgorithms.kruskal_mst(graph)}
+        if cpp_tree != py_tree:
+            mismatches += 1
+    if mismatches == 0:
+        print("Kruskal tie parity PASSED")
+    else:
+        print(f"Kruskal tie parity FAILED: {mismatches} of 200 graphs gave different trees")
+
+def test_graph_snapshot():
+    print("\n--- Testing Graph Snapshots and Versions ---")
+    failures = 0
+    graph = Graph()
+    for u, v, weight in [(1, 2, 1.0), (2, 3, 2.0), (3, 4, 1.5), (4, 1, 3.0)]:
+        graph.add_edge(u, v, weight)
+    snapshot = graph.snapshot()
+    version = graph.version
+    # Reused until a mutation
+    if graph.snapshot() is not snapshot or graph.snapshot() is not snapshot or snapshot.version != version:
+        failures += 1
+    graph.update_edges([(1, 2, 1.0), (3, 3, 5.0)])  # No-op updates
+    if graph.version != version or graph.snapshot() is not snapshot:
+        failures += 1
+
+    checks = [
+        ('add_edge', lambda: graph.add_edge(1, 3, 0.5), (1, 3, 0.5)),
+        ('add_edge new node', lambda: graph.add_edge(4, 5, 2.5), (4, 5, 2.5)),
+        ('reweight', lambda: graph.update_edges([(2, 3, 4.0)]), (2, 3, 4.0)),
+        ('new road', lambda: graph.update_edges([(2, 4, 1.25)]), (2, 4, 1.25)),
+        ('closure', lambda: graph.update_edges([(3, 4, None)]), (3, 4, INF)),
+    ]
+    for name, mutate, (u, v, weight) in checks:
+        before = graph.snapshot()
+        old_weight = before.edge_weight(u, v)
+        mutate()
+        after = graph.snapshot()
+        if graph.version != version + 1 or after is before or after.version != graph.version:
+            print(f"  {name}: version {version} -> {graph.version}, snapshot reused: {after is before}")
+            failures += 1
+        elif after.edge_weight(u, v) != weight or after.edge_weight(v, u) != weight:
+            print(f"  {name}: snapshot has {after.edge_weight(u, v)}, expected {weight}")
+            failures += 1
+        elif before.edge_weight(u, v) != old_weight:
+            print(f"  {name}: old snapshot changed")  # Readers holding it must not see the edit
+            failures += 1
+        if graph.snapshot() is not after:
+            failures += 1
+        version = graph.version
+    if failures == 0:
+        print("Graph snapshot PASSED")
+    else:
+        print(f"Graph snapshot FAILED: {failures} failed checks")
+
+def test_route_cache():
+    print("\n--- Checking Route Cache Against Fresh Searches After Traffic ---")
+    city = grid_city(400, seed=5)
+    cache = RouteCache(InProcessGraphAlgorithms, lower_bound=city._distance)
+    rng = random.Random(5)
+    nodes = sorted(city.graph.nodes)
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(150)]
+    searches = [(rng.choice(nodes), [rng.choice(nodes) for _ in range(30)]) for _ in range(20)]
+    roads = [(u, v) for u in nodes for v, _ in city.graph.get_neighbors(u) if u < v]
+    mismatches = 0
+    for tick in range(6):
+        # Both directions share an entry, so distances may differ in the last bit
+        for start, end in pairs:
+            cached = cache.dijkstra(city.graph, start, end)[1]
+            if abs(cached - InProcessGraphAlgorithms.dijkstra(city.graph, start, end)[1]) > 1e-9:
+                mismatches += 1
+        for start, targets in searches:
+            cached = cache.dijkstra_one_to_many(city.graph, start, targets, 3)
+            fresh = InProcessGraphAlgorithms.dijkstra_one_to_many(city.graph, start, targets, 3)
+            if sorted(cached) != sorted(fresh) or any(abs(cached[t][1] - fresh[t][1]) > 1e-9 for t in fresh):
+                mismatches += 1
+        # Slow some roads down, close some, and give others back their free-flow speed
+        updates = [(u, v, rng.choice([1.0, 1.0, 1.5, 3.0, None])) for u, v in rng.sample(roads, 25)]
+        city.set_traffic(updates)
+    stats = cache.stats()
+    # One-to-many results stay out of the point-to-point LRU
+    if stats['size'] > len(pairs) or stats['searches'] == 0:
+        mismatches += 1
+    if mismatches == 0 and stats['hits'] > 0:
+        print(f"Route cache PASSED ({stats['hits']} hits, {stats['dropped']} entries dropped)")
+    else:
+        print(f"Route cache FAILED: {mismatches} stale results")
+
+def test_contraction_hierarchy():
+    print("\n--- Comparing Contraction Hierarchy with Dijkstra ---")
+    city = grid_city(600, seed=7)
+    index = ContractionHierarchy.build(city.graph)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'city.ch')
+        index.save(path)
+        loaded = ContractionHierarchy.load(path)
+    rng = random.Random(7)
+    nodes = sorted(city.graph.nodes)
+    mismatches = 0 if loaded.matches(city.graph) else 1
+    for _ in range(200):
+        start, end = rng.choice(nodes), rng.choice(nodes)
+        path, distance = loaded.shortest_path(start, end)
+        expected = InProcessGraphAlgorithms.dijkstra(city.graph, start, end)[1]
+        if abs(distance - expected) > 1e-9 or path[0] != start or path[-1] != end:
+            mismatches += 1
+    for _ in range(20):
+        start = rng.choice(nodes)
+        targets = [rng.choice(nodes) for _ in range(20)]
+        for limit in (None, 3):
+            ch = loaded.one_to_many(start, targets, limit)
+            expected = InProcessGraphAlgorithms.dijkstra_one_to_many(city.graph, start, targets, limit)
+            if sorted(ch) != sorted(expected) or any(abs(ch[t][1] - expected[t][1]) > 1e-9 for t in expected):
+                mismatches += 1
+    if mismatches == 0:
+        print("Contraction hierarchy PASSED")
+    else:
+        print(f"Contraction hierarchy FAILED: {mismatches} mismatching results")
+
+def test_driver_pruning():
+    print("\n--- Comparing Pruned Driver Search with a Full-Fleet Search ---")
+    city = random_geometric_city(800, seed=8)
+    pruned = DriverManager(city, InProcessGraphAlgorithms, spatial_pruning=True, initialize=False)
+    full = DriverManager(city, InProcessGraphAlgorithms, spatial_pruning=False, initialize=False)
+    rng = random.Random(8)
+    nodes = sorted(city.graph.nodes)
+    for driver_id in range(150):
+        location, car_type = rng.choice(nodes), rng.choice(['Standard', 'Premium', 'Eco'])
+        pruned.add_driver(Driver(driver_id, location, f"Driver {driver_id}", car_type))
+        full.add_driver(Driver(driver_id, location, f"Driver {driver_id}", car_type))
+    mismatches = 0
+    for _ in range(100):
+        pickup = rng.choice(nodes)
+        car_type = rng.choice([None, 'Eco'])
+        got = [(round(d, 9), driver.driver_id) for driver, _, d in pruned.find_nearby_drivers(pickup, 3, car_type)]
+        expected = [(round(d, 9), driver.driver_id) for driver, _, d in full.find_nearby_drivers(pickup, 3, car_type)]
+        # Drivers sharing a node tie, so only the distances must agree
+        if [d for d, _ in got] != [d for d, _ in expected]:
+            mismatches += 1
+    if mismatches == 0:
+        print("Driver pruning PASSED")
+    else:
+        print(f"Driver pruning FAILED: {mismatches} different answers")
+
+def _brute_force_assignment(costs):
+    """(riders matched, total cost) of the best matching, trying every driver for every rider"""
+    riders = list(costs)
+    best = (0, 0.0)
+    options = [list(costs[rider]) + [None] for rider in riders]
+    for choice in itertools.product(*options):
+        drivers = [driver for driver in choice if driver is not None]
+        if len(drivers) != len(set(drivers)):
+            continue
+        total = sum(costs[rider][driver] for rider, driver in zip(riders, choice) if driver is not None)
+        if len(drivers) > best[0] or (len(drivers) == best[0] and total < best[1]):
+            best = (len(drivers), total)
+    return best
+
+def test_assignment():
+    print("\n--- Comparing Dispatch Assignment with Brute Force ---")
+    rng = random.Random(10)
+    mismatches = 0
+    for _ in range(200):
+        riders = rng.randint(1, 5)
+        drivers = rng.randint(1, 5)
+        costs = {}
+        for rider in range(riders):
+            # Sparse tables: not every driver is a candidate for every rider
+            costs[rider] = {f"d{d}": round(rng.uniform(0.1, 10.0), 3) for d in range(drivers) if rng.random() < 0.7}
+        assignment = solve_assignment(costs)
+        used = list(assignment.values())
+        total = sum(costs[rider][driver] for rider, driver in assignment.items())
+        matched, best = _brute_force_assignment(costs)
+        if len(used) != len(set(used)) or len(assignment) != matched or abs(total - best) > 1e-9:
+            mismatches += 1
+    # Many riders at one pickup: every free driver can still be assigned
+    for batch, candidates in (([(0, 3)] * 11, 10), ([(0, 3)] * 6 + [(5, 3)] * 6, 1), ([(0, 3)] * 14, 10)):
+        service = RideService(backend='inprocess', solver_workers=0)
+        free = len(service.driver_manager.available_drivers())
+        results = service.dispatch_rides(batch, candidates_per_rider=candidates)
+        assigned = [result['assigned_driver_id'] for result in results if result['success']]
+        if len(assigned) != min(len(batch), free) or len(set(assigned)) != len(assigned):
+            mismatches += 1
+        service.close()
+    if mismatches == 0:
+        print("Assignment PASSED")
+    else:
+        print(f"Assignment FAILED: {mismatches} suboptimal matchings")
+
+def test_distance_matrix():
+    print("\n--- Comparing Distance Matrix with Dijkstra (Zero-Weight Roads Included) ---")
+    city = grid_city(300, seed=11)
+    rng = random.Random(11)
+    nodes = sorted(city.graph.nodes)
+    for _ in range(40):
+        u = rng.choice(nodes)
+        v, _ = rng.choice(city.graph.get_neighbors(u))
+        city.graph.add_edge(u, v, 0.0)
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        matrix = DistanceMatrix.build(city.graph, os.path.join(tmp, 'city.dm'))
+        csr = city.graph.snapshot()
+        for start in nodes[::7]:
+            for end in nodes[::5]:
+                path, distance = matrix.shortest_path(start, end)
+                expected = InProcessGraphAlgorithms.dijkstra(city.graph, start, end)[1]
+                walked = sum(csr.edge_weight(a, b) for a, b in zip(path, path[1:]))
+                if not path or path[0] != start or path[-1] != end or abs(distance - expected) > 1e-9 \
+                        or abs(walked - expected) > 1e-9:
+                    mismatches += 1
+    if mismatches == 0:
+        print("Distance matrix PASSED")
+    else:
+        print(f"Distance matrix FAILED: {mismatches} wrong routes")
+
+def test_batch_requests():
+    print("\n--- Comparing Batched Ride Requests with One-by-One Requests ---")
+    failures = 0
+    service = RideService(backend='inprocess', city_map=grid_city(400, seed=9),
+                          initialize_drivers=False, solver_workers=0)
+    add_drivers(service, 30, seed=9)
+    rng = random.Random(9)
+    nodes = sorted(service.city_map.graph.nodes)
+    pickups = rng.sample(nodes, 6)
+    batch = [(rng.choice(pickups), rng.choice(nodes)) for _ in range(40)]
+    batch += [batch[0], (pickups[0], pickups[0])]  # A repeated request and a zero-length ride
+
+    def comparable(result):
+        # Fares carry a random +-5% variation; everything else must match
+        result = copy.deepcopy(result)
+        for option in result.get('options', []):
+            del option['fare']
+        return result
+
+    searches = []
+    find_nearby_drivers = service.driver_manager.find_nearby_drivers
+
+    def counting_find(pickup_node, *args, **kwargs):
+        searches.append(pickup_node)
+        return find_nearby_drivers(pickup_node, *args, **kwargs)
+
+    service.driver_manager.find_nearby_drivers = counting_find
+    batched = service.request_rides(batch)
+    # Grouped by pickup: one driver search per distinct pickup
+    if sorted(searches) != sorted(set(pickup for pickup, _ in batch)):
+        failures += 1
+    single = [service.request_ride(pickup, dropoff) for pickup, dropoff in batch]
+    if len(batched) != len(batch):
+        failures += 1
+    for (pickup, dropoff), got, expected in zip(batch, batched, single):
+        if comparable(got) != comparable(expected):
+            failures += 1
+        elif got['success'] and (got['ride_details']['pickup']['node'], got['ride_details']['dropoff']['node']) != (pickup, dropoff):
+            failures += 1
+    service.close()
+    if failures == 0:
+        print("Batch requests PASSED")
+    else:
+        print(f"Batch requests FAILED: {failures} failed checks")
+
+def test_mst_cache():
+    print("\n--- Testing MST Cache and ETags ---")
+    import api
+    from app import app
+    failures = 0
+    service = RideService(backend='inprocess', city_map=grid_city(200, seed=3),
+                          initialize_drivers=False, solver_workers=0)
+    graph = service.city_map.graph
+
+    def pairs(edges):
+        return {(u, v) if u < v else (v, u) for u, v, _ in edges}
+
+    def fresh(algorithm):
+        if algorithm == 'Prim':
+            return service.graph_algorithms.prim_mst(graph)
+        return service.graph_algorithms.kruskal_mst(graph)
+
+    def road_off(tree):
+        # Some open road that is not part of tree
+        return next((u, v) for u in sorted(graph.nodes) for v, _ in graph.get_neighbors(u)
+                    if u < v and (u, v) not in tree)
+
+    # Unit level: kept across changes that cannot alter the tree, rebuilt otherwise
+    for algorithm, get_mst in (('Prim', service.get_mst_prim), ('Kruskal', service.get_mst_kruskal)):
+        mst = get_mst()
+        if get_mst() is not mst or pairs(mst['edges']) != pairs(fresh(algorithm)):
+            failures += 1
+        tree = pairs(mst['edges'])
+        u, v = road_off(tree)
+        if not RideService._mst_unaffected(mst, [(u, v, 1.0, 2.0)]) or RideService._mst_unaffected(mst, [(u, v, 2.0, 1.0)]):
+            failures += 1
+        tree_u, tree_v = next(iter(sorted(tree)))
+        if RideService._mst_unaffected(mst, [(tree_u, tree_v, 1.0, 2.0)]):
+            failures += 1
+        service.update_traffic([(u, v, 3.0)])  # Slower road off the tree
+        if get_mst() is not mst:
+            failures += 1
+        service.update_traffic([(tree_u, tree_v, None)])  # Closed tree road
+        rebuilt = get_mst()
+        if rebuilt is mst or (tree_u, tree_v) in pairs(rebuilt['edges']) or pairs(rebuilt['edges']) != pairs(fresh(algorithm)):
+            failures += 1
+        service.update_traffic([(tree_u, tree_v, 1.0)])  # Reopened: may rejoin the tree
+        if get_mst() is rebuilt or pairs(get_mst()['edges']) != pairs(fresh(algorithm)):
+            failures += 1
+        a, b = sorted(graph.nodes)[0], sorted(graph.nodes)[-1]
+        graph.add_edge(a, b, 0.001)  # New shortcut road
+        if (a, b) not in pairs(get_mst()['edges']) or pairs(get_mst()['edges']) != pairs(fresh(algorithm)):
+            failures += 1
+        graph.update_edges([(a, b, None)])
+
+    # API level: ETag revalidation through the Flask app
+    previous_service = api._ride_service
+    api._ride_service = service
+    api._mst_bodies.clear()
+    try:
+        client = app.test_client()
+        for name in ('prim', 'kruskal'):
+            first = client.get(f'/api/mst/{name}')
+            etag = first.headers.get('ETag')
+            if first.status_code != 200 or not etag:
+                failures += 1
+                continue
+            if client.get(f'/api/mst/{name}', headers={'If-None-Match': etag}).status_code != 304:
+                failures += 1
+            tree = pairs(first.get_json()['data']['edges'])
+            u, v = road_off(tree)
+            client.post('/api/traffic', json={'updates': [{'u': u, 'v': v, 'factor': 2.5}]})
+            if client.get(f'/api/mst/{name}', headers={'If-None-Match': etag}).status_code != 304:
+                failures += 1
+            tree_u, tree_v = next(iter(sorted(tree)))
+            client.post('/api/traffic', json={'updates': [{'u': tree_u, 'v': tree_v, 'closed': True}]})
+            changed = client.get(f'/api/mst/{name}', headers={'If-None-Match': etag})
+            if changed.status_code != 200 or changed.headers.get('ETag') == etag:
+                failures += 1
+            elif pairs(changed.get_json()['data']['edges']) != pairs(fresh(name.capitalize())):
+                failures += 1
+            client.post('/api/traffic', json={'updates': [{'u': tree_u, 'v': tree_v, 'factor': 1.0}]})
+    finally:
+        api._ride_service = previous_service
+        api._mst_bodies.clear()
+        service.close()
+    if failures == 0:
+        print("MST cache PASSED")
+    else:
+        print(f"MST cache FAILED: {failures} failed checks")
+
+def test_workflow_registry():
+    print("\n--- Checking Compiled Workflow Plans ---")
+    registry = WorkflowRegistry()
+    failures = 0
+    premium = dict(RIDE_WORKFLOW_DEPENDENCIES, Inspect=['Assign'], Start=['Fare', 'Inspect'])
+    for name, dependencies in (('default', RIDE_WORKFLOW_DEPENDENCIES), ('Premium', premium)):
+        plan = registry.register(name, dependencies)
+        position = {task: i for i, task in enumerate(plan)}
+        if sorted(plan) != sorted(dependencies) or any(
+                position[prereq] > position[task] for task, prereqs in dependencies.items() for prereq in prereqs):
+            failures += 1
+    if registry.plan('Premium') == registry.plan() or 'Eco' in registry:
+        failures += 1
+    for broken in ({'A': ['B'], 'B': ['A']}, {'A': ['Missing']}):
+        try:
+            registry.register('broken', broken)
+            failures += 1
+        except ValueError:
+            pass
+    if 'broken' in registry:
+        failures += 1
+    if failures == 0:
+        print("Workflow registry PASSED")
+    else:
+        print(f"Workflow registry FAILED: {failures} failed checks")
+
+def test_driver_indexes():
+    print("\n--- Checking Driver Indexes After Bulk Updates ---")
+    city = grid_city(300, seed=14)
+    manager = DriverManager(city, InProcessGraphAlgorithms, initialize=False)
+    rng = random.Random(14)
+    nodes = sorted(city.graph.nodes)
+    for driver_id in range(120):
+        manager.add_driver(Driver(driver_id, rng.choice(nodes), f"Driver {driver_id}",
+                                  rng.choice(['Standard', 'Premium', 'Eco'])))
+    failures = 0
+    for _ in range(10):
+        updates = [(rng.randrange(130), rng.choice([None, rng.choice(nodes)]), rng.choice([None, True, False]))
+                   for _ in range(60)]
+        unknown = manager.update_drivers(updates)
+        if sorted(set(unknown)) != sorted({driver_id for driver_id, _, _ in updates if driver_id >= 120}):
+            failures += 1
+        drivers = manager.drivers
+        for car_type in (None, 'Standard', 'Premium', 'Eco'):
+            expected = {d.driver_id for d in drivers if d.available and car_type in (None, d.car_type)}
+            if {d.driver_id for d in manager.available_drivers(car_type)} != expected:
+                failures += 1
+        for node in nodes[::10]:
+            if {d.driver_id for d in manager.drivers_at(node)} != {d.driver_id for d in drivers if d.current_location == node}:
+                failures += 1
+        lon, lat = city.get_node_coordinates(nodes[0])
+        indexed = {i for _, i in manager.available_index.within_radius(lon, lat, 1000.0)}
+        if indexed != {d.driver_id for d in drivers if d.available}:
+            failures += 1
+    if failures == 0:
+        print("Driver indexes PASSED")
+    else:
+        print(f"Driver indexes FAILED: {failures} inconsistent lookups")
+
+def test_concurrent_requests():
+    print("\n--- Checking Concurrent Bookings and Requests ---")
+    service = RideService(backend='inprocess')
+    failures = 0
+    driver_id = service.driver_manager.available_drivers()[0].driver_id
+    barrier = threading.Barrier(16)
+
+    def book(_):
+        barrier.wait()
+        return service.book_ride(driver_id, 0, 5)['success']
+
+    with ThreadPoolExecutor(16) as pool:
+        if sum(pool.map(book, range(16))) != 1:
+            failures += 1  # Exactly one of the racing bookings may win
+
+    nodes = sorted(service.city_map.graph.nodes)
+    roads = [(u, v) for u in nodes for v, _ in service.city_map.graph.get_neighbors(u) if u < v]
+    stop = threading.Event()
+
+    def traffic():
+        rng = random.Random(15)
+        while not stop.is_set():
+            service.update_traffic([(u, v, rng.choice([1.0, 2.0])) for u, v in rng.sample(roads, 5)])
+
+    def ride(i):
+        result = service.request_ride(nodes[i % len(nodes)], nodes[(i * 7 + 3) % len(nodes)])
+        return result['success'] or result['error'] in ('No available drivers nearby',
+                                                         'No path found between pickup and dropoff locations')
+
+    writer = threading.Thread(target=traffic)
+    writer.start()
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            failures += sum(1 for ok in pool.map(ride, range(200)) if not ok)
+    finally:
+        stop.set()
+        writer.join()
+    if failures == 0:
+        print("Concurrent requests PASSED")
+    else:
+        print(f"Concurrent requests FAILED: {failures} failed checks")
+
+def test_shared_graph():
+    print("\n--- Checking Shared Graph Attach, Sync and Publish ---")
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ridex.graph')
+        first = RideService(backend='inprocess', city_map=grid_city(400, seed=16),
+                            initialize_drivers=False, solver_workers=0)
+        second = RideService(backend='inprocess', city_map=grid_city(400, seed=16),
+                             initialize_drivers=False, solver_workers=0)
+        first.attach_shared_graph(path)
+        second.attach_shared_graph(path)
+        graph = second.city_map.graph
+        # Attached workers look nodes up in the mapped arrays rather than private copies
+        if isinstance(graph.nodes, set) or isinstance(graph.snapshot().node_to_idx, dict):
+            failures += 1
+        nodes = sorted(first.city_map.graph.nodes)
+        if sorted(graph.nodes) != nodes or -1 in graph.nodes or 'x' in graph.nodes:
+            failures += 1
+        rng = random.Random(16)
+        pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(50)]
+        roads = [(u, v) for u in nodes for v, _ in first.city_map.graph.get_neighbors(u) if u < v]
+        u, v = roads[0]
+        second.city_map.set_traffic([(u, v, 2.0)])  # Remembers the road's free-flow length
+        first.city_map.set_traffic([(u, v, 3.0)] + [(a, b, None) for a, b in roads[1:20]])
+        if first.publish_graph() != 2 or not second.sync_shared_graph() or second.sync_shared_graph():
+            failures += 1
+        # The new generation's weights are the new free-flow lengths
+        second.city_map.set_traffic([(u, v, 1.0)])
+        if second.city_map.graph.edge_weight(u, v) != first.city_map.graph.edge_weight(u, v):
+            failures += 1
+        for start, end in pairs:
+            expected = InProcessGraphAlgorithms.dijkstra(first.city_map.graph, start, end)[1]
+            if InProcessGraphAlgorithms.dijkstra(second.city_map.graph, start, end)[1] != expected:
+                failures += 1
+        # Adding a road to an attached graph takes a private node set
+        graph.add_edge(nodes[0], 10 ** 9, 1.0)
+        if 10 ** 9 not in graph.nodes or 10 ** 9 in first.city_map.graph.nodes:
+            failures += 1
+        restored = pickle.loads(pickle.dumps(first.city_map.graph))
+        if sorted(restored.nodes) != nodes or restored.snapshot().node_to_idx[nodes[-1]] != len(nodes) - 1:
+            failures += 1
+        # Concurrent publishers each get their own generation
+        with ThreadPoolExecutor(8) as pool:
+            generations = list(pool.map(lambda _: publish_graph(first.city_map.graph, path), range(16)))
+        if sorted(generations) != list(range(3, 19)) or os.path.exists(path + '.lock'):
+            failures += 1
+    if failures == 0:
+        print("Shared graph PASSED")
+    else:
+        print(f"Shared graph FAILED: {failures} failed checks")
+
+def test_map_io():
+    print("\n--- Checking CSV Import and Binary Map Round Trip ---")
+    failures = 0
+    city = grid_city(300, seed=17)
+    nodes = sorted(city.graph.nodes)
+    roads = [(u, v, w) for u in nodes for v, w in city.graph.get_neighbors(u) if u < v]
+    with tempfile.TemporaryDirectory() as tmp:
+        nodes_path, edges_path, map_path = (os.path.join(tmp, name) for name in ('nodes.csv', 'edges.csv', 'city.map'))
+        with open(nodes_path, 'w') as f:
+            f.write("node_id,lon,lat\n")
+            f.writelines(f"{node},{city.node_positions[node][0]!r},{city.node_positions[node][1]!r}\n" for node in nodes)
+        with open(edges_path, 'w') as f:
+            f.write("u,v,weight_km\n")
+            # Some roads without a weight, some with one shorter than the straight line
+            for i, (u, v, w) in enumerate(roads):
+                weight = '' if i % 3 == 0 else repr(w / 2 if i % 3 == 1 else w * 2)
+                f.write(f"{u},{v},{weight}\n")
+        warnings = []
+        handler = logging.Handler(logging.WARNING)
+        handler.emit = warnings.append
+        logging.getLogger('map_io').addHandler(handler)
+        try:
+            loaded = CityMap.from_csv(nodes_path, edges_path)
+            # Only the roads given a too-short weight are reported, not the ones without a weight
+            too_short = sum(1 for i in range(len(roads)) if i % 3 == 1)
+            if len(warnings) != 1 or f"raised {too_short} of {len(roads)} road weights" not in warnings[0].getMessage():
+                failures += 1
+            with open(edges_path, 'w') as f:
+                f.write("u,v,weight_km\n")
+                f.writelines(f"{u},{v},{w!r}\n" for u, v, w in roads)
+            CityMap.from_csv(nodes_path, edges_path)
+            if len(warnings) != 1:
+                failures += 1
+        finally:
+            logging.getLogger('map_io').removeHandler(handler)
+        for i, (u, v, w) in enumerate(roads):
+            straight = city._distance(u, v)
+            expected = w * 2 if i % 3 == 2 else straight
+            if abs(loaded.graph.edge_weight(u, v) - expected) > 1e-9 or loaded.graph.edge_weight(u, v) < straight - 1e-9:
+                failures += 1
+        loaded.save(map_path)
+        restored = CityMap.load(map_path)
+    if sorted(restored.graph.nodes) != nodes or restored.graph.snapshot().fingerprint != loaded.graph.snapshot().fingerprint:
+        failures += 1
+    if any(restored.node_positions[node] != city.node_positions[node] for node in nodes):
+        failures += 1
+    rng = random.Random(17)
+    for _ in range(30):
+        start, end = rng.choice(nodes), rng.choice(nodes)
+        expected = InProcessGraphAlgorithms.dijkstra(loaded.graph, start, end)[1]
+        if abs(InProcessGraphAlgorithms.astar(restored.graph, start, end, restored._distance)[1] - expected) > 1e-9:
+            failures += 1
+    if failures == 0:
+        print("Map import PASSED")
+    else:
+        print(f"Map import FAILED: {failures} failed checks")
+
+def test_traffic_updates():
+    print("\n--- Checking Traffic Reweights, Closures and Reopenings Against a Rebuilt Graph ---")
+    city = grid_city(400, seed=18)
+    service = RideService(backend='inprocess', city_map=city, initialize_drivers=False, solver_workers=0)
+    rng = random.Random(18)
+    nodes = sorted(city.graph.nodes)
+    free_flow = {(u, v): w for u in nodes for v, w in city.graph.get_neighbors(u) if u < v}
+    weights = dict(free_flow)  # Expected current weight per road, None when closed
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(60)]
+    mismatches = 0
+    for tick in range(8):
+        # Warm the route and MST caches so each tick has something to invalidate
+        for start, end in pairs:
+            service.route_cache.dijkstra(city.graph, start, end)
+        service.get_mst_kruskal()
+        closed = [road for road, w in weights.items() if w is None]
+        updates = [(u, v, rng.choice([1.0, 1.5, 3.0, None])) for u, v in rng.sample(sorted(free_flow), 30)]
+        updates += [(u, v, rng.choice([1.0, 2.0])) for u, v in closed[:5]]  # Reopen some
+        service.update_traffic(updates)
+        for u, v, factor in updates:
+            weights[(u, v)] = None if factor is None else free_flow[(u, v)] * factor
+        fresh = Graph()
+        for (u, v), w in weights.items():
+            if w is not None:
+                fresh.add_edge(u, v, w)
+        for (u, v), w in weights.items():
+            if city.graph.edge_weight(u, v) != (INF if w is None else w):
+                mismatches += 1
+        for start, end in pairs:
+            expected = InProcessGraphAlgorithms.dijkstra(fresh, start, end)[1] if start in fresh.nodes and end in fresh.nodes else INF
+            if abs(service.route_cache.dijkstra(city.graph, start, end)[1] - expected) > 1e-9:
+                mismatches += 1
+        tree_weight = sum(w for _, _, w in service.get_mst_kruskal()['edges'])
+        if abs(tree_weight - sum(w for _, _, w in InProcessGraphAlgorithms.kruskal_mst(fresh))) > 1e-9:
+            mismatches += 1
+    if mismatches == 0:
+        print("Traffic updates PASSED")
+    else:
+        print(f"Traffic updates FAILED: {mismatches} mismatches")
+
+def test_metrics():
+    print("\n--- Checking Metrics Recording (Enabled and Disabled) ---")
+    failures = 0
+    service = RideService(backend='inprocess', solver_workers=0)
+    nodes = sorted(service.city_map.graph.nodes)
+    METRICS.reset()
+    profiler = METRICS.start_profiler(0.001)
+    for i in range(20):
+        service.request_ride(nodes[i % len(nodes)], nodes[(i * 7 + 3) % len(nodes)])
+    time.sleep(0.02)
+    METRICS.stop_profiler()
+    histograms = METRICS.snapshot()['histograms']
+    for name in ('ride.request_ms', 'ride.find_drivers_ms', 'ride.route_ms'):
+        if histograms.get(name, {}).get('count') != 20:
+            failures += 1
+    if not any(name.startswith('search.') and name.endswith('.settled') for name in histograms):
+        failures += 1
+    if profiler.samples == 0 or not profiler.collapsed():
+        failures += 1
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.add(value)
+    summary = histogram.summary()
+    if summary['count'] != 100 or summary['max'] != 100 or not 50 <= summary['p50'] <= summary['p99'] <= 100:
+        failures += 1
+    # Disabled: nothing is recorded and timers are the shared no-op
+    METRICS.reset()
+    METRICS.enabled = False
+    try:
+        for i in range(5):
+            service.request_ride(nodes[i], nodes[-1 - i])
+        snapshot = METRICS.snapshot()
+        if snapshot['counters'] or snapshot['histograms'] or METRICS.timer('x') is not METRICS.timer('y'):
+            failures += 1
+    finally:
+        METRICS.enabled = True
+        service.close()
+    if failures == 0:
+        print("Metrics PASSED")
+    else:
+        print(f"Metrics FAILED: {failures} failed checks")
+
+def test_snapshot_restore():
+    print("\n--- Checking Service Snapshot Save and Restore ---")
+    failures = 0
+    service = RideService(backend='inprocess', city_map=grid_city(300, seed=21),
+                          initialize_drivers=False, solver_workers=0)
+    add_drivers(service, 40, seed=21)
+    nodes = sorted(service.city_map.graph.nodes)
+    roads = [(u, v) for u in nodes for v, _ in service.city_map.graph.get_neighbors(u) if u < v]
+    service.update_traffic([(u, v, 2.0) for u, v in roads[:10]] + [(u, v, None) for u, v in roads[10:15]])
+    service.book_ride(service.driver_manager.available_drivers()[0].driver_id, nodes[0], nodes[-1])
+    service.workflows.register('Premium', dict(RIDE_WORKFLOW_DEPENDENCIES, Inspect=['Assign'], Start=['Fare', 'Inspect']))
+    service.build_contraction_hierarchy()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'service.snapshot')
+        service.save_snapshot(path)
+        restored = RideService.restore(path, backend='inprocess', solver_workers=0)
+    graph = restored.city_map.graph
+    if graph.snapshot().fingerprint != service.city_map.graph.snapshot().fingerprint or sorted(graph.nodes) != nodes:
+        failures += 1
+    if any(restored.city_map.node_positions[node] != service.city_map.node_positions[node] for node in nodes):
+        failures += 1
+
+    def fleet(manager):
+        return sorted((d.driver_id, d.current_location, d.available, d.car_type) for d in manager.drivers)
+
+    if fleet(restored.driver_manager) != fleet(service.driver_manager):
+        failures += 1
+    if restored.workflows.plan('Premium') != service.workflows.plan('Premium'):
+        failures += 1
+    if not isinstance(getattr(restored.route_cache.graph_algorithms, 'index', None), ContractionHierarchy):
+        failures += 1
+    rng = random.Random(21)
+    for _ in range(20):
+        pickup, dropoff = rng.choice(nodes), rng.choice(nodes)
+        found = [(d.driver_id, round(dist, 9)) for d, _, dist in restored.driver_manager.find_nearby_drivers(pickup)]
+        if found != [(d.driver_id, round(dist, 9)) for d, _, dist in service.driver_manager.find_nearby_drivers(pickup)]:
+            failures += 1
+        if abs(restored.route_cache.dijkstra(graph, pickup, dropoff)[1]
+               - InProcessGraphAlgorithms.dijkstra(service.city_map.graph, pickup, dropoff)[1]) > 1e-9:
+            failures += 1
+    # Traffic factors still apply to the original free-flow lengths
+    u, v = roads[0]
+    restored.update_traffic([(u, v, 1.0)])
+    service.update_traffic([(u, v, 1.0)])
+    if graph.edge_weight(u, v) != service.city_map.graph.edge_weight(u, v):
+        failures += 1
+    service.close()
+    restored.close()
+    if failures == 0:
+        print("Snapshot restore PASSED")
+    else:
+        print(f"Snapshot restore FAILED: {failures} failed checks")
+
+def test_driver_feed():
+    print("\n--- Checking Driver Feed Deltas, Stale Frames and Resyncs ---")
+    failures = 0
+    city = grid_city(200, seed=22)
+    manager = DriverManager(city, initialize=False)
+    nodes = sorted(city.graph.nodes)
+    for i in range(20):
+        manager.add_driver(Driver(i + 1, nodes[i * 7]))
+    feed = DriverFeed(manager, tick=3600, max_pending=4)  # Frames are published by hand below
+
+    def decode(frame):
+        lines = frame.decode().split('\n')
+        return lines[0][len('event: '):], json.loads(lines[2][len('data: '):])
+
+    stream = feed.stream(keepalive=5.0)
+    event, snapshot = decode(next(stream))
+    subscription = next(iter(feed._subscriptions))
+    if event != 'snapshot' or len(snapshot['drivers']) != 20:
+        failures += 1
+    # A delta read before the snapshot was taken must not reach the client
+    subscription.push(snapshot['version'], b"event: delta\nid: 0\ndata: {}\n\n")
+    manager.set_driver_location(1, nodes[-1])
+    manager.set_driver_availability(2, False)
+    feed.publish([subscription])
+    event, delta = decode(next(stream))
+    rows = {row[0]: row for row in delta.get('drivers', [])}
+    if event != 'delta' or delta['version'] <= snapshot['version'] or set(rows) != {1, 2}:
+        failures += 1
+    elif rows[1][1] != nodes[-1] or rows[2][4] is not False:
+        failures += 1
+    # Overflow: the client gets a fresh snapshot at once, not after the keepalive
+    for i in range(10):
+        manager.set_driver_location(3, nodes[i])
+        feed.publish([subscription])
+    started = time.perf_counter()
+    event, resync = decode(next(stream))
+    if event != 'snapshot' or time.perf_counter() - started > 1.0:
+        failures += 1
+    elif {row[0]: row[1] for row in resync['drivers']}[3] != nodes[9]:
+        failures += 1
+    stream.close()
+    if feed._subscriptions:
+        failures += 1
+    if failures == 0:
+        print("Driver feed PASSED")
+    else:
+        print(f"Driver feed FAILED: {failures} failed checks")
+
+def test_map_tiles():
+    print("\n--- Checking Map Tiles: Single Build per Cold Tile, Invalidation on Road Changes ---")
+    failures = 0
+    city = grid_city(900, seed=23)
+    tiles = MapTiles(city)
+    nodes = sorted(city.graph.nodes)
+    z = FULL_DETAIL_ZOOM
+    mx, my = mercator(*city.node_positions[nodes[450]])
+    key = (z, int(mx * (1 << z)), int(my * (1 << z)))
+    encode = tiles._encode
+    builds = []
+    release = threading.Event()
+
+    def slow_encode(*args):
+        builds.append(args[:3])
+        if args[:3] == key:
+            release.wait(5)
+        return encode(*args)
+
+    tiles._encode = slow_encode
+    warm = (key[0], key[1] + 1, key[2])
+    tiles.tile(*warm)
+    with ThreadPoolExecutor(8) as pool:
+        pending = [pool.submit(tiles.tile, *key) for _ in range(8)]
+        time.sleep(0.1)
+        # A cached tile is served while the cold one is still being built
+        started = time.perf_counter()
+        tiles.tile(*warm)
+        if time.perf_counter() - started > 0.5:
+            failures += 1
+        release.set()
+        results = [future.result() for future in pending]
+    if builds.count(key) != 1 or len(set(results)) != 1:
+        failures += 1
+    body = json.loads(gzip.decompress(results[0][1]))
+    in_tile = {node for node, _, _ in body['nodes']}
+    roads = {(u, v) for u, v, *_ in body['roads']}
+    if not in_tile:
+        failures += 1
+    for node in in_tile:
+        for v, _ in city.graph.get_neighbors(node):
+            if (node, v) not in roads and (v, node) not in roads:
+                failures += 1
+    # Traffic keeps the tile; a new road rebuilds it
+    u, v = next((a, b) for a, b in roads)
+    city.set_traffic([(u, v, 2.0)])
+    if tiles.tile(*key) != results[0] or builds.count(key) != 1:
+        failures += 1
+    far = nodes[0] if nodes[0] not in in_tile else nodes[-1]
+    city.graph.add_edge(next(iter(in_tile)), far, 100.0)
+    if tiles.tile(*key) == results[0] or builds.count(key) != 2:
+        failures += 1
+    if failures == 0:
+        print("Map tiles PASSED")
+    else:
+        print(f"Map tiles FAILED: {failures} failed checks")
+
+def test_single_flight():
+    print("\n--- Checking Coalesced Searches and Solver Backpressure ---")
+    failures = 0
+    city = grid_city(400, seed=25)
+    nodes = sorted(city.graph.nodes)
+    release = threading.Event()
+    calls = []
+
+    class SlowSearch:
+        """In-process search that holds its solver thread until released"""
+
+        @staticmethod
+        def dijkstra(graph, start, end):
+            calls.append((start, end))
+            release.wait(5)
+            return InProcessGraphAlgorithms.dijkstra(graph, start, end)
+
+    executor = SolverExecutor(workers=1, max_pending=1)
+    cache = RouteCache(SlowSearch, executor=executor)
+    start, end = nodes[0], nodes[-1]
+    try:
+        with ThreadPoolExecutor(9) as pool:
+            # Identical searches (either direction) share one solver run
+            pending = [pool.submit(cache.dijkstra, city.graph, *((start, end) if i % 2 else (end, start)))
+                       for i in range(8)]
+            time.sleep(0.1)
+            queued = pool.submit(cache.dijkstra, city.graph, nodes[1], nodes[-2])
+            time.sleep(0.1)
+            # One search running and one queued: the next distinct search is refused at once
+            started = time.perf_counter()
+            try:
+                cache.dijkstra(city.graph, nodes[2], nodes[-3])
+                failures += 1
+            except SolverBusyError:
+                if time.perf_counter() - started > 0.5:
+                    failures += 1
+            release.set()
+            results = [future.result() for future in pending]
+            queued.result()
+        expected = InProcessGraphAlgorithms.dijkstra(city.graph, start, end)[1]
+        if calls.count((start, end)) != 1 or cache.stats()['coalesced'] != 7:
+            failures += 1
+        if any(abs(distance - expected) > 1e-9 or {path[0], path[-1]} != {start, end} for path, distance in results):
+            failures += 1
+        stats = executor.stats()
+        if stats['rejected'] != 1 or stats['in_flight'] != 0 or stats['completed'] != 2:
+            failures += 1
+        # Capacity is back once the backlog drains
+        cache.dijkstra(city.graph, nodes[2], nodes[-3])
+    except SolverBusyError:
+        failures += 1
+    finally:
+        executor.shutdown()
+    if failures == 0:
+        print("Single-flight PASSED")
+    else:
+        print(f"Single-flight FAILED: {failures} failed checks")
+
+def test_region_shards():
+    print("\n--- Comparing Region Shards with Whole-Graph Dijkstra ---")
+    city = CityMap()
+    shards = RegionShards.build(city.graph, city.node_positions, regions=3)
+    mismatches = 0
+    try:
+        for start in city.graph.nodes:
+            for end in city.graph.nodes:
+                # Stitched routes must match exactly, not just within rounding
+                if shards.shortest_path(start, end)[1] != InProcessGraphAlgorithms.dijkstra(city.graph, start, end)[1]:
+                    mismatches += 1
+    finally:
+        shards.close()
+    # A shard process dying mid-service: the failing query and later ones use plain search
+    service = RideService(backend='inprocess', solver_workers=0)
+    shards = service.use_region_shards(regions=3)
+    nodes = sorted(service.city_map.graph.nodes)
+    try:
+        shards.shards[1].process.kill()
+        shards.shards[1].process.join()
+        for start, end in itertools.product(nodes, nodes):
+            # Both directions share a cache entry, so compare within rounding
+            if abs(service.route_cache.dijkstra(service.city_map.graph, start, end)[1]
+                   - InProcessGraphAlgorithms.dijkstra(service.city_map.graph, start, end)[1]) > 1e-9:
+                mismatches += 1
+        if shards.healthy or not service.driver_manager.find_nearby_drivers(nodes[0]):
+            mismatches += 1
+    finally:
+        service.close()
+    if mismatches == 0:
+        print("Region shards PASSED")
+    else:
+        print(f"Region shards FAILED: {mismatches} mismatching distances")
+
 if __name__ == "__main__":
     test_graph_algorithms()
+    test_backend_parity()
+    test_astar_parity()
+    test_kruskal_ties()
+    test_graph_snapshot()
+    test_route_cache()
+    test_contraction_hierarchy()
+    test_driver_pruning()
+    test_assignment()
+    test_distance_matrix()
+    test_batch_requests()
+    test_workflow_registry()
+    test_driver_indexes()
+    test_concurrent_requests()
+    test_shared_graph()
+    test_map_io()
+    test_traffic_updates()
+    test_mst_cache()
+    test_metrics()
+    test_snapshot_restore()
+    test_driver_feed()
+    test_map_tiles()
+    test_single_flight()
+    test_region_shards()
@@ -0,0 +1,61 @@
+"""
+Ride workflow plans for RideX
+
+Workflow dependency graphs are constant, so each one is validated and
+topologically sorted once when registered; ride requests only look the
+resulting plan up.
+"""
+import threading
+from typing import List, Dict, Tuple, Optional
+
+from graph_engine import InProcessGraphAlgorithms
+from metrics import METRICS
+
+DEFAULT_WORKFLOW = 'default'
+
+
+class WorkflowRegistry:
+    """Named workflows (e.g. one per car type), each compiled into an execution plan"""
+
+    def __init__(self):
+        self._plans: Dict[str, Tuple[str, ...]] = {}
+        self._dependencies: Dict[str, Dict[str, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def compile(dependencies: Dict[str, List[str]]) -> Tuple[str, ...]:
+        """Execution order for a dependency graph; raises ValueError on unknown steps or cycles"""
+        for task, prereqs in dependencies.items():
+            unknown = [prereq for prereq in prereqs if prereq not in dependencies]
+            if unknown:
+                raise ValueError(f"Workflow step '{task}' depends on unknown steps: {unknown}")
+        order = InProcessGraphAlgorithms.topological_sort(dependencies)
+        if len(order) != len(dependencies):
+            raise ValueError("Workflow dependencies contain a cycle")
+        return tuple(order)
+
+    def register(self, name: str, dependencies: Dict[str, List[str]]) -> Tuple[str, ...]:
+        """Compile and store a workflow under name, replacing any previous one"""
+        with METRICS.timer('workflow.compile_ms'):
+            plan = self.compile(dependencies)
+        with self._lock:
+            self._dependencies[name] = {task: list(prereqs) for task, prereqs in dependencies.items()}
+            self._plans[name] = plan
+        return plan
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._plans
+
+    def names(self) -> List[str]:
+        return sorted(self._plans)
+
+    def plan(self, name: Optional[str] = None) -> Tuple[str, ...]:
+        """Execution plan for name, falling back to the default workflow"""
+        plan = self._plans.get(name) if name is not None else None
+        return plan if plan is not None else self._plans[DEFAULT_WORKFLOW]
+
+    def dependencies(self, name: Optional[str] = None) -> Dict[str, List[str]]:
+        """Dependency graph the plan for name was compiled from"""
+        if name is None or name not in self._dependencies:
+            name = DEFAULT_WORKFLOW
+        return self._dependencies[name]